@@ -0,0 +1,76 @@
+"""
+Async JSON endpoints next to the DRF ones.
+
+DRF (3.16) has no async views, and under ASGI Django runs every sync view in
+one thread per worker process. The hot read endpoints therefore also have
+async implementations (see ``settings.ASYNC_VIEWS``), written as plain Django
+async views that reuse the DRF pieces that don't block: the authenticators
+from ``DEFAULT_AUTHENTICATION_CLASSES``, the serializers and the cursor
+paginator.
+
+``async_api_view`` wraps such a view: it authenticates the request the way
+DRF would (JWT, then session) and requires an authenticated user, like
+``IsAuthenticated``. The view gets a DRF ``Request`` (for ``query_params``
+and ``user``) and returns a ``JsonResponse``; DRF's serializers already turn
+decimals and dates into JSON strings.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def _error(exc, authenticators):
+    # the body DRF's exception handler would send
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = JsonResponse(data, status=exc.status_code, safe=False)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED and authenticators:
+        header = authenticators[0].authenticate_header(None)
+        if header:
+            response['WWW-Authenticate'] = header
+    return response
+
+
+def _authenticate(request, authenticators):
+    drf_request = Request(request, authenticators=authenticators)
+    drf_request.user  # runs the authenticators (a cached user lookup for JWT)
+    return drf_request
+
+
+def async_api_view(view=None, *, authentication_classes=None):
+    """
+    Use as ``@async_api_view``, or as ``@async_api_view(authentication_classes=...)``
+    in place of DRF's ``@authentication_classes``.
+    """
+    if view is None:
+        return lambda view: async_api_view(view, authentication_classes=authentication_classes)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'},
+                                status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        authenticators = [auth() for auth in authentication_classes or api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        try:
+            drf_request = await sync_to_async(_authenticate)(request, authenticators)
+            if not drf_request.user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+        except exceptions.APIException as exc:
+            return _error(exc, authenticators)
+        return await view(drf_request, *args, **kwargs)
+    return wrapper
+
+
+async def apaginate(paginator, queryset, request, serializer_class):
+    """
+    Serialize one page of ``queryset`` and return the paginated payload.
+    Paginating evaluates the queryset, which goes through ``sync_to_async``
+    like every query of the async ORM; serializing then only touches the
+    fetched (and prefetched) rows.
+    """
+    page = await sync_to_async(paginator.paginate_queryset)(queryset, request)
+    data = serializer_class(page, many=True, context={'request': request}).data
+    return paginator.get_paginated_response(data).data
@@ -0,0 +1,13 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+app = Celery("config")
+
+# read every CELERY_* setting from config/settings.py
+app.config_from_object("django.conf:settings", namespace="CELERY")
+
+# load tasks.py from every installed app
+app.autodiscover_tasks()
@@ -0,0 +1,86 @@
+"""
+Conditional GET support.
+
+``conditional_get(etag_func)`` answers ``If-None-Match`` with a 304 when
+``etag_func(request, *args, **kwargs)`` matches, without running the view.
+The function should be cheap: the catalog views derive their ETag from the
+tag of the cached entry they would serve (``products.cache.get_entry_etag``),
+the cart API from the raw cart lines. When it returns None (nothing cached
+yet) the view runs, and the ETag is computed again afterwards so the client
+can revalidate next time.
+
+Works on function views and, through ``method_decorator``, on DRF class
+views. On DRF views it runs after authentication and permission checks. On
+an async view, ``etag_func`` must be a coroutine function too.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.cache import get_conditional_response
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def page_etag(request, entry_etag):
+    """ETag of an HTML page rendered from a cached entry, for this visitor (CSRF token, login)."""
+    if entry_etag is None:
+        return None
+    # CsrfViewMiddleware keeps the CSRF secret here, including one generated
+    # while rendering this very response
+    return make_etag(entry_etag, request.user.pk, request.META.get('CSRF_COOKIE', ''))
+
+
+async def apage_etag(request, entry_etag):
+    if entry_etag is None:
+        return None
+    user = await request.auser()
+    return make_etag(entry_etag, user.pk, request.META.get('CSRF_COOKIE', ''))
+
+
+def _set_etag(response, etag):
+    # a 304 repeats the ETag the 200 would have had
+    if response.status_code in (200, 304) and etag is not None:
+        response.headers.setdefault('ETag', etag)
+    return response
+
+
+def conditional_get(etag_func):
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+
+                etag = await etag_func(request, *args, **kwargs)
+                if etag is not None:
+                    not_modified = get_conditional_response(request, etag=etag)
+                    if not_modified is not None:
+                        return _set_etag(not_modified, etag)
+
+                response = await view(request, *args, **kwargs)
+                if response.status_code == 200 and etag is None:
+                    etag = await etag_func(request, *args, **kwargs)
+                return _set_etag(response, etag)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            etag = etag_func(request, *args, **kwargs)
+            if etag is not None:
+                not_modified = get_conditional_response(request, etag=etag)
+                if not_modified is not None:
+                    return _set_etag(not_modified, etag)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and etag is None:
+                etag = etag_func(request, *args, **kwargs)
+            return _set_etag(response, etag)
+        return wrapper
+    return decorator
@@ -0,0 +1,153 @@
+"""
+Read replicas.
+
+With replica aliases configured (``replica_1``, ``replica_2``, ... see
+``DB_REPLICA_HOSTS`` in settings), ``PrimaryReplicaRouter`` sends reads of the
+models in ``settings.DB_REPLICA_READ_MODELS`` (the catalog and the order
+history) to a random replica. Everything else, and every write, goes to the
+primary (``default``).
+
+A read stays on the primary when
+
+* it happens outside a request (Celery tasks, commands): a task often reads
+  what the request that queued it has just written;
+* it runs inside a transaction on the primary (checkout, stock reservation);
+* the request is a write (POST, PUT, ...) or has written to the database;
+* the user wrote during the last ``settings.DB_PRIMARY_PIN_SECONDS``: after
+  adding to the cart or checking out they must not see a stale cart or miss
+  their new order because a replica lags behind;
+* it runs under ``read_from_primary()``, like the catalog cache builds right
+  after a catalog change: an entry built from a lagging replica would be
+  cached under the new catalog version (see ``products.cache``).
+
+``ReplicaRoutingMiddleware`` sets up the per-request state and pins the user
+after a write.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_request_state = ContextVar('db_router_request_state', default=None)
+_primary_only = ContextVar('db_router_primary_only', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+@contextmanager
+def read_from_primary():
+    """Send every read in the block to the primary."""
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def pin_key(user_id):
+    return f'db:pin-primary:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Send the reads of ``user_id``'s requests to the primary for the next few seconds."""
+    cache.set(pin_key(user_id), 1, settings.DB_PRIMARY_PIN_SECONDS)
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)  # DRF sets this too once it has authenticated
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+class _RequestState:
+    def __init__(self, request):
+        self.request = request
+        self.wrote = False
+        self._pinned_user = None  # (user id, pinned) of the last lookup
+
+    def must_read_primary(self):
+        if self.wrote or self.request.method not in SAFE_METHODS:
+            return True
+        user_id = _user_id(self.request)
+        if user_id is None:
+            return False
+        # one cache lookup per request (and user), not one per query
+        if self._pinned_user is None or self._pinned_user[0] != user_id:
+            self._pinned_user = (user_id, cache.get(pin_key(user_id)) is not None)
+        return self._pinned_user[1]
+
+
+class PrimaryReplicaRouter:
+    def _reads_from_replica(self, model):
+        label = model._meta.label
+        return label in settings.DB_REPLICA_READ_MODELS or model._meta.app_label in settings.DB_REPLICA_READ_MODELS
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects come from where the instance came from
+            return instance._state.db
+        state = _request_state.get()
+        if state is None or _primary_only.get() or not self._reads_from_replica(model):
+            return DEFAULT_DB_ALIAS
+        replicas = replica_aliases()
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block or state.must_read_primary():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, state):
+        if state.wrote or state.request.method not in SAFE_METHODS:
+            user_id = _user_id(state.request)
+            if user_id is not None:
+                pin_to_primary(user_id)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+            self._finish(state)
+        finally:
+            _request_state.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        state = _RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+            await sync_to_async(self._finish)(state)
+        finally:
+            _request_state.reset(token)
+        return response
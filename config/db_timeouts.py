@@ -0,0 +1,122 @@
+"""
+Statement timeouts per endpoint.
+
+Every connection starts with the ``statement_timeout`` of its process role
+(``settings.DB_STATEMENT_TIMEOUT``), so a runaway query can't hold a web
+worker forever. ``StatementTimeoutMiddleware`` tightens it for the views
+listed in ``settings.DB_VIEW_STATEMENT_TIMEOUTS`` (by URL name, e.g.
+``'orders:cart-detail-api'``) and puts it back after the response, before
+the connection returns to the pool. The timeout is only set right before
+the first query the view sends to a connection, so a response served from
+the cache (or a 304) costs no queries at all.
+
+A query cancelled by the timeout, or a request that found no free pooled
+connection in time, is answered with a 503 and ``Retry-After`` instead of a
+500: the request is fine, the database is just too busy right now.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.http import HttpResponse, JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    from psycopg_pool import PoolTimeout
+except ImportError:  # psycopg2, or no pool installed
+    PoolTimeout = None
+
+QUERY_CANCELED = '57014'  # SQLSTATE of a statement cancelled by statement_timeout
+RETRY_AFTER = 5  # seconds
+
+
+def _set_statement_timeout(milliseconds, using=connection):
+    with using.cursor() as cursor:
+        cursor.execute("SELECT set_config('statement_timeout', %s, false)", [f'{milliseconds}ms'])
+
+
+def _reset_statement_timeout(using=connection):
+    with using.cursor() as cursor:
+        # back to the value the connection was opened with
+        cursor.execute('RESET statement_timeout')
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    """Run the block with another statement timeout (0 disables it), e.g. in a long command."""
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    _set_statement_timeout(milliseconds)
+    try:
+        yield
+    finally:
+        _reset_statement_timeout()
+
+
+def is_database_overloaded(exc):
+    """True for a query cancelled by statement_timeout and for a pool that had no connection to give."""
+    if not isinstance(exc, OperationalError):
+        return False
+    cause = exc.__cause__
+    # psycopg 3 errors have the SQLSTATE in ``sqlstate``, psycopg2's in ``pgcode``
+    if (getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)) == QUERY_CANCELED:
+        return True
+    return PoolTimeout is not None and isinstance(cause, PoolTimeout)
+
+
+class _LazyStatementTimeout:
+    """Execute wrapper that sets the statement timeout before the first query on its connection."""
+
+    def __init__(self, connection, milliseconds):
+        self.connection = connection
+        self.milliseconds = milliseconds
+        self.is_set = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.is_set:
+            # first, so the set_config() below passes straight through
+            self.is_set = True
+            _set_statement_timeout(self.milliseconds, using=self.connection)
+        return execute(sql, params, many, context)
+
+    def remove(self):
+        self.connection.execute_wrappers.remove(self)
+        if not self.is_set:
+            return
+        try:
+            if self.connection.connection is not None:
+                _reset_statement_timeout(using=self.connection)
+        except DatabaseError:
+            # don't hand a connection with the wrong timeout back to the pool
+            self.connection.close()
+
+
+class StatementTimeoutMiddleware(MiddlewareMixin):
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timeout = settings.DB_VIEW_STATEMENT_TIMEOUTS.get(request.resolver_match.view_name)
+        if not timeout:
+            return
+        # every database the view may read from, the replicas included
+        request._statement_timeouts = []
+        for alias_connection in connections.all():
+            if alias_connection.vendor == 'postgresql':
+                wrapper = _LazyStatementTimeout(alias_connection, timeout)
+                alias_connection.execute_wrappers.append(wrapper)
+                request._statement_timeouts.append(wrapper)
+
+    def process_response(self, request, response):
+        for wrapper in getattr(request, '_statement_timeouts', ()):
+            wrapper.remove()
+        return response
+
+    def process_exception(self, request, exception):
+        if not is_database_overloaded(exception):
+            return None
+        message = 'The service is busy, please try again shortly.'
+        if '/api/' in request.path:
+            response = JsonResponse({'error': message}, status=503)
+        else:
+            response = HttpResponse(message, status=503, content_type='text/plain')
+        response['Retry-After'] = str(RETRY_AFTER)
+        return response
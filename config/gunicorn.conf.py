@@ -0,0 +1,23 @@
+# Gunicorn settings for the WSGI (sync) serving mode:
+#
+#     gunicorn -c config/gunicorn.conf.py config.wsgi
+#
+# Each worker process serves GUNICORN_THREADS requests at a time, so a request
+# waiting on Postgres or Redis doesn't hold up the others. The ASGI mode
+# (uvicorn, DJANGO_ASYNC_VIEWS=True) is described in the README.
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_DB_ROLE', 'web')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+# every thread may hold a pooled connection: keep this <= DB_POOL_MAX_SIZE
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# recycle workers now and then so a slow leak can't grow forever
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+accesslog = '-'
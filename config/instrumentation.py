@@ -0,0 +1,303 @@
+"""
+Per-request performance instrumentation.
+
+``RequestMetricsMiddleware`` (outermost in ``MIDDLEWARE``) measures every
+request: wall time, SQL queries and their time (an execute wrapper installed
+on every new database connection), catalog cache hits and misses
+(``products.cache``) and template render time (the ``DjangoTemplates``
+backend below). The numbers go out in a ``Server-Timing`` header, readable
+in the browser's network panel::
+
+    Server-Timing: app;dur=12.4, db;dur=3.1;desc="4 queries", tpl;dur=6.0, cache;desc="hits=1 misses=0"
+
+and into histograms per view name, served in the Prometheus text format at
+``/metrics``. Each process keeps its own histograms and copies them to the
+cache every ``METRICS_FLUSH_INTERVAL`` seconds; ``/metrics`` adds up the
+copies of all processes, so it doesn't matter which worker answers the
+scrape. Each request pays for two ``perf_counter`` calls per query and
+template render and a few counter updates under a lock; once per interval,
+the request that finds a flush due also pays for one or two cache writes.
+"""
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+PROCESSES_KEY = 'metrics:processes'
+# a process that stopped flushing this long ago is gone
+PROCESS_TIMEOUT = 300
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'sql_time', 'cache_hits', 'cache_misses', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+
+
+def record_cache_lookup(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def _time_sql(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def _install_sql_timer(sender, connection, **kwargs):
+    if _time_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_sql)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock Django template backend, timing every top-level render."""
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # per bucket, not cumulative
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Registry:
+    """Histograms and counters of this process, keyed by ``(metric name, label items)``."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def record(self, view, method, duration, metrics):
+        labels = (('view', view), ('method', method))
+        view_label = (('view', view),)
+        with self.lock:
+            self.observe('http_request_duration_seconds', labels, duration)
+            self.observe('db_queries_per_request', view_label, metrics.queries, QUERY_COUNT_BUCKETS)
+            self.observe('db_time_per_request_seconds', view_label, metrics.sql_time)
+            if metrics.template_time:
+                self.observe('template_render_seconds', view_label, metrics.template_time)
+            if metrics.cache_hits:
+                self.increment('catalog_cache_requests_total', view_label + (('result', 'hit'),), metrics.cache_hits)
+            if metrics.cache_misses:
+                self.increment('catalog_cache_requests_total', view_label + (('result', 'miss'),), metrics.cache_misses)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'histograms': {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self.histograms.items()},
+                'counters': dict(self.counters),
+            }
+
+    def flush_due(self):
+        return time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL
+
+    def flush(self):
+        """Copy this process's metrics to the cache, where ``/metrics`` collects them."""
+        self.last_flush = time.monotonic()
+        # looked up every time: workers are forked
+        process_key = f'metrics:process:{socket.gethostname()}:{os.getpid()}'
+        cache.set(process_key, self.snapshot(), PROCESS_TIMEOUT)
+        processes = cache.get(PROCESSES_KEY) or {}
+        now = time.time()
+        if process_key not in processes or now - processes[process_key] > PROCESS_TIMEOUT / 2:
+            processes = {key: seen for key, seen in processes.items() if now - seen < PROCESS_TIMEOUT}
+            processes[process_key] = now
+            cache.set(PROCESSES_KEY, processes, None)
+
+
+registry = Registry()
+
+
+def _server_timing(duration, metrics):
+    parts = [
+        f'app;dur={duration * 1000:.1f}',
+        f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.queries} queries"',
+    ]
+    if metrics.template_time:
+        parts.append(f'tpl;dur={metrics.template_time * 1000:.1f}')
+    if metrics.cache_hits or metrics.cache_misses:
+        parts.append(f'cache;desc="hits={metrics.cache_hits} misses={metrics.cache_misses}"')
+    return ', '.join(parts)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, request, response, started, metrics):
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        # the view name, never the path, keeps the number of series bounded
+        view = match.view_name if match else 'unresolved'
+        registry.record(view, request.method, duration, metrics)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = _server_timing(duration, metrics)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, started, metrics)
+        if registry.flush_due():
+            registry.flush()
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, started, metrics)
+        if registry.flush_due():
+            await sync_to_async(registry.flush)()
+        return response
+
+
+def _collect():
+    """Merge the latest snapshots of all live processes (this one included)."""
+    registry.flush()
+    process_keys = list((cache.get(PROCESSES_KEY) or {}).keys())
+    histograms, counters = {}, {}
+    for snapshot in cache.get_many(process_keys).values():
+        for key, (buckets, counts, total, count) in snapshot['histograms'].items():
+            histogram = Histogram(buckets)
+            histogram.counts, histogram.sum, histogram.count = counts, total, count
+            if key in histograms:
+                histograms[key].merge(histogram)
+            else:
+                histograms[key] = histogram
+        for key, value in snapshot['counters'].items():
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+def render_prometheus(histograms, counters):
+    lines = []
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram.count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {name} counter')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; needs ``Authorization: Bearer <METRICS_TOKEN>``, or DEBUG without a token."""
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            raise Http404
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(render_prometheus(*_collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
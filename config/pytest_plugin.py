@@ -0,0 +1,57 @@
+"""
+pytest plugin for the query analysis in ``config/query_analysis.py``.
+
+    pytest --query-analysis
+
+runs every request made through the test client with ``QUERY_ANALYSIS =
+'raise'``, so a test fails when a request repeats a query
+``QUERY_REPEAT_THRESHOLD`` times (an N+1) or runs more queries than its
+view's ``@query_budget``. Without the option, a test turns it on for itself
+with the ``query_analysis`` fixture. Code outside views can be checked with
+the ``query_analyzer`` fixture. Loaded by the project's ``conftest.py``;
+needs pytest-django.
+"""
+import pytest
+
+from .query_analysis import QueryAnalyzer
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('query analysis')
+    group.addoption('--query-analysis', action='store_true',
+                    help='Fail tests whose requests repeat queries or exceed their view query budget.')
+    group.addoption('--query-repeat-threshold', type=int, default=None,
+                    help='Override QUERY_REPEAT_THRESHOLD.')
+
+
+class QueryAnalysisPlugin:
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    @pytest.fixture(autouse=True)
+    def _raise_on_query_problems(self, query_analysis, settings):
+        if self.threshold:
+            settings.QUERY_REPEAT_THRESHOLD = self.threshold
+
+
+def pytest_configure(config):
+    if config.getoption('query_analysis'):
+        config.pluginmanager.register(QueryAnalysisPlugin(config.getoption('query_repeat_threshold')),
+                                      'query-analysis')
+
+
+@pytest.fixture
+def query_analysis(settings):
+    """Make the requests of the test raise ``QueryAnalysisError`` on repeated queries and blown budgets."""
+    # before the test client loads the middleware, which removes itself when 'off'
+    settings.QUERY_ANALYSIS = 'raise'
+
+
+@pytest.fixture
+def query_analyzer(db):
+    """Record the queries of the test and fail it on repeated ones; ``problems(budget)`` checks a budget too."""
+    with QueryAnalyzer() as analyzer:
+        yield analyzer
+    problems = analyzer.problems()
+    if problems:
+        pytest.fail('Repeated queries:\n  ' + '\n  '.join(problems))
@@ -0,0 +1,161 @@
+"""
+N+1 and duplicate query detection, and per-view query budgets.
+
+``QueryAnalyzer`` records the SQL run inside it, grouped by fingerprint (the
+statement with its literals, placeholders and ``IN`` lists normalised, so
+``WHERE id = 1`` and ``WHERE id = 2`` are the same query), along with the
+code that ran it: the first stack frame in this project and, for queries
+made while rendering, the template line. A fingerprint seen
+``QUERY_REPEAT_THRESHOLD`` times or more is reported; that is the shape of
+an N+1 (one query per card, per serializer row, per admin row).
+
+Views declare how many queries a request may take with ``@query_budget(n)``
+(outermost decorator on function views, or on the class of a class view).
+
+``QueryAnalysisMiddleware`` analyses every request, depending on
+``settings.QUERY_ANALYSIS``:
+
+* ``'off'``: the middleware removes itself (production);
+* ``'log'``: problems are logged as warnings (development and staging);
+* ``'raise'``: problems raise ``QueryAnalysisError`` (tests, see
+  ``config/pytest_plugin.py``).
+"""
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def _call_site():
+    """``'path:line in function'`` of the project code that ran the query, plus the template line if any."""
+    project = str(settings.BASE_DIR)
+    template_site = None
+    # start above the cursor, past every execute wrapper (this one, config.instrumentation's)
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_name != '_execute_with_wrappers':
+        frame = frame.f_back
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        # type(), not isinstance(): that would evaluate lazy objects (request.user) and query again
+        if template_site is None and issubclass(type(node), Node) and getattr(node, 'origin', None) and node.token:
+            template_site = f'{node.origin.name}:{node.token.lineno}'
+        filename = frame.f_code.co_filename
+        if filename.startswith(project) and '/site-packages/' not in filename:
+            site = f'{Path(filename).relative_to(project)}:{frame.f_lineno} in {frame.f_code.co_name}'
+            return f'{site} (template {template_site})' if template_site else site
+        frame = frame.f_back
+    return template_site or 'unknown'
+
+
+@dataclass
+class _Fingerprint:
+    count: int = 0
+    call_sites: Counter = field(default_factory=Counter)
+
+
+class QueryAnalysisError(AssertionError):
+    pass
+
+
+class QueryAnalyzer:
+    """Context manager recording every query on every database alias run inside it."""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        self.fingerprints = {}
+        self.total = 0
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in settings.DATABASES:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        entry = self.fingerprints.get(key)
+        if entry is None:
+            entry = self.fingerprints[key] = _Fingerprint()
+        entry.count += 1
+        entry.call_sites[_call_site()] += 1
+        self.total += 1
+        return execute(sql, params, many, context)
+
+    def problems(self, budget=None):
+        """Human-readable descriptions of the repeated queries and of a blown budget."""
+        found = []
+        if budget is not None and self.total > budget:
+            found.append(f'{self.total} queries, over the budget of {budget}')
+        for key, entry in sorted(self.fingerprints.items(), key=lambda item: -item[1].count):
+            if entry.count < self.threshold:
+                continue
+            sites = ', '.join(f'{site} (x{count})' for site, count in entry.call_sites.most_common(3))
+            found.append(f'{entry.count} x {key[:300]}\n    from {sites}')
+        return found
+
+
+def query_budget(max_queries):
+    """Declare the most queries a request to this view may run."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def view_query_budget(view_func):
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        # class views: as_view() keeps the class on the function
+        budget = getattr(getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None),
+                         'query_budget', None)
+    return budget
+
+
+# sync only on purpose: under ASGI Django runs it in the thread that runs the
+# ORM calls of async views, whose connections are the ones it has to wrap
+class QueryAnalysisMiddleware:
+    def __init__(self, get_response):
+        if settings.QUERY_ANALYSIS == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = view_query_budget(view_func)
+
+    def __call__(self, request):
+        with QueryAnalyzer() as analyzer:
+            response = self.get_response(request)
+        problems = analyzer.problems(getattr(request, '_query_budget', None))
+        if problems:
+            message = f'{request.method} {request.path}: ' + '\n  '.join(problems)
+            if settings.QUERY_ANALYSIS == 'raise':
+                raise QueryAnalysisError(message)
+            logger.warning(message)
+        return response
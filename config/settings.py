@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 
     # Third-party apps
     'rest_framework',
@@ -52,7 +53,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost, so its timings cover the other middleware too
+    "config.instrumentation.RequestMetricsMiddleware",
+    "config.query_analysis.QueryAnalysisMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "config.db_timeouts.StatementTimeoutMiddleware",
+    "config.db_router.ReplicaRoutingMiddleware",
+    "config.throttling.RateLimitHeadersMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -65,7 +72,8 @@ ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # the stock backend plus render timing, see config/instrumentation.py
+        "BACKEND": "config.instrumentation.DjangoTemplates",
         "DIRS": [os.path.join(BASE_DIR, 'templates')],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -83,10 +91,43 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "config.wsgi.application"
 
+# Request instrumentation, see config/instrumentation.py
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'True') == 'True'  # send the Server-Timing header
+# Bearer token Prometheus sends to /metrics; without one /metrics only answers with DEBUG on
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 10))  # seconds
+
+# N+1 detection and view query budgets, see config/query_analysis.py
+# 'off', 'log' (warnings, for development and staging) or 'raise' (tests)
+QUERY_ANALYSIS = os.environ.get('QUERY_ANALYSIS', 'log' if DEBUG else 'off')
+# how often one query may repeat in a request before it is reported
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+
+# Serve the hot read endpoints (catalog pages, product list API, cart and
+# order history APIs) from async views. Only worth it under ASGI (uvicorn),
+# see config/async_api.py.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', 'False') == 'True'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are pooled (psycopg 3's pool) and checked before reuse. Pool
+# sizes and the statement timeout depend on what kind of process this is:
+# 'web' (set by config/wsgi.py, config/asgi.py and config/gunicorn.conf.py),
+# 'worker' (Celery, set in docker-compose.yml) or 'command' (manage.py,
+# where long imports, exports and migrations must not time out).
+DB_ROLE = os.environ.get('DJANGO_DB_ROLE', 'command')
+DB_ROLE_DEFAULTS = {
+    # role: (pool min size, pool max size, statement timeout in ms, 0 = none)
+    'web': (2, 8, 15_000),
+    'worker': (1, 2, 300_000),
+    'command': (1, 2, 0),
+}
+_pool_min_size, _pool_max_size, _statement_timeout = DB_ROLE_DEFAULTS[DB_ROLE]
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', _statement_timeout))
+DB_POOL = os.environ.get('DB_POOL', 'True') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -95,8 +136,115 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db', # This is the service name from docker-compose.yml
         'PORT': '5432',
+        # without the pool, keep connections open between requests instead
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': 5,
+            'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}',
+        },
+    }
+}
+
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', _pool_min_size)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', _pool_max_size)),
+        # seconds to wait for a free connection before giving up
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    }
+
+# Read replicas, see config/db_router.py
+# Comma-separated hosts of Postgres streaming replicas; each becomes an alias
+# replica_1, replica_2, ... with the primary's other settings.
+DB_REPLICA_HOSTS = [host for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+for _number, _host in enumerate(DB_REPLICA_HOSTS, start=1):
+    DATABASES[f'replica_{_number}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'OPTIONS': {**DATABASES['default']['OPTIONS']},
+        # tests read the primary's test database through the replica alias
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+# apps and models whose reads may go to a replica (browsing tolerates lag)
+DB_REPLICA_READ_MODELS = ['products', 'orders.Order', 'orders.OrderItem']
+# how long reads stay on the primary after a user wrote (seconds)
+DB_PRIMARY_PIN_SECONDS = int(os.environ.get('DB_PRIMARY_PIN_SECONDS', 10))
+
+# Tighter statement timeouts (ms) for single endpoints, by URL name, see
+# config/db_timeouts.py. A request that hits its timeout gets a 503.
+DB_VIEW_STATEMENT_TIMEOUTS = {
+    'product-list-api': 3_000,
+    'product-search-api': 3_000,
+    'category-list-api': 3_000,
+    'category-product-list-api': 3_000,
+    'products:product_list': 3_000,
+    'products:product_detail': 3_000,
+    'orders:cart-detail-api': 3_000,
+}
+
+# Cache
+# Redis (the `redis` service from docker-compose) when REDIS_URL is set, an
+# in-process cache otherwise (local development and tests)
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+# How long a catalog cache entry lives (seconds). Entries are invalidated on
+# every catalog change anyway, this only bounds how stale stock counts can get.
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+# products per page of the HTML catalog; every page is a cache entry of its own
+CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', 24))
+
+# Product search, see products/search.py
+# Empty means Postgres full-text search on PostgreSQL and an in-process
+# inverted index elsewhere.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', '')
+
+# Cart storage, see orders/cart_store.py
+# Active carts live in Redis when it's available and are written to the
+# database at checkout (or by `manage.py flush_expiring_carts`).
+
+CART_STORE_BACKEND = os.environ.get(
+    'CART_STORE_BACKEND',
+    'orders.cart_store.RedisCartStore' if REDIS_URL else 'orders.cart_store.DatabaseCartStore'
+)
+CART_TTL = int(os.environ.get('CART_TTL', 60 * 60 * 24 * 7))  # seconds
+
+# Idempotency-Key handling of the checkout and cart APIs, see orders/idempotency.py
+IDEMPOTENCY_STORE = os.environ.get('IDEMPOTENCY_STORE', 'cache' if REDIS_URL else 'db')  # 'cache' or 'db'
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 60 * 60 * 24))  # seconds
+# how long a duplicate waits for the first request to finish (seconds)
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 3))
+
+# Token-bucket rate limits of the expensive endpoints, see config/throttling.py
+# '<n>/<second|minute|hour|day>': a burst of n requests, then n per period;
+# an empty value turns the limit off
+RATE_LIMITS = {
+    'register': os.environ.get('RATE_LIMIT_REGISTER', '10/hour'),  # per IP address
+    'token': os.environ.get('RATE_LIMIT_TOKEN', '20/minute'),  # per IP address
+    'cart': os.environ.get('RATE_LIMIT_CART', '120/minute'),  # per user
+    'checkout': os.environ.get('RATE_LIMIT_CHECKOUT', '10/minute'),  # per user
 }
+RATE_LIMIT_STORE = os.environ.get(
+    'RATE_LIMIT_STORE',
+    'config.throttling.RedisBucketStore' if REDIS_URL else 'config.throttling.InMemoryBucketStore'
+)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,15 +282,24 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Resolve JWT users from a local LRU and the shared cache instead of a query
+# per API call, see users/authentication.py
+AUTH_USER_CACHE = os.environ.get('AUTH_USER_CACHE', 'True') == 'True'
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 60))  # shared cache, seconds
+# how long other processes may see a user as they were before a change
+AUTH_USER_LOCAL_CACHE_TIMEOUT = float(os.environ.get('AUTH_USER_LOCAL_CACHE_TIMEOUT', 5))
+AUTH_USER_LOCAL_CACHE_SIZE = int(os.environ.get('AUTH_USER_LOCAL_CACHE_SIZE', 10000))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication' if AUTH_USER_CACHE
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'config.pagination.CreatedAtCursorPagination',
     'PAGE_SIZE': 10,
 }
 
@@ -162,6 +319,37 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_TASK_ROUTES = {
+    # checkouts get their own queue (and workers), so a backlog of periodic
+    # jobs never delays an order
+    'orders.place_queued_order': {'queue': 'checkout'},
+}
+# run tasks inline instead of sending them to the broker (tests, local dev)
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-stock-reservations': {
+        'task': 'products.release_expired_reservations',
+        'schedule': 60.0,
+    },
+    'sync-sharded-inventory': {
+        'task': 'products.sync_sharded_inventory',
+        'schedule': 60.0,
+    },
+    'purge-idempotency-records': {
+        'task': 'orders.purge_idempotency_records',
+        'schedule': 60.0 * 60,
+    },
+    # more often than the window, so no cart expires between two runs
+    'flush-expiring-carts': {
+        'task': 'orders.flush_expiring_carts',
+        'schedule': 60.0 * 15,
+        'kwargs': {'within': 60 * 60},
+    },
+}
+
+# How long stock stays held for a cart in checkout (seconds)
+STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 15 * 60))
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
@@ -171,3 +359,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Widths (px) of the resized JPEG/WebP copies made of every product image,
+# see products/images.py
+PRODUCT_IMAGE_WIDTHS = [200, 400, 800]
@@ -0,0 +1,62 @@
+"""A matching If-None-Match gets an empty 304, for the price of the ETag lookup only."""
+import pytest
+
+from orders.cart_store import get_cart_store
+from products.cache import bump_catalog_version
+
+
+@pytest.fixture
+def mug(make_product):
+    return make_product(name='Mug', slug='mug', featured_image=True)
+
+
+@pytest.mark.parametrize('url', ['/products/', '/products/mug/'])
+def test_catalog_page(client, mug, url, django_assert_num_queries):
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first['ETag']
+
+    # the cached entry's tag is all it takes
+    with django_assert_num_queries(0):
+        response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response['ETag'] == etag
+
+    bump_catalog_version()
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+def test_catalog_page_without_a_cached_entry_runs_the_view(client, mug):
+    etag = client.get('/products/')['ETag']
+    bump_catalog_version()
+
+    response = client.get('/products/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    # the tag of the entry the view just cached
+    assert response['ETag'] not in ('', etag)
+    assert client.get('/products/', headers={'If-None-Match': response['ETag']}).status_code == 304
+
+
+def test_cart(api_client, user, mug, make_product, settings, django_assert_num_queries):
+    settings.CART_STORE_BACKEND = 'orders.cart_store.DatabaseCartStore'
+    get_cart_store().add(user.pk, mug.pk, 1, mug.price)
+    first = api_client.get('/orders/api/cart/')
+    assert first.status_code == 200
+    etag = first['ETag']
+
+    # the cart lines, and nothing else
+    with django_assert_num_queries(1) as queries:
+        response = api_client.get('/orders/api/cart/', headers={'If-None-Match': etag})
+    assert 'orders_cartitem' in queries.captured_queries[0]['sql']
+    assert response.status_code == 304
+    assert response.content == b''
+
+    other = make_product()
+    get_cart_store().add(user.pk, other.pk, 1, other.price)
+    response = api_client.get('/orders/api/cart/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert len(response.data['items']) == 2
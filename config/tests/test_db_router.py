@@ -0,0 +1,95 @@
+"""Which database the reads of a request go to, with one replica configured."""
+import pytest
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.http import JsonResponse
+from django.urls import include, path
+from django.views.decorators.csrf import csrf_exempt
+
+from config import db_router
+from config.db_router import PrimaryReplicaRouter, read_from_primary
+from orders.models import Cart
+from products.cache import CHANGED_KEY, bump_catalog_version
+from products.models import Product
+
+
+@csrf_exempt
+def read_products(request):
+    """Where a product read goes, in the ways a view can read."""
+    if request.GET.get('write'):
+        Cart.objects.create(user=request.user)
+    if request.GET.get('atomic'):
+        with transaction.atomic():
+            return JsonResponse({'db': Product.objects.all().db})
+    if request.GET.get('primary'):
+        with read_from_primary():
+            return JsonResponse({'db': Product.objects.all().db})
+    return JsonResponse({'db': Product.objects.all().db, 'carts': Cart.objects.all().db})
+
+
+urlpatterns = [
+    path('read/', read_products),
+    path('', include('config.urls')),
+]
+
+pytestmark = pytest.mark.urls(__name__)
+
+
+@pytest.fixture
+def replica(transactional_db, monkeypatch):
+    """
+    A ``replica_1`` alias that shares the primary's connection, so it sees
+    the test's rows. Without the usual test transaction around the test:
+    reads in a transaction stay on the primary.
+    """
+    monkeypatch.setattr(db_router, 'replica_aliases', lambda: ['replica_1'])
+    connections['replica_1'] = connections['default']
+    yield 'replica_1'
+    del connections['replica_1']
+
+
+def _read(client, method='get', **params):
+    query = '&'.join(f'{name}=1' for name in params)
+    return getattr(client, method)(f'/read/?{query}').json()
+
+
+def test_safe_reads_of_replicated_models_go_to_the_replica(client, user, replica):
+    assert _read(client) == {'db': replica, 'carts': 'default'}
+    client.force_login(user)
+    assert _read(client)['db'] == replica
+
+
+def test_writes_and_transactions_stay_on_the_primary(client, user, replica):
+    client.force_login(user)
+    assert _read(client, method='post')['db'] == 'default'
+    assert _read(client, atomic=True)['db'] == 'default'
+
+
+def test_a_user_who_wrote_stays_on_the_primary(client, user, django_user_model, replica):
+    client.force_login(user)
+    assert _read(client, write=True)['db'] == 'default'
+    # pinned for the next DB_PRIMARY_PIN_SECONDS
+    assert _read(client)['db'] == 'default'
+
+    client.force_login(django_user_model.objects.create_user('bob', 'bob@example.com', 'pass-word-1'))
+    assert _read(client)['db'] == replica
+
+
+def test_read_from_primary_overrides_the_routing(client, replica):
+    assert _read(client, primary=True)['db'] == 'default'
+
+
+def test_reads_outside_a_request_stay_on_the_primary(replica):
+    assert PrimaryReplicaRouter().db_for_read(Product) == 'default'
+
+
+def test_catalog_cache_builds_read_the_replica_except_right_after_a_change(client, make_product, replica):
+    make_product(name='Mug', slug='mug')
+    # creating it bumped the catalog version
+    assert client.get('/products/mug/').context['product']._state.db == 'default'
+
+    cache.delete(CHANGED_KEY)  # DB_PRIMARY_PIN_SECONDS later
+    assert client.get('/products/').context['products'][0]._state.db == replica
+
+    bump_catalog_version()
+    assert client.get('/products/').context['products'][0]._state.db == 'default'
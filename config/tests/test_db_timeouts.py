@@ -0,0 +1,115 @@
+import pytest
+from django.db import OperationalError, connection
+from django.urls import path
+from psycopg import errors
+
+from config import db_timeouts
+from config.db_timeouts import RETRY_AFTER, is_database_overloaded
+
+
+def _raise_as_django_does(error):
+    # Django re-raises driver errors as its own, with the original as __cause__
+    try:
+        raise error
+    except Exception as exc:
+        raise OperationalError(*exc.args) from exc
+
+
+def query_cancelled_view(request):
+    _raise_as_django_does(errors.QueryCanceled('canceling statement due to statement timeout'))
+
+
+def connection_lost_view(request):
+    _raise_as_django_does(errors.AdminShutdown('terminating connection due to administrator command'))
+
+
+urlpatterns = [
+    path('api/slow/', query_cancelled_view),
+    path('slow/', query_cancelled_view),
+    path('broken/', connection_lost_view),
+]
+
+
+def _django_error(error):
+    try:
+        _raise_as_django_does(error)
+    except OperationalError as exc:
+        return exc
+
+
+def test_a_cancelled_query_means_overloaded():
+    assert is_database_overloaded(_django_error(errors.QueryCanceled('canceling statement')))
+    assert not is_database_overloaded(_django_error(errors.AdminShutdown('terminating connection')))
+    assert not is_database_overloaded(ValueError('not a database error'))
+
+
+def test_a_pool_timeout_means_overloaded():
+    pool = pytest.importorskip('psycopg_pool')
+    assert is_database_overloaded(_django_error(pool.PoolTimeout("couldn't get a connection after 5.00 sec")))
+
+
+@pytest.mark.urls(__name__)
+@pytest.mark.parametrize('url, content_type', [
+    ('/api/slow/', 'application/json'),
+    ('/slow/', 'text/plain'),
+])
+def test_a_cancelled_query_is_a_503(client, url, content_type):
+    response = client.get(url)
+
+    assert response.status_code == 503
+    assert response['Retry-After'] == str(RETRY_AFTER)
+    assert response['Content-Type'].startswith(content_type)
+
+
+@pytest.mark.urls(__name__)
+def test_other_database_errors_are_left_alone(client):
+    with pytest.raises(OperationalError):
+        client.get('/broken/')
+
+
+@pytest.fixture
+def postgres_timeouts(monkeypatch):
+    """The middleware as it runs on PostgreSQL, with the timeout statements swapped for plain SELECTs."""
+    monkeypatch.setattr(connection, 'vendor', 'postgresql')
+
+    def set_timeout(milliseconds, using):
+        with using.cursor() as cursor:
+            cursor.execute('SELECT %s AS statement_timeout', [milliseconds])
+
+    def reset_timeout(using):
+        with using.cursor() as cursor:
+            cursor.execute('SELECT NULL AS statement_timeout')
+
+    monkeypatch.setattr(db_timeouts, '_set_statement_timeout', set_timeout)
+    monkeypatch.setattr(db_timeouts, '_reset_statement_timeout', reset_timeout)
+
+
+@pytest.fixture
+def catalog(make_product):
+    # before postgres_timeouts, which would make the product signals write a tsvector
+    return make_product(featured_image=True)
+
+
+def test_the_timeout_is_only_set_for_views_that_query(client, catalog, postgres_timeouts, django_assert_num_queries):
+    # the products and their images, with the timeout set before and reset after
+    with django_assert_num_queries(4) as queries:
+        response = client.get('/products/')
+    assert response.status_code == 200
+    sql = [query['sql'] for query in queries.captured_queries]
+    assert sql[0] == 'SELECT 3000 AS statement_timeout'
+    assert sql[-1] == 'SELECT NULL AS statement_timeout'
+
+    # served from the catalog cache: nothing to time out, nothing sent
+    with django_assert_num_queries(0):
+        client.get('/products/')
+    with django_assert_num_queries(0):
+        response = client.get('/products/', headers={'If-None-Match': response['ETag']})
+    assert response.status_code == 304
+    assert not [wrapper for wrapper in connection.execute_wrappers
+                if isinstance(wrapper, db_timeouts._LazyStatementTimeout)]
+
+
+def test_other_views_keep_the_default_timeout(api_client, postgres_timeouts, django_assert_num_queries):
+    with django_assert_num_queries(1) as queries:
+        api_client.get('/orders/api/history/')
+    assert 'statement_timeout' not in queries.captured_queries[0]['sql']
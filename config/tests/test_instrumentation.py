@@ -0,0 +1,101 @@
+import re
+
+import pytest
+
+from config import instrumentation
+from config.instrumentation import QUERY_COUNT_BUCKETS, Registry, RequestMetrics, render_prometheus
+
+SERVER_TIMING = re.compile(
+    r'app;dur=(?P<app>\d+\.\d), db;dur=\d+\.\d;desc="(?P<queries>\d+) queries"'
+    r'(, tpl;dur=(?P<tpl>\d+\.\d))?(, cache;desc="hits=(?P<hits>\d+) misses=(?P<misses>\d+)")?$'
+)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh registry for the middleware and ``/metrics``, so earlier tests' requests don't show."""
+    registry = Registry()
+    monkeypatch.setattr(instrumentation, 'registry', registry)
+    return registry
+
+
+def test_server_timing(client, registry, make_product):
+    make_product(name='Mug', slug='mug')
+
+    miss = SERVER_TIMING.match(client.get('/products/')['Server-Timing'])
+    hit = SERVER_TIMING.match(client.get('/products/')['Server-Timing'])
+
+    assert miss and hit
+    assert miss['tpl'] is not None
+    assert (miss['hits'], miss['misses']) == ('0', '1')
+    assert int(miss['queries']) > 0
+    # the page is rendered from the cached catalog entry, without a query
+    assert (hit['hits'], hit['misses'], hit['queries']) == ('1', '0', '0')
+
+
+def test_server_timing_can_be_turned_off(client, db, registry, settings):
+    settings.SERVER_TIMING = False
+    assert 'Server-Timing' not in client.get('/products/')
+
+
+def test_render_prometheus():
+    registry = Registry()
+    for queries, hits in ((1, 1), (3, 0)):
+        metrics = RequestMetrics()
+        metrics.queries, metrics.sql_time, metrics.cache_hits = queries, 0.002, hits
+        registry.record('products:product_list', 'GET', 0.02, metrics)
+    snapshot = registry.snapshot()
+    histograms = {}
+    for key, (buckets, counts, total, count) in snapshot['histograms'].items():
+        histograms[key] = histogram = instrumentation.Histogram(buckets)
+        histogram.counts, histogram.sum, histogram.count = counts, total, count
+
+    lines = render_prometheus(histograms, snapshot['counters']).splitlines()
+
+    labels = 'view="products:product_list",method="GET"'
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.01"}} 0' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.025"}} 2' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f'http_request_duration_seconds_sum{{{labels}}} 0.04' in lines
+    assert f'http_request_duration_seconds_count{{{labels}}} 2' in lines
+    # the buckets are cumulative
+    assert [line.rsplit(' ', 1)[1] for line in lines if line.startswith('db_queries_per_request_bucket')] == [
+        str(sum(queries <= bound for queries in (1, 3))) for bound in QUERY_COUNT_BUCKETS
+    ] + ['2']
+    assert '# TYPE catalog_cache_requests_total counter' in lines
+    assert 'catalog_cache_requests_total{view="products:product_list",result="hit"} 1' in lines
+    # no template was rendered and nothing missed the cache
+    assert not [line for line in lines if line.startswith(('template_render_seconds', '# TYPE template'))]
+    assert not [line for line in lines if 'result="miss"' in line]
+
+
+def test_metrics_collects_the_requests(client, db, registry, settings):
+    settings.METRICS_TOKEN = 'secret'
+    client.get('/products/')
+    client.get('/products/')
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    lines = response.content.decode().splitlines()
+    assert 'http_request_duration_seconds_count{view="products:product_list",method="GET"} 2' in lines
+    assert 'catalog_cache_requests_total{view="products:product_list",result="hit"} 1' in lines
+    assert 'catalog_cache_requests_total{view="products:product_list",result="miss"} 1' in lines
+
+
+@pytest.mark.parametrize('token, debug, authorization, status', [
+    ('secret', False, None, 404),
+    ('secret', True, None, 404),
+    ('secret', False, 'Bearer wrong', 404),
+    ('secret', False, 'Bearer secret', 200),
+    ('', False, None, 404),
+    ('', True, None, 200),
+])
+def test_metrics_token_gate(client, registry, settings, token, debug, authorization, status):
+    settings.METRICS_TOKEN = token
+    settings.DEBUG = debug
+    headers = {'Authorization': authorization} if authorization else {}
+
+    assert client.get('/metrics', headers=headers).status_code == status
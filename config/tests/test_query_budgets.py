@@ -0,0 +1,104 @@
+"""Every view with a ``@query_budget`` stays within it, checked the way ``pytest --query-analysis`` does."""
+from decimal import Decimal
+
+import pytest
+from django.http import HttpResponse
+from django.urls import include, path, resolve
+
+from config.query_analysis import QueryAnalysisError, query_budget, view_query_budget
+from orders.cart_store import get_cart_store
+from orders.models import Order, OrderItem
+from orders.views import cart_detail_api_async, order_history_api_async
+from products.models import Category, Product
+from products.views import product_detail_async, product_list, product_list_api_async, product_list_async
+
+
+@query_budget(100)
+def one_query_per_product(request):
+    for product in Product.objects.all():
+        Product.objects.filter(pk=product.pk).exists()
+    return HttpResponse()
+
+
+# the async views are only routed with DJANGO_ASYNC_VIEWS=True
+urlpatterns = [
+    path('async/products/', product_list_async),
+    path('async/products/<slug:slug>/', product_detail_async),
+    path('async/api/', product_list_api_async),
+    path('async/cart/', cart_detail_api_async),
+    path('async/history/', order_history_api_async),
+    path('n-plus-one/', one_query_per_product),
+    path('', include('config.urls')),
+]
+
+pytestmark = [pytest.mark.urls(__name__), pytest.mark.usefixtures('query_analysis')]
+
+
+@pytest.fixture
+def store(user, make_product):
+    """A catalog with images, a cart of 5 lines and 5 past orders of 3 items, enough to show an N+1."""
+    category = Category.objects.create(name='Kitchen', slug='kitchen')
+    products = [make_product(category=category, featured_image=True, name=f'Mug {i}', slug=f'mug-{i}')
+                for i in range(10)]
+    get_cart_store().add_many(user.pk, [(product.pk, 1, product.price) for product in products[:5]])
+    for start in range(5):
+        order = Order.objects.create(user=user, status='COMPLETED')
+        items = [OrderItem(order=order, product=product, quantity=2, price=product.price)
+                 for product in products[start:start + 3]]
+        OrderItem.objects.bulk_create(items)
+        order.total_price = sum((item.quantity * item.price for item in items), Decimal('0.00'))
+        order.set_item_summary(items)
+        order.save()
+    return products
+
+
+BUDGETED_REQUESTS = [
+    # (view, method, url, authentication)
+    ('view_cart', 'get', '/orders/cart/', 'session'),
+    ('cart_detail_api', 'get', '/orders/api/cart/', 'jwt'),
+    ('cart_detail_api_async', 'get', '/async/cart/', 'jwt'),
+    ('add_to_cart_api', 'post', '/orders/api/cart/add/', 'jwt'),
+    ('order_history_api', 'get', '/orders/api/history/', 'jwt'),
+    ('order_history_api_async', 'get', '/async/history/', 'jwt'),
+    ('product_list', 'get', '/products/', None),
+    ('product_list_async', 'get', '/async/products/', None),
+    ('product_detail', 'get', '/products/mug-1/', None),
+    ('product_detail_async', 'get', '/async/products/mug-1/', None),
+    ('ProductListAPIView', 'get', '/api/', 'jwt'),
+    ('product_list_api_async', 'get', '/async/api/', 'jwt'),
+    ('ProductSearchAPIView', 'get', '/api/products/search/?q=mug', 'jwt'),
+]
+
+
+@pytest.mark.parametrize('view, method, url, authentication', BUDGETED_REQUESTS,
+                         ids=[request[0] for request in BUDGETED_REQUESTS])
+def test_view_stays_within_its_budget(client, api_client, user, store, settings, view, method, url,
+                                      authentication):
+    assert view_query_budget(resolve(url.split('?')[0]).func) is not None
+    if authentication == 'jwt':
+        client = api_client
+    elif authentication == 'session':
+        client.force_login(user)
+
+    if method == 'post':
+        # the most expensive way in: an Idempotency-Key kept in the database
+        settings.IDEMPOTENCY_STORE = 'db'
+        response = client.post(url, {'product_id': store[7].pk, 'quantity': 1}, content_type='application/json',
+                               headers={'Idempotency-Key': 'add-1'})
+    else:
+        response = client.get(url)
+
+    # QueryAnalysisError would have been raised out of the request
+    assert response.status_code in (200, 201)
+
+
+def test_a_view_over_its_budget_fails(client, store, monkeypatch):
+    monkeypatch.setattr(product_list, 'query_budget', 1)
+
+    with pytest.raises(QueryAnalysisError, match=r'GET /products/: \d+ queries, over the budget of 1'):
+        client.get('/products/')
+
+
+def test_an_n_plus_one_fails(client, store):
+    with pytest.raises(QueryAnalysisError, match=r'10 x SELECT .*\n\s+from config/tests/test_query_budgets.py'):
+        client.get('/n-plus-one/')
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+from config import throttling
+from config.throttling import InMemoryBucketStore, parse_rate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock for the bucket stores that only moves when told to."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(throttling, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_parse_rate():
+    assert parse_rate('10/minute') == (10, 60)
+    assert parse_rate('20/h') == (20, 60 * 60)
+
+
+def test_a_bucket_is_spent_then_refilled(clock):
+    store = InMemoryBucketStore()
+
+    results = [store.consume('client', 3, 1.0) for _ in range(4)]
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [result.remaining for result in results] == [2, 1, 0, 0]
+    assert results[-1].retry_after == pytest.approx(1.0)
+
+    clock.now += 1
+    assert store.consume('client', 3, 1.0).allowed
+
+
+def test_refilled_buckets_are_dropped(clock):
+    store = InMemoryBucketStore()
+    store.consume('fast', 10, 10.0)
+    store.consume('slow', 10, 0.01)
+    for i in range(1000):
+        store.consume(f'one-off-{i}', 10, 10.0)
+
+    clock.now += store.SWEEP_INTERVAL
+    store.consume('new', 10, 10.0)
+
+    # 'slow' needs 100s to take its token back
+    assert set(store._buckets) == {'slow', 'new'}
+    assert store.consume('slow', 10, 0.01).remaining == 8
+
+
+def test_a_throttled_request_gets_429_and_headers(api_client, settings, make_product):
+    settings.RATE_LIMIT_STORE = 'config.throttling.InMemoryBucketStore'
+    settings.RATE_LIMITS = {**settings.RATE_LIMITS, 'cart': '2/minute'}
+    product = make_product()
+
+    responses = [api_client.post('/orders/api/cart/add/', {'product_id': product.pk, 'quantity': 1})
+                 for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [201, 200, 429]
+    assert [response['RateLimit-Remaining'] for response in responses] == ['1', '0', '0']
+    assert responses[-1]['RateLimit-Limit'] == '2'
+    assert int(responses[-1]['Retry-After']) > 0
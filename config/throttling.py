@@ -0,0 +1,239 @@
+"""
+Token-bucket rate limiting for the expensive endpoints.
+
+Every limit is a bucket of ``n`` tokens per scope (endpoint) and client,
+refilled at ``n`` tokens per period: ``settings.RATE_LIMITS`` maps a scope
+to a rate in DRF's format, ``'<n>/<second|minute|hour|day>'``. A request
+takes one token, or is answered with ``429`` and a ``Retry-After`` of the
+time until the next token. Unlike DRF's fixed-history throttles, a client
+can spend a full bucket at once, and is then held to the refill rate.
+
+The buckets live in the store named by ``settings.RATE_LIMIT_STORE``:
+
+* ``RedisBucketStore``: production, shared by every process; a bucket is a
+  Redis hash updated by one Lua script, so concurrent requests can't both
+  take the last token;
+* ``InMemoryBucketStore``: per-process dict, for tests and single-process dev.
+
+Views pick their limits with DRF's ``throttle_classes``::
+
+    @throttle_classes([bucket_throttle('checkout')])            # per user
+    @throttle_classes([bucket_throttle('register', key_by='ip')])
+
+``RateLimitHeadersMiddleware`` adds ``RateLimit-Limit``,
+``RateLimit-Remaining`` and ``RateLimit-Reset`` to the responses of throttled
+views. A check costs one Redis round trip (see ``manage.py bench_throttle``);
+when Redis is down, requests are let through.
+"""
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """``'10/minute'`` -> ``(10, 60)``: the bucket size and the seconds it takes to refill."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period.strip()[0]]
+
+
+@dataclass
+class BucketResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # seconds until the next token (0 when allowed)
+    reset: float  # seconds until the bucket is full again
+
+
+class RedisBucketStore:
+    """One hash per bucket, ``ratelimit:<scope>:<client>``, with its ``tokens`` and their timestamp."""
+
+    # Redis' clock, not the web servers': they may disagree
+    CONSUME_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+        -- Lua numbers come back as integers, hence the string
+        return {allowed, tostring(tokens)}
+    """
+    # a rate limiter that waits on Redis would be the outage it should prevent
+    SOCKET_TIMEOUT = 0.5
+
+    def __init__(self, url=None):
+        import redis
+
+        self.redis = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True,
+                                          socket_timeout=self.SOCKET_TIMEOUT,
+                                          socket_connect_timeout=self.SOCKET_TIMEOUT)
+        self.errors = (redis.RedisError,)
+        self._consume = self.redis.register_script(self.CONSUME_SCRIPT)
+
+    def consume(self, key, capacity, rate):
+        try:
+            allowed, tokens = self._consume(keys=[key], args=[capacity, rate])
+        except self.errors:
+            logger.warning('Rate limit store unavailable, letting %s through', key, exc_info=True)
+            return BucketResult(True, capacity, capacity, 0, 0)
+        return _result(bool(allowed), float(tokens), capacity, rate)
+
+
+class InMemoryBucketStore:
+    """
+    Same semantics as ``RedisBucketStore``, kept in a per-process dict. A
+    bucket that has refilled is the same as no bucket, so those are dropped
+    every ``SWEEP_INTERVAL`` seconds, as Redis expires the hashes.
+    """
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        self._buckets = {}  # key -> [tokens, timestamp, capacity, rate]
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def _sweep(self, now):
+        # must be called with the lock held
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[3] < bucket[2]
+        }
+        self._swept_at = now
+
+    def consume(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at >= self.SWEEP_INTERVAL:
+                self._sweep(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now, capacity, rate]
+            tokens = min(capacity, bucket[0] + max(0.0, now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            bucket[:] = tokens, now, capacity, rate
+        return _result(allowed, tokens, capacity, rate)
+
+
+def _result(allowed, tokens, capacity, rate):
+    return BucketResult(
+        allowed=allowed,
+        limit=capacity,
+        remaining=int(tokens),
+        retry_after=0 if allowed else (1 - tokens) / rate,
+        reset=(capacity - tokens) / rate,
+    )
+
+
+_store = None
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.RATE_LIMIT_STORE)()
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_bucket_store(setting, **kwargs):
+    global _store
+    if setting in ('RATE_LIMIT_STORE', 'RATE_LIMITS', 'REDIS_URL'):
+        _store = None
+
+
+def _remember(request, result):
+    # on the Django request, where RateLimitHeadersMiddleware finds it; the
+    # headers describe the tightest of the view's limits
+    django_request = getattr(request, '_request', request)
+    current = getattr(django_request, 'rate_limit', None)
+    if current is None or result.remaining < current.remaining or not result.allowed:
+        django_request.rate_limit = result
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle taking one token from the ``scope`` bucket of the client:
+    the user (or the IP address of anonymous requests) with ``key_by =
+    'user'``, always the IP address with ``key_by = 'ip'``. A scope without
+    a rate in ``settings.RATE_LIMITS`` is not limited.
+    """
+    scope = None
+    key_by = 'user'
+
+    def bucket_key(self, request):
+        user = getattr(request, 'user', None)
+        if self.key_by == 'user' and user is not None and user.is_authenticated:
+            client = f'user:{user.pk}'
+        else:
+            # honours NUM_PROXIES for X-Forwarded-For, like DRF's throttles
+            client = f'ip:{self.get_ident(request)}'
+        return f'ratelimit:{self.scope}:{client}'
+
+    def allow_request(self, request, view):
+        rate = settings.RATE_LIMITS.get(self.scope)
+        if not rate:
+            return True
+        capacity, period = parse_rate(rate)
+        self.result = get_bucket_store().consume(self.bucket_key(request), capacity, capacity / period)
+        _remember(request, self.result)
+        return self.result.allowed
+
+    def wait(self):
+        return self.result.retry_after
+
+
+def bucket_throttle(scope, key_by='user'):
+    """A ``TokenBucketThrottle`` subclass for ``scope``, for ``throttle_classes``."""
+    name = ''.join(part.title() for part in scope.split('_'))
+    return type(f'{name}BucketThrottle', (TokenBucketThrottle,), {'scope': scope, 'key_by': key_by})
+
+
+class RateLimitHeadersMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _add_headers(self, request, response):
+        result = getattr(request, 'rate_limit', None)
+        if result is not None:
+            response['RateLimit-Limit'] = str(result.limit)
+            response['RateLimit-Remaining'] = str(result.remaining)
+            response['RateLimit-Reset'] = str(math.ceil(result.reset))
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._add_headers(request, await self.get_response(request))
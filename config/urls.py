@@ -20,18 +20,24 @@ from django.conf import settings # for media/static serving in developement
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from config.instrumentation import metrics_view
+from config.throttling import bucket_throttle
 from users.views import register_user
 
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('products/', include('products.urls', namespace='products')),
+    path('categories/', include('products.category_urls', namespace='categories')),
     path('orders/', include('orders.urls', namespace='orders')),
     # API URLs
     path('api/', include('products.api_urls')),
     path('api/register/', register_user, name='register_user'),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', TokenObtainPairView.as_view(throttle_classes=[bucket_throttle('token', key_by='ip')]),
+         name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # serve media files in development
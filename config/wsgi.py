@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# pool sizes and statement timeout for serving requests, see DB_ROLE in settings
+os.environ.setdefault("DJANGO_DB_ROLE", "web")
 
 application = get_wsgi_application()
@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from products.models import Inventory, Product, ProductImage
+
+# --query-analysis, and the query_analysis/query_analyzer fixtures
+pytest_plugins = ['config.pytest_plugin']
+
+
+def pytest_addoption(parser):
+    parser.addoption('--save-bench-baseline', action='store_true',
+                     help='Write the query counts of the benchmark tests to their baseline instead of checking them.')
+    parser.addoption('--bench-scales', default='1k',
+                     help='Comma-separated store sizes the benchmark tests run at: 1k, 100k, 1m (default: 1k).')
+
+
+@pytest.fixture(autouse=True)
+def _fresh_state(settings):
+    # the cache and the per-process stores outlive a test's transaction
+    cache.clear()
+    for name in ('CART_STORE_BACKEND', 'RATE_LIMIT_STORE', 'AUTH_USER_CACHE'):
+        # setting it again makes its module start over (setting_changed)
+        setattr(settings, name, getattr(settings, name))
+
+
+@pytest.fixture
+def celery_eager(settings):
+    """Run Celery tasks in the process that queues them."""
+    # the Celery app reads the CELERY_* settings on every lookup
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+
+
+@pytest.fixture
+def user(db):
+    return get_user_model().objects.create_user('alice', 'alice@example.com', 'pass-word-1')
+
+
+@pytest.fixture
+def api_client(user):
+    """An API client sending a real JWT of ``user``, through the whole authentication stack."""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+@pytest.fixture
+def make_product(db):
+    counter = iter(range(1, 1_000_000))
+
+    def make_product(price='10.00', stock=100, featured_image=False, **fields):
+        number = next(counter)
+        fields.setdefault('name', f'Product {number}')
+        fields.setdefault('slug', f'product-{number}')
+        product = Product.objects.create(price=Decimal(price), **fields)
+        Inventory.objects.create(product=product, stock_quantity=stock)
+        if featured_image:
+            ProductImage.objects.create(product=product, image=f'products/{number}.jpg', is_featured=True)
+        return product
+    return make_product
@@ -1,11 +1,16 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .exports import FORMATS, filter_orders, stream_orders
 from .models import Cart, CartItem, Order, OrderItem
 
 
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'is_active', 'created_at', 'updated_at', 'get_total_price')
+    list_display = ('user', 'is_active', 'created_at', 'updated_at', 'item_count', 'subtotal')
     list_filter = ('is_active', 'created_at')
     search_fields = ('user__username',)
+    readonly_fields = ('subtotal', 'item_count')
 
     class CartItemInline(admin.TabularInline):
         model = CartItem
@@ -29,15 +34,23 @@ class CartAdmin(admin.ModelAdmin):
         formset.save_m2m() # save ManyToMany relations if any (not relevant for CartItem, but good practice)
         super().save_formset(request, form, formset, change)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # items were edited one by one, so recount them like check_cart_totals does
+        cart = form.instance
+        cart.subtotal, cart.item_count = cart.calculate_totals()
+        cart.save(update_fields=['subtotal', 'item_count'])
+
 
 admin.site.register(Cart, CartAdmin)
 
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('user', 'status', 'total_price', 'created_at')
+    list_display = ('user', 'status', 'total_price', 'item_count', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('user__username',)
-    readonly_fields = ('total_price', 'created_at')
+    readonly_fields = ('total_price', 'item_count', 'created_at')
+    exclude = ('item_summary',)
 
     class OrderItemInline(admin.TabularInline):
         model = OrderItem
@@ -46,6 +59,23 @@ class OrderAdmin(admin.ModelAdmin):
         readonly_fields = ('price',)
 
     inlines = [OrderItemInline]
+    actions = ['export_csv', 'export_ndjson']
+
+    def _export(self, queryset, file_format):
+        # the changelist filters (status, created_at) narrow the queryset
+        filename = f"orders-{timezone.now():%Y%m%d-%H%M%S}.{file_format}"
+        response = StreamingHttpResponse(stream_orders(filter_orders(queryset), file_format),
+                                         content_type=FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description="Export selected orders as CSV")
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description="Export selected orders as NDJSON")
+    def export_ndjson(self, request, queryset):
+        return self._export(queryset, 'ndjson')
 
     def save_formset(self, request, form, formset, change):
         instances = formset.save(commit=False)
@@ -64,8 +94,9 @@ class OrderAdmin(admin.ModelAdmin):
         order = form.instance
         # now, all OrderItems for this order are in the database, so calculate_total_price() will work.
         order.total_price = order.calculate_total_price()
-        # Save only the total_price field to avoid re-triggering the full save logic (and potential recursion)
-        order.save(update_fields=['total_price'])
+        order.set_item_summary(order.items.select_related('product'))
+        # Save only the derived fields to avoid re-triggering the full save logic (and potential recursion)
+        order.save(update_fields=['total_price', 'item_count', 'item_summary'])
 
 
 admin.site.register(Order, OrderAdmin)
@@ -0,0 +1,328 @@
+"""
+Storefront benchmark: a seeded store and the hot paths measured against it.
+
+``StorefrontSeeder`` fills a database with categories, products with stock,
+users (password ``"bench"``), active carts and past orders, all named after a
+prefix. ``StorefrontBench`` sends the requests of each scenario through the
+whole middleware stack, in-process, and reports latency percentiles, queries
+per request and allocation peaks; ``compare()`` checks a report against a
+baseline.
+
+Used by ``manage.py seed_storefront``/``bench_storefront`` and by
+``orders/tests/test_benchmarks.py``. Adds to carts and places orders, so run
+it on a disposable database.
+"""
+import random
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from products.cache import bump_catalog_version
+from products.category_stats import rebuild_category_stats
+from products.models import Category, Inventory, Product
+from products.search import update_search_vectors
+from .models import Cart, CartItem, Order, OrderItem
+
+WORDS = ('red blue green black white leather cotton wool steel wooden classic modern slim large small '
+         'shirt jacket shoe boot lamp chair table desk mug bottle bag watch phone cable charger').split()
+
+SCENARIOS = (
+    'product_list', 'product_list_api', 'add_to_cart_api',
+    'cart_detail_api', 'checkout_api', 'order_history_api',
+)
+# metrics compared against the baseline; the query count must not grow at all
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'queries', 'peak_alloc_kib')
+
+
+def _batches(start, stop, size):
+    for batch_start in range(start, stop, size):
+        yield range(batch_start, min(batch_start + size, stop))
+
+
+class StorefrontSeeder:
+    """Seeds a store; running it again with larger numbers only adds the missing rows."""
+
+    def __init__(self, prefix='seed', seed=0, batch_size=5000, log=None):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+
+    def seed(self, products=1000, users=100, categories=20, items_per_cart=3, orders_per_user=5):
+        """Return the number of seeded products."""
+        category_ids = self._seed_categories(categories)
+        self._seed_products(products, category_ids)
+        product_rows = {
+            product_id: (price, name)
+            for product_id, price, name in Product.objects.filter(
+                slug__startswith=f'{self.prefix}-product-'
+            ).values_list('id', 'price', 'name')
+        }
+        new_user_ids = self._seed_users(users)
+        self._seed_carts(new_user_ids, product_rows, items_per_cart)
+        self._seed_orders(new_user_ids, product_rows, orders_per_user)
+
+        # bulk writes skip the signals that keep these up to date
+        update_search_vectors()
+        rebuild_category_stats()
+        bump_catalog_version()
+        return len(product_rows)
+
+    def _seed_categories(self, count):
+        Category.objects.bulk_create(
+            [Category(name=f'{self.prefix} category {i}', slug=f'{self.prefix}-category-{i}') for i in range(count)],
+            ignore_conflicts=True,
+        )
+        return list(Category.objects.filter(slug__startswith=f'{self.prefix}-category-').values_list('id', flat=True))
+
+    def _seed_products(self, count, category_ids):
+        existing = Product.objects.filter(slug__startswith=f'{self.prefix}-product-').count()
+        for batch in _batches(existing, count, self.batch_size):
+            with transaction.atomic():
+                products = Product.objects.bulk_create([
+                    Product(
+                        name=f'{self.prefix} product {i}',
+                        slug=f'{self.prefix}-product-{i}',
+                        description=' '.join(self.rng.choices(WORDS, k=20)),
+                        price=Decimal(self.rng.randint(100, 50000)) / 100,
+                        category_id=self.rng.choice(category_ids) if category_ids else None,
+                    )
+                    for i in batch
+                ])
+                Inventory.objects.bulk_create(
+                    [Inventory(product=product, stock_quantity=1_000_000) for product in products]
+                )
+            self.log(f'products: {batch.stop}/{count}')
+
+    def _seed_users(self, count):
+        User = get_user_model()
+        existing = User.objects.filter(username__startswith=f'{self.prefix}-user-').count()
+        password = make_password('bench')  # hashing is slow, do it once
+        new_ids = []
+        for batch in _batches(existing, count, self.batch_size):
+            users = User.objects.bulk_create(
+                [User(username=f'{self.prefix}-user-{i}', password=password) for i in batch]
+            )
+            new_ids.extend(user.pk for user in users)
+        return new_ids
+
+    def _sample_lines(self, products, product_ids, count):
+        """``count`` distinct (product id, quantity, price) lines."""
+        return [(product_id, self.rng.randint(1, 3), products[product_id][0])
+                for product_id in self.rng.sample(product_ids, min(count, len(product_ids)))]
+
+    def _seed_carts(self, user_ids, products, items_per_cart):
+        product_ids = list(products)
+        for start in range(0, len(user_ids), self.batch_size):
+            with transaction.atomic():
+                carts, lines = [], []
+                for user_id in user_ids[start:start + self.batch_size]:
+                    cart_lines = self._sample_lines(products, product_ids, items_per_cart)
+                    carts.append(Cart(
+                        user_id=user_id,
+                        subtotal=sum(quantity * price for _, quantity, price in cart_lines),
+                        item_count=sum(quantity for _, quantity, _ in cart_lines),
+                    ))
+                    lines.append(cart_lines)
+                carts = Cart.objects.bulk_create(carts)
+                CartItem.objects.bulk_create([
+                    CartItem(cart=cart, product_id=product_id, quantity=quantity, price=price)
+                    for cart, cart_lines in zip(carts, lines)
+                    for product_id, quantity, price in cart_lines
+                ])
+
+    def _seed_orders(self, user_ids, products, orders_per_user):
+        product_ids = list(products)
+        users_per_batch = max(1, self.batch_size // max(1, orders_per_user))
+        for start in range(0, len(user_ids), users_per_batch):
+            with transaction.atomic():
+                orders, lines = [], []
+                for user_id in user_ids[start:start + users_per_batch]:
+                    for _ in range(orders_per_user):
+                        order_lines = self._sample_lines(products, product_ids, self.rng.randint(1, 4))
+                        orders.append(Order(
+                            user_id=user_id,
+                            status=self.rng.choice(['PROCESSING', 'SHIPPED', 'COMPLETED']),
+                            total_price=sum(quantity * price for _, quantity, price in order_lines),
+                            item_count=sum(quantity for _, quantity, _ in order_lines),
+                            item_summary=[
+                                {'product': products[product_id][1], 'quantity': quantity, 'price': str(price)}
+                                for product_id, quantity, price in order_lines
+                            ],
+                        ))
+                        lines.append(order_lines)
+                orders = Order.objects.bulk_create(orders)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product_id=product_id, quantity=quantity, price=price)
+                    for order, order_lines in zip(orders, lines)
+                    for product_id, quantity, price in order_lines
+                ])
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class _CountAllQueries:
+    """``CaptureQueriesContext`` over every database alias (the read replicas too)."""
+
+    def __enter__(self):
+        self.contexts = [CaptureQueriesContext(connections[alias]) for alias in settings.DATABASES]
+        for context in self.contexts:
+            context.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        for context in self.contexts:
+            context.__exit__(*exc_info)
+
+    def __len__(self):
+        return sum(len(context) for context in self.contexts)
+
+
+class StorefrontBench:
+    """
+    Runs the scenarios as the first ``users`` users seeded with ``prefix``.
+    ``checkout_api`` only queues the order unless ``CELERY_TASK_ALWAYS_EAGER``
+    is on.
+    """
+
+    def __init__(self, prefix='seed', seed=0, log_error=None, users=1000):
+        self.rng = random.Random(seed)
+        self.log_error = log_error or (lambda message: None)
+        self.users = list(get_user_model().objects.filter(username__startswith=f'{prefix}-user-').order_by('pk')[:users])
+        self.product_ids = list(
+            Product.objects.filter(slug__startswith=f'{prefix}-product-', is_active=True)
+            .order_by('pk').values_list('pk', flat=True)[:1000]
+        )
+        if not self.users or not self.product_ids:
+            raise ValueError(f'No seeded data with prefix {prefix!r}; run seed_storefront first.')
+        self.tokens = {user.pk: str(AccessToken.for_user(user)) for user in self.users}
+
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost')
+        self.client = Client(HTTP_HOST=host)
+
+    def _headers(self, user):
+        return {'Authorization': f'Bearer {self.tokens[user.pk]}'}
+
+    def _add_to_cart(self, user):
+        return self.client.post(
+            reverse('orders:add-to-cart-api'),
+            {'product_id': self.rng.choice(self.product_ids), 'quantity': 1},
+            content_type='application/json', headers=self._headers(user),
+        )
+
+    def _checkout(self, user):
+        return self.client.post(reverse('orders:checkout-api'), {}, content_type='application/json',
+                                headers=self._headers(user))
+
+    def _get(self, url_name, user=None):
+        return self.client.get(reverse(url_name), headers=self._headers(user) if user else {})
+
+    def _scenario(self, name):
+        """Return ``(setup, request, expected statuses)``; both take the user to act as."""
+        if name == 'product_list':
+            # anonymous visitors browse the catalog
+            return None, lambda user: self._get('products:product_list'), (200,)
+        if name == 'add_to_cart_api':
+            return None, self._add_to_cart, (200, 201)
+        if name == 'checkout_api':
+            return self._add_to_cart, self._checkout, (202,)
+        url_name = {
+            'product_list_api': 'product-list-api',
+            'cart_detail_api': 'orders:cart-detail-api',
+            'order_history_api': 'orders:order-history-api',
+        }[name]
+        return None, lambda user: self._get(url_name, user), (200,)
+
+    def run(self, name, requests=200, warmup=10, profile_requests=20):
+        # limits the benchmark would run into, but checked all the same, so their cost is measured
+        unlimited = {scope: f'{10 ** 9}/second' for scope in settings.RATE_LIMITS}
+        with override_settings(RATE_LIMITS=unlimited):
+            return self._run(name, requests, warmup, profile_requests)
+
+    def _run(self, name, requests, warmup, profile_requests):
+        setup, request, expected_statuses = self._scenario(name)
+        errors = 0
+
+        def run(user):
+            nonlocal errors
+            response = request(user)
+            if response.status_code not in expected_statuses:
+                errors += 1
+                if errors == 1:
+                    self.log_error(f'{name}: HTTP {response.status_code} {response.content[:200]!r}')
+
+        for _ in range(warmup):
+            user = self.rng.choice(self.users)
+            if setup:
+                setup(user)
+            run(user)
+
+        latencies = []
+        for _ in range(requests):
+            user = self.rng.choice(self.users)
+            if setup:
+                setup(user)
+            started = time.perf_counter()
+            run(user)
+            latencies.append(time.perf_counter() - started)
+
+        # separate pass: counting queries and tracing allocations slow requests down
+        queries, peaks = [], []
+        for _ in range(max(1, profile_requests)):
+            user = self.rng.choice(self.users)
+            if setup:
+                setup(user)
+            tracemalloc.start()
+            try:
+                with _CountAllQueries() as captured:
+                    run(user)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+            queries.append(len(captured))
+
+        return {
+            'p50_ms': round(statistics.median(latencies) * 1000, 3),
+            'p95_ms': round(_percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'queries': int(statistics.median(queries)),
+            'peak_alloc_kib': round(statistics.median(peaks) / 1024, 1),
+            'errors': errors,
+        }
+
+
+def compare(results, baseline, threshold):
+    """
+    Return the regressions of ``results`` against ``baseline`` (both
+    ``{scenario: metrics}``), as messages. Only the scenarios and metrics the
+    baseline has are compared; timings and allocations may grow by
+    ``threshold`` (a fraction), the query count not at all.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['errors']:
+            regressions.append(f"{name}: {result['errors']} failed requests")
+        for metric in COMPARED_METRICS:
+            if metric not in before:
+                continue
+            limit = before[metric] if metric == 'queries' else before[metric] * (1 + threshold)
+            if result[metric] > limit:
+                regressions.append(f'{name}: {metric} {before[metric]} -> {result[metric]}')
+    return regressions
@@ -0,0 +1,522 @@
+"""
+Pluggable storage for active shopping carts.
+
+The cart views talk to a cart store instead of the ``Cart``/``CartItem``
+tables. With the Redis backend an active cart lives in one Redis hash and is
+only written to the database ("materialized") when the user checks out, or
+by the ``orders.flush_expiring_carts`` beat task shortly before the hash
+expires. When a hash is missing (first visit, or after it expired) it is
+loaded back from the user's active ``Cart`` row, so a materialized cart is
+never lost.
+
+The backend is chosen by ``settings.CART_STORE_BACKEND``:
+
+* ``RedisCartStore``: production, needs ``REDIS_URL``.
+* ``DatabaseCartStore``: reads and writes ``Cart``/``CartItem`` directly.
+* ``InMemoryCartStore``: per-process dict, for tests and single-process dev.
+
+Cart lines are addressed by product id in every backend.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from products.models import Product
+from .models import Cart, CartItem
+
+
+@dataclass
+class CartLine:
+    product_id: int
+    quantity: int
+    price: Decimal
+    product: Product = None
+
+    @property
+    def id(self):
+        # forms and API URLs address a line by its product
+        return self.product_id
+
+    @property
+    def get_total_price(self):
+        return self.quantity * self.price
+
+
+class CartSnapshot:
+    """A read-only view of a user's cart, used by the templates and the cart API."""
+
+    def __init__(self, user_id, lines):
+        self.user_id = user_id
+        self.items = lines
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def item_count(self):
+        return sum(line.quantity for line in self.items)
+
+    def get_total_price(self):
+        return sum((line.get_total_price for line in self.items), Decimal('0.00'))
+
+
+def _adjust_totals(cart_id, quantity, amount):
+    """Move ``Cart.subtotal``/``item_count`` by a delta; call it in the transaction that wrote the items."""
+    Cart.objects.filter(pk=cart_id).update(
+        item_count=F('item_count') + quantity,
+        subtotal=F('subtotal') + amount,
+        updated_at=timezone.now()
+    )
+
+
+def _merge_lines(lines):
+    # one entry per product, keeping the first price seen
+    merged = {}
+    for product_id, quantity, price in lines:
+        if product_id in merged:
+            merged[product_id][0] += quantity
+        else:
+            merged[product_id] = [quantity, price]
+    return merged
+
+
+class BaseCartStore:
+    def get_lines(self, user_id):
+        raise NotImplementedError
+
+    def peek_lines(self, user_id):
+        """``get_lines()`` without extending the cart's lifetime, for the flush."""
+        return self.get_lines(user_id)
+
+    def add(self, user_id, product_id, quantity, price):
+        """Add ``quantity`` units; return ``(new_quantity, created)``."""
+        return self.add_many(user_id, [(product_id, quantity, price)])[product_id]
+
+    def add_many(self, user_id, lines):
+        """
+        Add several ``(product_id, quantity, price)`` lines in one round trip;
+        return a dict mapping each product id to ``(new_quantity, created)``.
+        """
+        raise NotImplementedError
+
+    def set_quantity(self, user_id, product_id, quantity):
+        """Set the quantity of an existing line; return False if there is no such line."""
+        raise NotImplementedError
+
+    def remove(self, user_id, product_id):
+        """Remove a line; return False if there is no such line."""
+        raise NotImplementedError
+
+    def clear(self, user_id):
+        raise NotImplementedError
+
+    def discard_materialized(self, user_id, cart):
+        """
+        ``cart``, made by ``materialize()``, has been ordered: take the
+        quantities it was made from out of the store. Whatever was added to
+        the cart since then stays.
+        """
+        raise NotImplementedError
+
+    def expiring(self, within):
+        """Return the ids of users whose cart expires in the next ``within`` seconds."""
+        return []
+
+    def forget_expiring(self, user_id):
+        pass
+
+    def load(self, user_id):
+        """Return a ``CartSnapshot`` with the products attached (one query)."""
+        lines = self.get_lines(user_id)
+        products = Product.objects.in_bulk([line.product_id for line in lines])
+        for line in lines:
+            line.product = products.get(line.product_id)
+        # drop lines whose product has been deleted since it was added
+        return CartSnapshot(user_id, [line for line in lines if line.product is not None])
+
+    async def aload(self, user_id):
+        """``load()`` for async views; the backends themselves are sync."""
+        lines = await sync_to_async(self.get_lines)(user_id)
+        products = await Product.objects.ain_bulk([line.product_id for line in lines])
+        for line in lines:
+            line.product = products.get(line.product_id)
+        return CartSnapshot(user_id, [line for line in lines if line.product is not None])
+
+    def materialize(self, user_id):
+        """
+        Write the stored cart into the user's active ``Cart`` and return it.
+        The cart's existing items are replaced. The quantities read from the
+        store are kept in ``cart.stored_quantities`` for ``discard_materialized()``.
+        """
+        lines = self.peek_lines(user_id)
+        existing = set(Product.objects.filter(pk__in=[line.product_id for line in lines])
+                       .values_list('pk', flat=True))
+        lines = [line for line in lines if line.product_id in existing]
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(user_id=user_id, is_active=True)
+            if not created:
+                cart.items.all().delete()
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product_id=line.product_id, quantity=line.quantity, price=line.price)
+                for line in lines
+            ])
+            cart.subtotal = sum((line.get_total_price for line in lines), Decimal('0.00'))
+            cart.item_count = sum(line.quantity for line in lines)
+            cart.save(update_fields=['subtotal', 'item_count', 'updated_at'])
+        cart.stored_quantities = {line.product_id: line.quantity for line in lines}
+        return cart
+
+    def _load_from_db(self, user_id):
+        return [
+            CartLine(product_id, quantity, price)
+            for product_id, quantity, price in CartItem.objects.filter(
+                cart__user_id=user_id, cart__is_active=True
+            ).values_list('product_id', 'quantity', 'price')
+        ]
+
+
+class DatabaseCartStore(BaseCartStore):
+    def _get_or_create_cart(self, user_id):
+        # call it in a transaction: the row stays locked until it commits, so
+        # an add can't land in a cart that a checkout is deactivating (the
+        # add waits, finds the cart inactive and starts a new one)
+        cart, created = Cart.objects.select_for_update().get_or_create(user_id=user_id, is_active=True)
+        return cart
+
+    def get_lines(self, user_id):
+        return self._load_from_db(user_id)
+
+    def add_many(self, user_id, lines):
+        lines = _merge_lines(lines)
+
+        # a single INSERT ... ON CONFLICT against the unique_cart_product
+        # constraint: concurrent adds of the same product can't lose an update
+        connection = connections[router.db_for_write(CartItem)]
+        table = connection.ops.quote_name(CartItem._meta.db_table)
+        values = ', '.join(['(%s, %s, %s, %s)'] * len(lines))
+        sql = (
+            f'INSERT INTO {table} (cart_id, product_id, quantity, price) VALUES {values} '
+            f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity '
+            f'RETURNING product_id, quantity, price'
+        )
+
+        with transaction.atomic(using=connection.alias):
+            cart = self._get_or_create_cart(user_id)
+            params = []
+            for product_id, (quantity, price) in lines.items():
+                params += [cart.pk, product_id, quantity, price]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            # an existing line keeps its price, which RETURNING hands back
+            _adjust_totals(
+                cart.pk,
+                sum(quantity for quantity, _price in lines.values()),
+                sum((lines[product_id][0] * Decimal(str(price)) for product_id, _quantity, price in rows), Decimal('0.00'))
+            )
+        return {product_id: (quantity, quantity == lines[product_id][0]) for product_id, quantity, _price in rows}
+
+    def _lock_line(self, user_id, product_id):
+        return CartItem.objects.select_for_update().filter(
+            cart__user_id=user_id, cart__is_active=True, product_id=product_id
+        ).values_list('pk', 'cart_id', 'quantity', 'price').first()
+
+    def set_quantity(self, user_id, product_id, quantity):
+        with transaction.atomic():
+            line = self._lock_line(user_id, product_id)
+            if line is None:
+                return False
+            pk, cart_id, old_quantity, price = line
+            CartItem.objects.filter(pk=pk).update(quantity=quantity)
+            _adjust_totals(cart_id, quantity - old_quantity, (quantity - old_quantity) * price)
+        return True
+
+    def remove(self, user_id, product_id):
+        with transaction.atomic():
+            line = self._lock_line(user_id, product_id)
+            if line is None:
+                return False
+            pk, cart_id, quantity, price = line
+            CartItem.objects.filter(pk=pk).delete()
+            _adjust_totals(cart_id, -quantity, -quantity * price)
+        return True
+
+    def clear(self, user_id):
+        with transaction.atomic():
+            CartItem.objects.filter(cart__user_id=user_id, cart__is_active=True).delete()
+            Cart.objects.filter(user_id=user_id, is_active=True).update(
+                subtotal=Decimal('0.00'), item_count=0, updated_at=timezone.now())
+
+    def materialize(self, user_id):
+        # the cart already lives in the database; locked until the caller's
+        # transaction, which deactivates it, commits
+        with transaction.atomic():
+            return self._get_or_create_cart(user_id)
+
+    def discard_materialized(self, user_id, cart):
+        # the ordered cart was deactivated; later additions went to a new one
+        pass
+
+
+class RedisCartStore(BaseCartStore):
+    """
+    One hash per user, ``cart:<user_id>``, with a ``q:<product_id>`` field for
+    the quantity and a ``p:<product_id>`` field for the price captured when the
+    product was first added. A ``loaded`` field marks a hash that has been
+    hydrated from the database. The sorted set ``cart:expiry`` maps user ids to
+    the time their hash expires, for ``flush_expiring_carts``.
+    """
+    EXPIRY_KEY = 'cart:expiry'
+
+    # only set the quantity if the line exists
+    SET_QUANTITY_SCRIPT = """
+        if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+            redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+            return 1
+        end
+        return 0
+    """
+
+    # take ordered quantities out of the lines; ARGV holds product id and
+    # quantity pairs. A hash left with no lines is deleted, returning 0
+    SUBTRACT_SCRIPT = """
+        for i = 1, #ARGV, 2 do
+            local field = 'q:' .. ARGV[i]
+            if redis.call('HEXISTS', KEYS[1], field) == 1 then
+                if redis.call('HINCRBY', KEYS[1], field, -tonumber(ARGV[i + 1])) <= 0 then
+                    redis.call('HDEL', KEYS[1], field, 'p:' .. ARGV[i])
+                end
+            end
+        end
+        if redis.call('HLEN', KEYS[1]) <= 1 then
+            redis.call('DEL', KEYS[1])
+            return 0
+        end
+        return 1
+    """
+
+    def __init__(self, url=None, ttl=None):
+        import redis
+
+        self.redis = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.ttl = ttl or settings.CART_TTL
+        self._set_quantity = self.redis.register_script(self.SET_QUANTITY_SCRIPT)
+        self._subtract = self.redis.register_script(self.SUBTRACT_SCRIPT)
+
+    def _key(self, user_id):
+        return f'cart:{user_id}'
+
+    def _touch(self, pipe, user_id):
+        pipe.expire(self._key(user_id), self.ttl)
+        pipe.zadd(self.EXPIRY_KEY, {user_id: time.time() + self.ttl})
+
+    def _ensure_loaded(self, user_id):
+        key = self._key(user_id)
+        if self.redis.exists(key):
+            return
+        pipe = self.redis.pipeline()
+        pipe.hset(key, 'loaded', 1)
+        for line in self._load_from_db(user_id):
+            # HSETNX, so a write that raced the hydration isn't overwritten
+            pipe.hsetnx(key, f'q:{line.product_id}', line.quantity)
+            pipe.hsetnx(key, f'p:{line.product_id}', str(line.price))
+        self._touch(pipe, user_id)
+        pipe.execute()
+
+    def get_lines(self, user_id):
+        self._ensure_loaded(user_id)
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self._key(user_id))
+        self._touch(pipe, user_id)
+        return self._parse_lines(pipe.execute()[0])
+
+    def peek_lines(self, user_id):
+        fields = self.redis.hgetall(self._key(user_id))
+        if not fields:
+            # expired: the database has the last materialized cart
+            return self._load_from_db(user_id)
+        return self._parse_lines(fields)
+
+    def _parse_lines(self, fields):
+        lines = []
+        for field, value in fields.items():
+            if field.startswith('q:'):
+                product_id = field[2:]
+                price = fields.get(f'p:{product_id}')
+                if price is not None:
+                    lines.append(CartLine(int(product_id), int(value), Decimal(price)))
+        lines.sort(key=lambda line: line.product_id)
+        return lines
+
+    def add_many(self, user_id, lines):
+        lines = _merge_lines(lines)
+        self._ensure_loaded(user_id)
+        key = self._key(user_id)
+        pipe = self.redis.pipeline()
+        for product_id, (quantity, price) in lines.items():
+            pipe.hincrby(key, f'q:{product_id}', quantity)
+            pipe.hsetnx(key, f'p:{product_id}', str(price))
+        self._touch(pipe, user_id)
+        # HINCRBY results are every other reply
+        new_quantities = pipe.execute()[:2 * len(lines):2]
+        return {
+            product_id: (new_quantity, new_quantity == quantity)
+            for (product_id, (quantity, price)), new_quantity in zip(lines.items(), new_quantities)
+        }
+
+    def set_quantity(self, user_id, product_id, quantity):
+        self._ensure_loaded(user_id)
+        updated = self._set_quantity(keys=[self._key(user_id)], args=[f'q:{product_id}', quantity])
+        return bool(updated)
+
+    def remove(self, user_id, product_id):
+        self._ensure_loaded(user_id)
+        return self.redis.hdel(self._key(user_id), f'q:{product_id}', f'p:{product_id}') > 0
+
+    def clear(self, user_id):
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key(user_id))
+        pipe.zrem(self.EXPIRY_KEY, user_id)
+        pipe.execute()
+
+    def discard_materialized(self, user_id, cart):
+        args = []
+        for product_id, quantity in cart.stored_quantities.items():
+            args += [product_id, quantity]
+        if not self._subtract(keys=[self._key(user_id)], args=args):
+            self.redis.zrem(self.EXPIRY_KEY, user_id)
+
+    def expiring(self, within):
+        return [int(user_id) for user_id in
+                self.redis.zrangebyscore(self.EXPIRY_KEY, 0, time.time() + within)]
+
+    def forget_expiring(self, user_id):
+        # the hash itself is left to expire; touching it again re-registers it
+        self.redis.zrem(self.EXPIRY_KEY, user_id)
+
+
+class InMemoryCartStore(BaseCartStore):
+    """Same semantics as ``RedisCartStore``, kept in a per-process dict."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or settings.CART_TTL
+        self._carts = {}
+        self._lock = threading.Lock()
+
+    def _cart(self, user_id):
+        # must be called with the lock held
+        cart = self._carts.get(user_id)
+        if cart is None or cart['expires_at'] <= time.time():
+            lines = {line.product_id: [line.quantity, line.price] for line in self._load_from_db(user_id)}
+            cart = self._carts[user_id] = {'lines': lines}
+        cart['expires_at'] = time.time() + self.ttl
+        cart.pop('flushed', None)
+        return cart
+
+    def get_lines(self, user_id):
+        with self._lock:
+            lines = self._cart(user_id)['lines']
+            return [CartLine(product_id, quantity, price)
+                    for product_id, (quantity, price) in sorted(lines.items())]
+
+    def peek_lines(self, user_id):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None or cart['expires_at'] <= time.time():
+                return self._load_from_db(user_id)
+            return [CartLine(product_id, quantity, price)
+                    for product_id, (quantity, price) in sorted(cart['lines'].items())]
+
+    def add_many(self, user_id, lines):
+        result = {}
+        with self._lock:
+            stored = self._cart(user_id)['lines']
+            for product_id, (quantity, price) in _merge_lines(lines).items():
+                line = stored.get(product_id)
+                if line is None:
+                    stored[product_id] = [quantity, price]
+                    result[product_id] = (quantity, True)
+                else:
+                    line[0] += quantity
+                    result[product_id] = (line[0], False)
+        return result
+
+    def set_quantity(self, user_id, product_id, quantity):
+        with self._lock:
+            line = self._cart(user_id)['lines'].get(product_id)
+            if line is None:
+                return False
+            line[0] = quantity
+            return True
+
+    def remove(self, user_id, product_id):
+        with self._lock:
+            return self._cart(user_id)['lines'].pop(product_id, None) is not None
+
+    def clear(self, user_id):
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+    def discard_materialized(self, user_id, cart):
+        with self._lock:
+            stored = self._carts.get(user_id)
+            if stored is None:
+                return
+            for product_id, quantity in cart.stored_quantities.items():
+                line = stored['lines'].get(product_id)
+                if line is not None:
+                    line[0] -= quantity
+                    if line[0] <= 0:
+                        del stored['lines'][product_id]
+            if not stored['lines']:
+                del self._carts[user_id]
+
+    def expiring(self, within):
+        deadline = time.time() + within
+        with self._lock:
+            return [user_id for user_id, cart in self._carts.items()
+                    if cart['expires_at'] <= deadline and not cart.get('flushed')]
+
+    def forget_expiring(self, user_id):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is not None:
+                cart['flushed'] = True
+
+
+_store = None
+
+
+def get_cart_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.CART_STORE_BACKEND)()
+    return _store
+
+
+def flush_expiring_carts(within):
+    """Materialize the carts expiring in the next ``within`` seconds; return how many there were."""
+    store = get_cart_store()
+    flushed = 0
+    for user_id in store.expiring(within):
+        store.materialize(user_id)
+        store.forget_expiring(user_id)
+        flushed += 1
+    return flushed
+
+
+@receiver(setting_changed)
+def _reset_cart_store(setting, **kwargs):
+    global _store
+    if setting in ('CART_STORE_BACKEND', 'CART_TTL', 'REDIS_URL'):
+        _store = None
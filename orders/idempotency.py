@@ -0,0 +1,162 @@
+"""
+``Idempotency-Key`` support for the checkout and cart mutation APIs.
+
+A client that retries a request with the same ``Idempotency-Key`` header gets
+the response of the first attempt back, without the view running again. The
+first response is stored per user and key for ``IDEMPOTENCY_TTL`` seconds. A
+duplicate that arrives while the first request is still running waits up to
+``IDEMPOTENCY_WAIT`` seconds for it to finish, and gets a 409 after that.
+Reusing a key for a different request (method, path or body) is a 422.
+
+Responses are stored in the cache (Redis) when ``IDEMPOTENCY_STORE`` is
+``'cache'``, and in the ``IdempotencyRecord`` table when it is ``'db'`` or the
+cache is unreachable. 5xx responses and exceptions are not stored, so the
+client can retry them.
+"""
+import hashlib
+import logging
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+IN_PROGRESS = None
+
+
+class CacheStore:
+    def _key(self, user_id, key):
+        return f'idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def claim(self, user_id, key, fingerprint):
+        """Return ``(claimed, record)``; ``record`` is ``(fingerprint, status_code, data)``."""
+        entry = (fingerprint, IN_PROGRESS, None)
+        if cache.add(self._key(user_id, key), entry, settings.IDEMPOTENCY_TTL):
+            return True, entry
+        return False, self.get(user_id, key)
+
+    def get(self, user_id, key):
+        return cache.get(self._key(user_id, key))
+
+    def complete(self, user_id, key, fingerprint, status_code, data):
+        cache.set(self._key(user_id, key), (fingerprint, status_code, data), settings.IDEMPOTENCY_TTL)
+
+    def release(self, user_id, key):
+        cache.delete(self._key(user_id, key))
+
+
+class DatabaseStore:
+    def claim(self, user_id, key, fingerprint):
+        now = timezone.now()
+        # an expired record doesn't count
+        IdempotencyRecord.objects.filter(user_id=user_id, key=key, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(
+                    user_id=user_id, key=key, fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+                )
+            return True, (fingerprint, IN_PROGRESS, None)
+        except IntegrityError:
+            return False, self.get(user_id, key)
+
+    def get(self, user_id, key):
+        record = IdempotencyRecord.objects.filter(user_id=user_id, key=key).values_list(
+            'fingerprint', 'status_code', 'response_data').first()
+        return record
+
+    def complete(self, user_id, key, fingerprint, status_code, data):
+        IdempotencyRecord.objects.filter(user_id=user_id, key=key).update(
+            status_code=status_code, response_data=data)
+
+    def release(self, user_id, key):
+        IdempotencyRecord.objects.filter(user_id=user_id, key=key).delete()
+
+
+_stores = {'cache': CacheStore(), 'db': DatabaseStore()}
+
+
+def _fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(user_id, key, fingerprint):
+    store = _stores[settings.IDEMPOTENCY_STORE]
+    try:
+        return store, store.claim(user_id, key, fingerprint)
+    except Exception:
+        if store is _stores['db']:
+            raise
+        logger.warning('Idempotency cache unavailable, falling back to the database.', exc_info=True)
+        store = _stores['db']
+        return store, store.claim(user_id, key, fingerprint)
+
+
+def _wait_for(store, user_id, key):
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    record = store.get(user_id, key)
+    while record is not None and record[1] is IN_PROGRESS and time.monotonic() < deadline:
+        time.sleep(0.05)
+        record = store.get(user_id, key)
+    return record
+
+
+def idempotent(view):
+    """
+    Make a DRF function view honour the ``Idempotency-Key`` header. Goes below
+    ``@api_view``/``@permission_classes`` so that ``request.user`` is set.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': f'{HEADER} must be at most 255 characters.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.user.pk
+        fingerprint = _fingerprint(request)
+        store, (claimed, record) = _claim(user_id, key, fingerprint)
+
+        if not claimed:
+            if record is not None and record[0] != fingerprint:
+                return Response({'error': f'{HEADER} was already used for a different request.'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            record = _wait_for(store, user_id, key)
+            if record is None or record[1] is IN_PROGRESS:
+                return Response({'error': f'A request with this {HEADER} is still in progress.'},
+                                status=status.HTTP_409_CONFLICT)
+            response = Response(record[2], status=record[1])
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            store.release(user_id, key)
+            raise
+        if response.status_code >= 500:
+            store.release(user_id, key)
+        else:
+            store.complete(user_id, key, fingerprint, response.status_code, getattr(response, 'data', None))
+        return response
+
+    return wrapper
+
+
+def purge_expired_records(now=None):
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,93 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from orders.bench import SCENARIOS, StorefrontBench, compare
+from orders.models import Order
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the storefront hot paths in-process (full middleware stack) against the '
+            'data made by seed_storefront: latency, queries per request and allocations. '
+            'Writes the results as JSON and compares them with a saved baseline. '
+            'Adds to carts and places orders, so run it on a disposable database. '
+            'checkout_api only queues the order unless CELERY_TASK_ALWAYS_EAGER=True. '
+            'The same scenarios run under pytest in orders/tests/test_benchmarks.py.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per scenario first.')
+        parser.add_argument('--profile-requests', type=int, default=20,
+                            help='Requests per scenario counted for queries and allocations (not timed).')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f'Comma-separated subset of: {", ".join(SCENARIOS)}.')
+        parser.add_argument('--prefix', default='seed', help='The --prefix given to seed_storefront.')
+        parser.add_argument('-o', '--output', default='bench-storefront.json')
+        parser.add_argument('--baseline', help='Results of an earlier run to compare with.')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write the results to --baseline instead of comparing with it.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed slowdown/growth over the baseline, as a fraction (0.2 = 20%%).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}.')
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline needs --baseline.')
+
+        try:
+            bench = StorefrontBench(prefix=options['prefix'], seed=options['seed'], log_error=self.stderr.write)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'products': Product.objects.count(),
+                'users': get_user_model().objects.count(),
+                'orders': Order.objects.count(),
+                'requests': options['requests'],
+            },
+            'results': {},
+        }
+        self.stdout.write(f"{report['meta']['products']} products, {report['meta']['users']} users, "
+                          f"{report['meta']['orders']} orders on {connection.vendor}")
+        for name in scenarios:
+            result = bench.run(name, requests=options['requests'], warmup=options['warmup'],
+                               profile_requests=options['profile_requests'])
+            report['results'][name] = result
+            self.stdout.write(
+                f"{name:<18} p50={result['p50_ms']:8.2f}ms  p95={result['p95_ms']:8.2f}ms  "
+                f"p99={result['p99_ms']:8.2f}ms  queries={result['queries']:3}  "
+                f"alloc={result['peak_alloc_kib']:9.1f}KiB  errors={result['errors']}"
+            )
+
+        Path(options['output']).write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"results written to {options['output']}")
+
+        if options['baseline']:
+            if options['save_baseline']:
+                Path(options['baseline']).write_text(json.dumps(report, indent=2))
+                self.stdout.write(f"baseline saved to {options['baseline']}")
+            else:
+                self._compare(report, options['baseline'], options['threshold'])
+
+    def _compare(self, report, baseline_path, threshold):
+        try:
+            baseline = json.loads(Path(baseline_path).read_text())
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {baseline_path}; create it with --save-baseline.')
+
+        regressions = compare(report['results'], baseline['results'], threshold)
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'no regressions against {baseline_path} (threshold {threshold:.0%})'))
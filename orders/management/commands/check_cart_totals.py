@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from orders.models import Cart
+
+
+class Command(BaseCommand):
+    help = ('Compare the stored Cart.subtotal/item_count with the sum of the cart items '
+            'and report the carts that disagree.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite the stored totals with the actual ones.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        carts = Cart.objects.annotate(
+            actual_subtotal=Coalesce(
+                Sum(F('items__quantity') * F('items__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00'))
+            ),
+            actual_item_count=Coalesce(Sum('items__quantity'), Value(0)),
+        )
+
+        mismatched = 0
+        batch = []
+        for cart in carts.only('pk', 'subtotal', 'item_count').iterator(chunk_size=options['batch_size']):
+            # compared here rather than in SQL: SQLite compares decimals as floats
+            cart.actual_subtotal = Decimal(cart.actual_subtotal).quantize(Decimal('0.01'))
+            if cart.subtotal == cart.actual_subtotal and cart.item_count == cart.actual_item_count:
+                continue
+            mismatched += 1
+            self.stdout.write(
+                f'Cart {cart.pk}: stored {cart.item_count} items / {cart.subtotal}, '
+                f'actual {cart.actual_item_count} items / {cart.actual_subtotal}'
+            )
+            if options['fix']:
+                cart.subtotal, cart.item_count = cart.actual_subtotal, cart.actual_item_count
+                batch.append(cart)
+                if len(batch) >= options['batch_size']:
+                    Cart.objects.bulk_update(batch, ['subtotal', 'item_count'])
+                    batch = []
+        if batch:
+            Cart.objects.bulk_update(batch, ['subtotal', 'item_count'])
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('All cart totals are consistent.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {mismatched} cart(s).'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{mismatched} cart(s) disagree; run with --fix to repair them.'))
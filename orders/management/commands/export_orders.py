@@ -0,0 +1,49 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from orders.exports import FORMATS, filter_orders, stream_orders
+from orders.models import Order
+
+
+def _parse_moment(value):
+    """An ISO datetime, or a date meaning its midnight, in the current time zone."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'{value!r} is not a date or datetime.')
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = ('Stream orders with their line items as CSV (one row per item) or NDJSON '
+            '(one order per line), in constant memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--from', dest='created_from', help='Orders created at or after this date/datetime.')
+        parser.add_argument('--to', dest='created_to', help='Orders created before this date/datetime.')
+        parser.add_argument('--status', action='append', choices=[value for value, _ in Order.STATUS_CHOICES],
+                            help='Only orders with this status (repeatable).')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Orders fetched per round trip.')
+
+    def handle(self, *args, **options):
+        orders = filter_orders(
+            created_from=_parse_moment(options['created_from']) if options['created_from'] else None,
+            created_to=_parse_moment(options['created_to']) if options['created_to'] else None,
+            statuses=options['status'],
+        )
+        pieces = stream_orders(orders, options['format'], options['chunk_size'])
+        if not options['output']:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            output.writelines(pieces)
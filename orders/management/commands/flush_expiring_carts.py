@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from orders.cart_store import flush_expiring_carts
+
+
+class Command(BaseCommand):
+    help = ('Write stored carts that are about to expire into Cart/CartItem. '
+            'The orders.flush_expiring_carts beat task does the same every 15 minutes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--within', type=int, default=60 * 60,
+                            help='Flush carts expiring in the next WITHIN seconds (default: 3600).')
+
+    def handle(self, *args, **options):
+        flushed = flush_expiring_carts(options['within'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} cart(s).'))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.bench import StorefrontSeeder
+
+
+class Command(BaseCommand):
+    help = ('Seed a storefront of the given size for bench_storefront: categories, products with '
+            'stock, users (password "bench"), active carts and past orders. Rows are named after '
+            '--prefix; running it again with larger numbers only adds the missing rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--items-per-cart', type=int, default=3)
+        parser.add_argument('--orders-per-user', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['items_per_cart'] > options['products']:
+            raise CommandError('--items-per-cart cannot exceed --products.')
+        started = time.perf_counter()
+        seeder = StorefrontSeeder(prefix=options['prefix'], seed=options['seed'],
+                                  batch_size=options['batch_size'], log=self.stdout.write)
+        products = seeder.seed(
+            products=options['products'],
+            users=options['users'],
+            categories=options['categories'],
+            items_per_cart=options['items_per_cart'],
+            orders_per_user=options['orders_per_user'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{products} products, {options["users"]} users '
+            f'(seeded in {time.perf_counter() - started:.1f}s)'
+        ))
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:34
+
+from django.db import migrations, models
+from django.db.models import Prefetch
+
+
+def backfill_item_summary(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    orders = Order.objects.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+    batch = []
+    for order in orders.iterator(chunk_size=1000):
+        items = list(order.items.all())
+        order.item_count = sum(item.quantity for item in items)
+        order.item_summary = [
+            {
+                'product': item.product.name if item.product else None,
+                'quantity': item.quantity,
+                'price': str(item.price),
+            }
+            for item in items
+        ]
+        batch.append(order)
+        if len(batch) >= 1000:
+            Order.objects.bulk_update(batch, ['item_count', 'item_summary'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['item_count', 'item_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_order_user_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_summary',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill_item_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_item_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checkout_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='checkout_status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='COMPLETED', max_length=20),
+        ),
+    ]
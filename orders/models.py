@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import UniqueConstraint
 from django.db.models import Sum, F
@@ -13,6 +14,10 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # running totals of the items, updated in the same transaction as every
+    # item write (see orders.cart_store and manage.py check_cart_totals)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    item_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-updated_at']
@@ -27,10 +32,16 @@ class Cart(models.Model):
     #         total += item.get_total_price()
     #     return total
     
-    # Optimized version for get_total_price function (using aggregation)
     def get_total_price(self):
-        total = self.items.aggregate(total_price=Sum(F('quantity') * F('price'), output_field=models.DecimalField()))['total_price']
-        return total if total is not None else Decimal('0.00')
+        return self.subtotal
+
+    def calculate_totals(self):
+        """Aggregate ``(subtotal, item_count)`` from the items, for repairs."""
+        totals = self.items.aggregate(
+            subtotal=Sum(F('quantity') * F('price'), output_field=models.DecimalField()),
+            item_count=Sum('quantity')
+        )
+        return totals['subtotal'] or Decimal('0.00'), totals['item_count'] or 0
 
 
 class CartItem(models.Model):
@@ -61,11 +72,22 @@ class Order(models.Model):
         ('COMPLETED', 'Completed'),
         ('CANCELLED', 'Cancelled'),
     ]
+    # progress of an API checkout, which places the order on a Celery worker
+    CHECKOUT_STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
 
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name="orders")
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    checkout_status = models.CharField(max_length=20, choices=CHECKOUT_STATUS_CHOICES, default='COMPLETED')
+    checkout_error = models.TextField(blank=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # denormalized copy of the line items, so history lists never touch OrderItem
+    item_count = models.PositiveIntegerField(default=0)
+    item_summary = models.JSONField(default=list, blank=True)
     # TODO: seperate out the "Address" model later
     shipping_address = models.TextField(blank=True)
     billing_address = models.TextField(blank=True)
@@ -73,6 +95,12 @@ class Order(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Orders"
+        indexes = [
+            # keyset pagination of a user's order history
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_id_idx'),
+            # date-range exports, see orders.exports
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username} - Status: {self.get_status_display()}"
@@ -88,6 +116,19 @@ class Order(models.Model):
         total = self.items.aggregate(total_price=Sum(F('quantity') * F('price'), output_field=models.DecimalField()))['total_price']
         return total if total is not None else Decimal('0.00')
 
+    def set_item_summary(self, items):
+        # items need their product loaded (select_related) to avoid a query per line
+        items = list(items)
+        self.item_count = sum(item.quantity for item in items)
+        self.item_summary = [
+            {
+                'product': item.product.name if item.product else None,
+                'quantity': item.quantity,
+                'price': str(item.price),
+            }
+            for item in items
+        ]
+
     # def save(self, *args, **kwargs):
         # self.total_price = self.calculate_total_price()
         # super().save(*args, **kwargs)
@@ -112,3 +153,22 @@ class OrderItem(models.Model):
     @property
     def get_total_price(self):
         return self.quantity * self.price
+
+
+class IdempotencyRecord(models.Model):
+    # database fallback of orders.idempotency, see IDEMPOTENCY_STORE
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name="idempotency_records")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="Hash of the method, path and body of the first request.")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Empty while in progress.")
+    response_data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key')
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of user {self.user_id}"
@@ -1,28 +1,23 @@
 from rest_framework import serializers
 
-from .models import Cart, CartItem, Order, OrderItem
+from .models import Order, OrderItem
 from products.models import Product
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartLineSerializer(serializers.Serializer):
+    # lines are addressed by product id, see orders.cart_store
+    id = serializers.IntegerField(source='product_id', read_only=True)
     product = serializers.ReadOnlyField(source='product.name')
+    quantity = serializers.IntegerField(read_only=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
-    class Meta:
-        model = CartItem
-        fields = ['id', 'product', 'quantity', 'price']
 
-    
-class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
-    total_price = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Cart
-        fields = ['id', 'user', 'items', 'total_price', 'is_active']
-        read_only_fields = ['user', 'is_active']
-
-    def get_total_price(self, obj):
-        return obj.get_total_price()
+class CartSnapshotSerializer(serializers.Serializer):
+    user = serializers.IntegerField(source='user_id', read_only=True)
+    items = CartLineSerializer(many=True, read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+    total_price = serializers.DecimalField(source='get_total_price', max_digits=10, decimal_places=2,
+                                           read_only=True)
 
 
 class AddCartItemSerializer(serializers.Serializer):
@@ -30,6 +25,10 @@ class AddCartItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1)
 
 
+class AddCartItemsSerializer(serializers.Serializer):
+    items = AddCartItemSerializer(many=True, allow_empty=False, max_length=200)
+
+
 class UpdateCartItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1)
 
@@ -43,13 +42,20 @@ class OrderItemSerializer(serializers.ModelSerializer):
     
 
 class OrderSerializer(serializers.ModelSerializer):
+    # serve the total persisted at checkout instead of aggregating the items
     items = OrderItemSerializer(many=True, read_only=True)
-    total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
         fields = ['id', 'user', 'shipping_address', 'billing_address',
                   'status', 'created_at', 'total_price', 'items']
-        
-    def get_total_price(self, obj):
-        return obj.get_total_price()
+        read_only_fields = ['total_price']
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    # built from the denormalized columns only, never touches OrderItem
+
+    class Meta:
+        model = Order
+        fields = ['id', 'status', 'created_at', 'total_price', 'item_count', 'item_summary']
+        read_only_fields = fields
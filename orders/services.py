@@ -0,0 +1,146 @@
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+
+from products.inventory import InsufficientStockError, commit_stock, reserve_stock
+from .cart_store import get_cart_store
+from .models import Cart, Order, OrderItem
+
+
+def _fill_order(order, cart):
+    # snapshot the cart lines once, in the same order the rows get locked
+    cart_items = list(cart.items.select_related('product').order_by('product_id'))
+    quantities = {item.product_id: item.quantity for item in cart_items}
+
+    commit_stock(order.user, quantities)
+
+    order.total_price = sum((item.quantity * item.price for item in cart_items), Decimal('0.00'))
+    order.set_item_summary(cart_items)
+    order.save()
+
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=item.product_id, quantity=item.quantity, price=item.price)
+        for item in cart_items
+    ])
+
+
+def place_order(user, cart, shipping_address='', billing_address=''):
+    """
+    Turn ``cart`` into an ``Order`` with a fixed number of queries.
+
+    The stock of every line is taken with ``products.inventory.commit_stock``,
+    which locks the Inventory rows in product id order, validates the whole
+    cart (counting the user's own checkout holds) and decrements it with one
+    set-based UPDATE. The order items are inserted with a single bulk insert.
+    Raises ``InsufficientStockError`` without writing anything if any line
+    would oversell.
+    """
+    with transaction.atomic():
+        order = Order(
+            user=user,
+            shipping_address=shipping_address,
+            billing_address=billing_address,
+            status='PENDING'
+        )
+        _fill_order(order, cart)
+
+        # deactivate the cart
+        cart.is_active = False
+        cart.save(update_fields=['is_active', 'updated_at'])
+
+    return order
+
+
+def place_order_from_store(user, shipping_address='', billing_address=''):
+    """
+    Materialize the user's stored cart into ``Cart``/``CartItem`` and place the
+    order from it. Only once the order exists are the ordered lines taken out
+    of the stored cart, so anything added meanwhile stays in it.
+    """
+    store = get_cart_store()
+    with transaction.atomic():
+        cart = store.materialize(user.pk)
+        order = place_order(user, cart, shipping_address=shipping_address, billing_address=billing_address)
+    store.discard_materialized(user.pk, cart)
+    return order
+
+
+def enqueue_order(user, shipping_address='', billing_address=''):
+    """
+    Freeze the user's stored cart and queue the order for a Celery worker.
+
+    Only the cart materialization and an empty ``QUEUED`` order are written on
+    the request path; ``place_queued_order`` does the rest. Returns the order
+    and the id of the task that will place it.
+    """
+    from .tasks import place_queued_order
+
+    store = get_cart_store()
+    with transaction.atomic():
+        cart = store.materialize(user.pk)
+        # new additions go to a fresh cart from now on
+        cart.is_active = False
+        cart.save(update_fields=['is_active', 'updated_at'])
+        order = Order.objects.create(
+            user=user,
+            shipping_address=shipping_address,
+            billing_address=billing_address,
+            status='PENDING',
+            checkout_status='QUEUED'
+        )
+        task_id = str(uuid.uuid4())
+        # don't let a worker look for the order before it is committed
+        transaction.on_commit(lambda: place_queued_order.apply_async((order.pk, cart.pk), task_id=task_id))
+    store.discard_materialized(user.pk, cart)
+    return order, task_id
+
+
+def fulfil_queued_order(order_id, cart_id):
+    """
+    Place a ``QUEUED`` order from its frozen cart. Safe to run more than once:
+    an order that is no longer queued is left alone.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().select_related('user').get(pk=order_id)
+        if order.checkout_status != 'QUEUED':
+            return order
+        cart = Cart.objects.get(pk=cart_id)
+        try:
+            with transaction.atomic():
+                _fill_order(order, cart)
+        except InsufficientStockError as e:
+            _fail_order(order, cart, str(e))
+            return order
+
+        order.checkout_status = 'COMPLETED'
+        order.save(update_fields=['checkout_status'])
+    return order
+
+
+def fail_queued_order(order_id, cart_id, error):
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.checkout_status == 'QUEUED':
+            _fail_order(order, Cart.objects.get(pk=cart_id), error)
+    return order
+
+
+def _fail_order(order, cart, error):
+    order.status = 'CANCELLED'
+    order.checkout_status = 'FAILED'
+    order.checkout_error = error
+    order.save(update_fields=['status', 'checkout_status', 'checkout_error'])
+    # hand the lines back, merged into whatever the user has added since
+    lines = list(cart.items.values_list('product_id', 'quantity', 'price'))
+    if lines:
+        get_cart_store().add_many(order.user_id, lines)
+
+
+def reserve_cart(user):
+    """
+    Hold the stock of the user's stored cart while they go through checkout.
+    Returns the expiry time of the hold; raises ``InsufficientStockError``.
+    """
+    quantities = {line.product_id: line.quantity for line in get_cart_store().get_lines(user.pk)}
+    return reserve_stock(user, quantities)
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from products.models import Product
+from .models import Cart, CartItem
+
+
+@receiver(pre_delete, sender=Product)
+def remember_carts_of_product(sender, instance, **kwargs):
+    # the cascade removes the product's cart items without touching Cart
+    instance._cart_ids = list(CartItem.objects.filter(product=instance).values_list('cart_id', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def recount_carts_of_product(sender, instance, **kwargs):
+    carts = list(Cart.objects.filter(pk__in=getattr(instance, '_cart_ids', [])))
+    for cart in carts:
+        cart.subtotal, cart.item_count = cart.calculate_totals()
+    Cart.objects.bulk_update(carts, ['subtotal', 'item_count'])
@@ -0,0 +1,37 @@
+from celery import Task, shared_task
+from django.db import OperationalError
+
+from .cart_store import flush_expiring_carts as flush_carts
+from .idempotency import purge_expired_records
+from .services import fail_queued_order, fulfil_queued_order
+
+
+class PlaceOrderTask(Task):
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        # out of retries: don't leave the order queued forever
+        order_id, cart_id = args
+        fail_queued_order(order_id, cart_id, 'Your order could not be placed, please try again.')
+
+
+@shared_task(
+    base=PlaceOrderTask,
+    name='orders.place_queued_order',
+    # lock timeouts, deadlocks and lost connections are worth another try
+    autoretry_for=(OperationalError,),
+    retry_backoff=True,
+    max_retries=5,
+    acks_late=True,
+)
+def place_queued_order(order_id, cart_id):
+    order = fulfil_queued_order(order_id, cart_id)
+    return {'order_id': order.pk, 'checkout_status': order.checkout_status}
+
+
+@shared_task(name='orders.purge_idempotency_records')
+def purge_idempotency_records():
+    return purge_expired_records()
+
+
+@shared_task(name='orders.flush_expiring_carts')
+def flush_expiring_carts(within=60 * 60):
+    return flush_carts(within)
@@ -0,0 +1,101 @@
+"""
+The storefront benchmark scenarios (``orders.bench``) against a seeded store,
+at each scale in ``SCALES``.
+
+The query counts are checked against ``bench_baseline.json``. They must not
+grow with the store, so every scale is held to the same counts. The
+baseline records the database it was taken on (``"database"``). A count
+taken on another vendor, e.g. PostgreSQL, where the per-view statement
+timeouts add queries, is not compared, only checked for failed requests.
+Timings depend on the machine and are only compared by
+``manage.py bench_storefront``.
+
+Only the smallest scale runs by default; pick others with
+``pytest -m benchmark --bench-scales=1k,100k,1m``. After a change that is
+meant to alter the counts, rewrite the baseline with
+``pytest -m benchmark --save-bench-baseline``.
+"""
+import json
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from orders.bench import SCENARIOS, StorefrontBench, StorefrontSeeder, compare
+
+pytestmark = pytest.mark.benchmark
+
+BASELINE = Path(__file__).with_name('bench_baseline.json')
+# the metrics that are the same on every machine
+BASELINE_METRICS = ('queries',)
+
+# rows seeded per scale: the request's 1k, 100k and 1M products
+SCALES = {
+    '1k': {'products': 1_000, 'users': 50, 'categories': 10},
+    '100k': {'products': 100_000, 'users': 1_000, 'categories': 50},
+    '1m': {'products': 1_000_000, 'users': 10_000, 'categories': 200},
+}
+
+
+@pytest.fixture(scope='module', params=SCALES)
+def seeded(request, django_db_setup, django_db_blocker):
+    """The store at one scale, seeded once for all the scenarios and flushed afterwards."""
+    scale = request.param
+    if scale not in request.config.getoption('bench_scales').split(','):
+        pytest.skip(f'scale {scale} not selected with --bench-scales')
+    with django_db_blocker.unblock():
+        StorefrontSeeder(prefix='bench', batch_size=10_000).seed(**SCALES[scale])
+        yield scale
+        call_command('flush', interactive=False, verbosity=0)
+
+
+@pytest.fixture
+def storefront(seeded, db, settings):
+    # the query counts of the cart endpoints depend on the cart store
+    settings.CART_STORE_BACKEND = 'orders.cart_store.DatabaseCartStore'
+    # few enough users that their cached logins are warm at every scale, as in the baseline
+    return StorefrontBench(prefix='bench', users=20)
+
+
+@pytest.fixture(scope='session')
+def bench_results(pytestconfig):
+    results = {}
+    yield results
+    if pytestconfig.getoption('save_bench_baseline') and results:
+        baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {'results': {}}
+        if baseline.get('database') != connection.vendor:
+            baseline = {'results': {}}
+        baseline['database'] = connection.vendor
+        for name, result in results.items():
+            baseline['results'][name] = {metric: result[metric] for metric in BASELINE_METRICS}
+        BASELINE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+def test_scenario(storefront, seeded, scenario, bench_results, pytestconfig):
+    result = storefront.run(scenario, requests=20, warmup=3, profile_requests=5)
+    # the largest scale seeded wins; the counts must be the same anyway
+    bench_results[scenario] = result
+
+    assert result['errors'] == 0
+    if pytestconfig.getoption('save_bench_baseline'):
+        return
+    baseline = json.loads(BASELINE.read_text())
+    if baseline['database'] != connection.vendor:
+        pytest.skip(f"the baseline query counts were taken on {baseline['database']}")
+    assert scenario in baseline['results'], f'no baseline for {scenario}, run with --save-bench-baseline'
+    assert compare({scenario: result}, baseline['results'], threshold=0) == []
+
+
+def test_compare_reports_regressions():
+    baseline = {'product_list': {'queries': 2, 'p50_ms': 10.0}}
+    result = {'queries': 3, 'p50_ms': 11.0, 'p95_ms': 99.0, 'peak_alloc_kib': 1.0, 'errors': 0}
+
+    assert compare({'product_list': result}, baseline, threshold=0.2) == ['product_list: queries 2 -> 3']
+    assert compare({'product_list': result}, baseline, threshold=0.05) == [
+        'product_list: p50_ms 10.0 -> 11.0',
+        'product_list: queries 2 -> 3',
+    ]
+    # scenarios missing from the baseline aren't compared
+    assert compare({'checkout_api': result}, baseline, threshold=0) == []
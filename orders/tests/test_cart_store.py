@@ -0,0 +1,186 @@
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+
+from orders.cart_store import (DatabaseCartStore, InMemoryCartStore, RedisCartStore, flush_expiring_carts,
+                               get_cart_store)
+from orders.models import Cart
+
+
+def _redis_store():
+    if not settings.REDIS_URL:
+        pytest.skip('needs REDIS_URL')
+    return RedisCartStore()
+
+
+BACKENDS = {
+    'database': DatabaseCartStore,
+    'memory': InMemoryCartStore,
+    'redis': _redis_store,
+}
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, user):
+    store = BACKENDS[request.param]()
+    store.clear(user.pk)
+    yield store
+    store.clear(user.pk)
+
+
+def _quantities(store, user):
+    return {line.product_id: line.quantity for line in store.get_lines(user.pk)}
+
+
+def test_add(store, user, make_product):
+    product = make_product(price='2.50')
+
+    assert store.add(user.pk, product.pk, 2, product.price) == (2, True)
+    assert store.add(user.pk, product.pk, 3, Decimal('9.99')) == (5, False)
+
+    [line] = store.get_lines(user.pk)
+    assert (line.product_id, line.quantity) == (product.pk, 5)
+    # the price captured by the first add is kept
+    assert line.price == Decimal('2.50')
+
+
+def test_add_many(store, user, make_product):
+    first, second = make_product(), make_product()
+    store.add(user.pk, first.pk, 1, first.price)
+
+    result = store.add_many(user.pk, [
+        (first.pk, 2, first.price),
+        (second.pk, 1, second.price),
+        (second.pk, 4, second.price),
+    ])
+
+    assert result == {first.pk: (3, False), second.pk: (5, True)}
+    assert _quantities(store, user) == {first.pk: 3, second.pk: 5}
+
+
+def test_set_quantity(store, user, make_product):
+    product, missing = make_product(), make_product()
+    store.add(user.pk, product.pk, 1, product.price)
+
+    assert store.set_quantity(user.pk, product.pk, 7) is True
+    assert store.set_quantity(user.pk, missing.pk, 7) is False
+    assert _quantities(store, user) == {product.pk: 7}
+
+
+def test_remove(store, user, make_product):
+    first, second = make_product(), make_product()
+    store.add_many(user.pk, [(first.pk, 1, first.price), (second.pk, 2, second.price)])
+
+    assert store.remove(user.pk, first.pk) is True
+    assert store.remove(user.pk, first.pk) is False
+    assert _quantities(store, user) == {second.pk: 2}
+
+
+def test_load(store, user, make_product):
+    first, second, deleted = make_product(price='1.50'), make_product(price='2.00'), make_product()
+    store.add_many(user.pk, [
+        (first.pk, 2, first.price),
+        (second.pk, 1, second.price),
+        (deleted.pk, 1, deleted.price),
+    ])
+    deleted.delete()
+
+    snapshot = store.load(user.pk)
+
+    assert [line.product for line in snapshot.items] == [first, second]
+    assert snapshot.item_count == 3
+    assert snapshot.get_total_price() == Decimal('5.00')
+
+
+def test_clear(store, user, make_product):
+    product = make_product()
+    store.add(user.pk, product.pk, 1, product.price)
+
+    store.clear(user.pk)
+
+    assert store.get_lines(user.pk) == []
+    assert not store.load(user.pk)
+
+
+def test_materialize_writes_the_cart(store, user, make_product):
+    first, second = make_product(price='1.50'), make_product(price='2.00')
+    store.add_many(user.pk, [(first.pk, 2, first.price), (second.pk, 1, second.price)])
+
+    cart = store.materialize(user.pk)
+
+    assert sorted(cart.items.values_list('product_id', 'quantity')) == [(first.pk, 2), (second.pk, 1)]
+    cart.refresh_from_db()
+    assert (cart.item_count, cart.subtotal) == (3, Decimal('5.00'))
+
+
+def test_discarding_an_ordered_cart_keeps_later_additions(store, user, make_product):
+    first, second, third = make_product(), make_product(), make_product()
+    store.add_many(user.pk, [(first.pk, 2, first.price), (second.pk, 1, second.price)])
+    cart = store.materialize(user.pk)
+    # what placing the order does to it
+    cart.is_active = False
+    cart.save(update_fields=['is_active'])
+
+    store.add_many(user.pk, [(first.pk, 1, first.price), (third.pk, 1, third.price)])
+    store.discard_materialized(user.pk, cart)
+
+    assert _quantities(store, user) == {first.pk: 1, third.pk: 1}
+
+
+def test_discarding_the_whole_cart_empties_it(store, user, make_product):
+    product = make_product()
+    store.add(user.pk, product.pk, 2, product.price)
+    cart = store.materialize(user.pk)
+    cart.is_active = False
+    cart.save(update_fields=['is_active'])
+
+    store.discard_materialized(user.pk, cart)
+
+    assert store.get_lines(user.pk) == []
+
+
+def test_flush_doesnt_extend_the_cart(settings, user, make_product):
+    settings.CART_STORE_BACKEND = 'orders.cart_store.InMemoryCartStore'
+    settings.CART_TTL = 60
+    product = make_product()
+    store = get_cart_store()
+    store.add(user.pk, product.pk, 2, product.price)
+    expires_at = store._carts[user.pk]['expires_at']
+
+    assert flush_expiring_carts(within=60 * 60) == 1
+
+    assert store._carts[user.pk]['expires_at'] == expires_at
+    assert Cart.objects.get(user=user, is_active=True).items.get().quantity == 2
+    # flushed once, until the cart is used again
+    assert flush_expiring_carts(within=60 * 60) == 0
+
+
+@pytest.mark.parametrize('changes', [
+    [('add', 1, 2)],
+    [('add', 1, 2), ('add', 1, 3)],
+    [('add_many', [(1, 1), (2, 4), (2, 1)])],
+    [('add_many', [(1, 2), (2, 1)]), ('set_quantity', 2, 6)],
+    [('add_many', [(1, 2), (2, 1)]), ('remove', 1)],
+    [('add_many', [(1, 2), (2, 1)]), ('set_quantity', 1, 1), ('remove', 2), ('add', 2, 3)],
+])
+def test_database_cart_totals_match_the_items(user, make_product, changes):
+    store = DatabaseCartStore()
+    products = {1: make_product(price='2.50'), 2: make_product(price='4.00')}
+
+    for change, *args in changes:
+        if change == 'add_many':
+            store.add_many(user.pk, [(products[key].pk, quantity, products[key].price) for key, quantity in args[0]])
+        elif change == 'add':
+            key, quantity = args
+            store.add(user.pk, products[key].pk, quantity, products[key].price)
+        elif change == 'set_quantity':
+            key, quantity = args
+            store.set_quantity(user.pk, products[key].pk, quantity)
+        else:
+            store.remove(user.pk, products[args[0]].pk)
+
+    cart = Cart.objects.get(user=user, is_active=True)
+    items = list(cart.items.all())
+    assert cart.item_count == sum(item.quantity for item in items)
+    assert cart.subtotal == sum((item.quantity * item.price for item in items), Decimal('0.00'))
@@ -0,0 +1,120 @@
+"""API checkouts: queued on the request, placed by the Celery task (run eagerly here)."""
+import pytest
+from django.db import OperationalError
+
+from orders.cart_store import get_cart_store
+from orders.models import Cart, Order
+from orders.services import fulfil_queued_order
+from orders.tasks import place_queued_order
+from products.models import Inventory
+
+
+@pytest.fixture(autouse=True)
+def _eager(celery_eager):
+    pass
+
+
+@pytest.fixture
+def task_errors_caught(settings):
+    # an eager task that propagates its errors raises before retrying or
+    # calling on_failure; a worker doesn't propagate them either
+    settings.CELERY_TASK_EAGER_PROPAGATES = False
+
+
+@pytest.fixture
+def cart(api_client, make_product):
+    """Two products in the user's cart: 2 x 5.00 and 1 x 7.50."""
+    products = [make_product(price='5.00', stock=10), make_product(price='7.50', stock=10)]
+    for product, quantity in zip(products, [2, 1]):
+        response = api_client.post('/orders/api/cart/add/', {'product_id': product.pk, 'quantity': quantity})
+        assert response.status_code == 201
+    return products
+
+
+def _checkout(api_client, django_capture_on_commit_callbacks):
+    # the task is queued on commit: run it like the worker would
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post('/orders/api/checkout/', {'shipping_address': '1 Main St'})
+    assert response.status_code == 202
+    assert response.data['checkout_status'] == 'QUEUED'
+    return response
+
+
+def _poll(api_client, status_url):
+    for _attempt in range(3):
+        response = api_client.get(status_url)
+        assert response.status_code == 200
+        if response.data['checkout_status'] != 'QUEUED':
+            return response.data
+    pytest.fail('the order is still queued')
+
+
+def _stock(product):
+    return Inventory.objects.get(product=product).stock_quantity
+
+
+def test_checkout_is_completed_by_the_task(api_client, user, cart, django_capture_on_commit_callbacks):
+    response = _checkout(api_client, django_capture_on_commit_callbacks)
+
+    data = _poll(api_client, response.data['status_url'])
+    assert data['checkout_status'] == 'COMPLETED'
+    assert data['error'] is None
+    assert data['order']['total_price'] == '17.50'
+    assert [_stock(product) for product in cart] == [8, 9]
+    assert get_cart_store().get_lines(user.pk) == []
+    assert not Cart.objects.filter(user=user, is_active=True).exists()
+
+
+def test_out_of_stock_order_fails_and_gives_the_cart_back(api_client, user, cart,
+                                                          django_capture_on_commit_callbacks):
+    Inventory.objects.filter(product=cart[0]).update(stock_quantity=1)
+
+    response = _checkout(api_client, django_capture_on_commit_callbacks)
+
+    data = _poll(api_client, response.data['status_url'])
+    assert data['checkout_status'] == 'FAILED'
+    assert cart[0].name in data['error']
+    assert data['order'] is None
+    order = Order.objects.get(pk=response.data['order_id'])
+    assert order.status == 'CANCELLED'
+    assert not order.items.exists()
+    # nothing was taken from stock, and the lines are back in the cart
+    assert [_stock(product) for product in cart] == [1, 10]
+    lines = get_cart_store().get_lines(user.pk)
+    assert [(line.product_id, line.quantity) for line in lines] == [(cart[0].pk, 2), (cart[1].pk, 1)]
+
+
+def test_a_database_error_is_retried(api_client, cart, monkeypatch, task_errors_caught,
+                                     django_capture_on_commit_callbacks):
+    calls = []
+
+    def flaky_fulfil(order_id, cart_id):
+        calls.append(order_id)
+        if len(calls) == 1:
+            raise OperationalError('deadlock detected')
+        return fulfil_queued_order(order_id, cart_id)
+    monkeypatch.setattr('orders.tasks.fulfil_queued_order', flaky_fulfil)
+
+    response = _checkout(api_client, django_capture_on_commit_callbacks)
+
+    assert len(calls) == 2
+    assert _poll(api_client, response.data['status_url'])['checkout_status'] == 'COMPLETED'
+
+
+def test_an_order_out_of_retries_fails(api_client, user, cart, monkeypatch, task_errors_caught,
+                                       django_capture_on_commit_callbacks):
+    calls = []
+
+    def broken_fulfil(order_id, cart_id):
+        calls.append(order_id)
+        raise OperationalError('connection lost')
+    monkeypatch.setattr('orders.tasks.fulfil_queued_order', broken_fulfil)
+
+    response = _checkout(api_client, django_capture_on_commit_callbacks)
+
+    # the first try and max_retries more
+    assert len(calls) == 1 + place_queued_order.max_retries
+    data = _poll(api_client, response.data['status_url'])
+    assert data['checkout_status'] == 'FAILED'
+    assert data['error'] == 'Your order could not be placed, please try again.'
+    assert len(get_cart_store().get_lines(user.pk)) == 2
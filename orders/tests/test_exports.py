@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from orders.exports import ITEM_COLUMNS, ORDER_COLUMNS, filter_orders, stream_orders
+from orders.models import Order, OrderItem
+
+
+def _place(user, products, status='COMPLETED'):
+    order = Order.objects.create(user=user, status=status)
+    items = OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, quantity=2, price=product.price) for product in products
+    ])
+    order.total_price = sum((item.get_total_price for item in items), Decimal('0.00'))
+    order.item_count = sum(item.quantity for item in items)
+    order.save()
+    return order
+
+
+@pytest.fixture
+def orders(user, django_user_model, make_product):
+    mug, plate = make_product(name='Mug', slug='mug', price='5.00'), make_product(name='Plate', slug='plate')
+    bob = django_user_model.objects.create_user('bob', 'bob@example.com', 'pass-word-1')
+    return [_place(user, [mug, plate]), _place(bob, [plate]), _place(user, [mug], status='CANCELLED')]
+
+
+def _read_csv(pieces):
+    return list(csv.DictReader(io.StringIO(''.join(pieces))))
+
+
+def test_csv_has_a_row_per_item(orders):
+    first = orders[0]
+
+    rows = _read_csv(stream_orders(filter_orders(), 'csv'))
+
+    assert list(rows[0]) == ORDER_COLUMNS + ITEM_COLUMNS
+    assert [(int(row['order_id']), row['product_slug']) for row in rows] == [
+        (first.pk, 'mug'), (first.pk, 'plate'), (orders[1].pk, 'plate'), (orders[2].pk, 'mug'),
+    ]
+    assert rows[0]['username'] == 'alice'
+    assert (rows[0]['quantity'], rows[0]['price'], rows[0]['line_total']) == ('2', '5.00', '10.00')
+    assert rows[0]['total_price'] == str(first.total_price)
+
+
+def test_ndjson_has_a_line_per_order(orders):
+    records = [json.loads(line) for line in stream_orders(filter_orders(statuses=['COMPLETED']), 'ndjson')]
+
+    assert [record['order_id'] for record in records] == [orders[0].pk, orders[1].pk]
+    assert [item['product_name'] for item in records[0]['items']] == ['Mug', 'Plate']
+
+
+def test_the_admin_exports_only_the_selected_orders(client, orders, django_user_model):
+    admin = django_user_model.objects.create_superuser('admin', 'admin@example.com', 'pass-word-1')
+    client.force_login(admin)
+    alices = [order.pk for order in orders if order.user.username == 'alice']
+
+    response = client.post('/admin/orders/order/', {'action': 'export_csv', '_selected_action': alices})
+
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'text/csv'
+    assert response.streaming
+    rows = _read_csv(piece.decode() for piece in response.streaming_content)
+    assert {row['username'] for row in rows} == {'alice'}
+    assert sorted({int(row['order_id']) for row in rows}) == alices
+
+
+def test_orders_are_read_a_chunk_at_a_time(user, make_product):
+    product = make_product()
+    for _ in range(5):
+        _place(user, [product])
+
+    with CaptureQueriesContext(connection) as queries:
+        pieces = stream_orders(filter_orders(), 'csv', chunk_size=2)
+        next(pieces)  # the header
+        next(pieces)
+        # the first chunk is in, its items prefetched; nothing more yet
+        first_chunk = len(queries)
+        assert len(list(pieces)) == 4
+
+    item_queries = [query for query in queries.captured_queries if 'orders_orderitem' in query['sql']]
+    assert first_chunk == 2
+    # one items query per chunk of 2 orders, for 5 orders
+    assert len(item_queries) == 3
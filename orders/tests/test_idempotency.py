@@ -0,0 +1,121 @@
+import pytest
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from orders.cart_store import get_cart_store
+from orders.idempotency import HEADER, idempotent
+
+
+@pytest.fixture(params=['cache', 'db'], autouse=True)
+def idempotency_store(request, settings):
+    settings.IDEMPOTENCY_STORE = request.param
+    settings.IDEMPOTENCY_WAIT = 0
+    return request.param
+
+
+class CountingView:
+    """An ``@idempotent`` view answering with the given statuses in turn."""
+
+    def __init__(self, *statuses, during=None):
+        self.statuses = list(statuses)
+        self.calls = 0
+        # called with the request while the first call is running
+        self.during = during
+
+        @api_view(['POST'])
+        @idempotent
+        def view(request):
+            self.calls += 1
+            if self.during is not None and self.calls == 1:
+                self.during(request)
+            code = self.statuses.pop(0) if self.statuses else status.HTTP_201_CREATED
+            return Response({'call': self.calls}, status=code)
+        self.view = view
+
+    def __call__(self, user, data, key='key-1'):
+        request = APIRequestFactory().post('/things/', data, format='json', headers={HEADER: key})
+        force_authenticate(request, user)
+        return self.view(request)
+
+
+def test_a_replay_gets_the_stored_response(user):
+    view = CountingView()
+
+    first = view(user, {'a': 1})
+    replay = view(user, {'a': 1})
+
+    assert view.calls == 1
+    assert (replay.status_code, replay.data) == (first.status_code, first.data) == (201, {'call': 1})
+    assert replay['Idempotent-Replayed'] == 'true'
+
+
+def test_keys_are_per_user(user, django_user_model):
+    other = django_user_model.objects.create_user('bob', 'bob@example.com', 'pass-word-1')
+    view = CountingView()
+
+    view(user, {'a': 1})
+    response = view(other, {'a': 1})
+
+    assert view.calls == 2
+    assert response.data == {'call': 2}
+
+
+def test_the_same_key_for_another_request_is_rejected(user):
+    view = CountingView()
+    view(user, {'a': 1})
+
+    response = view(user, {'a': 2})
+
+    assert response.status_code == 422
+    assert view.calls == 1
+
+
+def test_a_server_error_releases_the_key(user):
+    view = CountingView(status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    assert view(user, {'a': 1}).status_code == 503
+    retry = view(user, {'a': 1})
+
+    assert view.calls == 2
+    assert retry.status_code == 201
+    assert not retry.has_header('Idempotent-Replayed')
+
+
+def _crash(request):
+    raise RuntimeError('boom')
+
+
+def test_an_exception_releases_the_key(user):
+    view = CountingView(during=_crash)
+
+    with pytest.raises(RuntimeError):
+        view(user, {'a': 1})
+
+    assert view(user, {'a': 1}).status_code == 201
+    assert view.calls == 2
+
+
+def test_a_duplicate_of_a_request_in_flight_is_a_conflict(user):
+    duplicates = []
+    view = CountingView(during=lambda request: duplicates.append(view(user, {'a': 1})))
+
+    first = view(user, {'a': 1})
+
+    assert first.status_code == 201
+    assert [response.status_code for response in duplicates] == [409]
+    assert view.calls == 1
+    # once the first request is done, its response is replayed
+    assert view(user, {'a': 1}).data == {'call': 1}
+
+
+def test_a_retried_cart_addition_is_applied_once(api_client, user, make_product):
+    product = make_product()
+    for _attempt in range(2):
+        response = api_client.post('/orders/api/cart/add/', {'product_id': product.pk, 'quantity': 2},
+                                   headers={HEADER: 'add-1'})
+        assert response.status_code == 201
+
+    [line] = get_cart_store().get_lines(user.pk)
+    assert line.quantity == 2
@@ -0,0 +1,36 @@
+"""Order history takes a fixed number of queries, however many orders a page shows."""
+from decimal import Decimal
+
+import pytest
+from rest_framework.test import APIClient
+
+from config.pagination import CreatedAtCursorPagination
+from orders.models import Order, OrderItem
+
+
+@pytest.fixture
+def history(user, make_product):
+    products = [make_product() for _ in range(3)]
+    for _ in range(60):
+        order = Order.objects.create(user=user, total_price=Decimal('30.00'))
+        order.items.set([OrderItem(product=product, quantity=1, price=product.price) for product in products],
+                        bulk=False)
+        order.set_item_summary(order.items.select_related('product'))
+        order.save()
+
+
+@pytest.mark.parametrize('page_size', [1, 50])
+@pytest.mark.parametrize('view, queries', [
+    ('', 2),  # the orders, then their items joined with the products
+    ('summary', 1),  # the orders, with their stored totals and summaries
+])
+def test_order_history_api(user, history, page_size, view, queries, django_assert_num_queries):
+    client = APIClient()
+    client.force_authenticate(user)
+    params = {CreatedAtCursorPagination.page_size_query_param: page_size}
+    if view:
+        params['view'] = view
+    with django_assert_num_queries(queries):
+        response = client.get('/orders/api/history/', params)
+    assert response.status_code == 200
+    assert len(response.data['results']) == page_size
@@ -1,68 +1,63 @@
-from .models import Cart, CartItem, OrderItem, Order
-from products.models import Product, Inventory
+from .models import Order, OrderItem
+from products.models import Product
+from config.async_api import apaginate, async_api_view
+from config.conditional import conditional_get, make_etag
+from config.pagination import CreatedAtCursorPagination
+from config.query_analysis import query_budget
+from config.throttling import bucket_throttle
+from .cart_store import get_cart_store
 from .forms import OrderForm
-from .serializers import CartSerializer, AddCartItemSerializer, UpdateCartItemSerializer, OrderSerializer
-
+from .idempotency import idempotent
+from products.cache import aget_catalog_version, get_catalog_version
+from products.inventory import InsufficientStockError
+from users.authentication import CLAIMS_ONLY_AUTHENTICATION_CLASSES
+from .services import enqueue_order, place_order_from_store, reserve_cart
+from .serializers import (CartSnapshotSerializer, AddCartItemSerializer, AddCartItemsSerializer,
+                          UpdateCartItemSerializer, OrderSerializer,
+                          OrderSummarySerializer)
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST, require_GET
-from django.db import IntegrityError, transaction
-from django.db.models import F
+from django.db.models import Prefetch
 
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
 
-def _get_or_create_cart(user):
-    cart, created = Cart.objects.get_or_create(user=user, is_active=True)
-    return cart
+def _parse_quantity(value, default=None):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
 
 @login_required
 @require_POST
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, pk=product_id)
-    cart = _get_or_create_cart(request.user)
 
     # get quantity from POST data, default to 1 if not present or invalid
-    quantity_str = request.POST.get('quantity', '1')
-    try:
-        quantity = int(quantity_str)
-        if quantity < 1:
-            quantity = 1
-    except (ValueError, TypeError):
+    quantity = _parse_quantity(request.POST.get('quantity', '1'), default=1)
+    if quantity < 1:
         quantity = 1
-    
-    # check if the product is already in the cart
-    cart_item = CartItem.objects.filter(cart=cart, product=product).first()
-    if cart_item:
-        cart_item.quantity += quantity
-        messages.success(request, f'Updated quantity for {product.name}!')
+
+    quantity, created = get_cart_store().add(request.user.pk, product.pk, quantity, product.price)
+    if created:
+        messages.success(request, f'Added {product.name} to cart!')
     else:
-        # create a new cart item
-        try:
-            cart_item = CartItem.objects.create(
-                cart=cart,
-                product=product,
-                quantity=quantity,
-                price=product.price
-            )
-            messages.success(request, f'Added {product.name} to cart!')
-        except IntegrityError:
-            # handle potential race conditions where another process adds the same item
-            cart_item = CartItem.objects.filter(cart=cart, product=product).first()
-            if cart_item:
-                cart_item.quantity += quantity
-                messages.success(request, f'Updated quantity for {product.name}!')
-    
-    cart_item.save()
+        messages.success(request, f'Updated quantity for {product.name}!')
     return redirect('orders:view_cart')
 
+@query_budget(6)
 @login_required
 def view_cart(request):
-    cart = _get_or_create_cart(request.user)
+    cart = get_cart_store().load(request.user.pk)
     context = {
         'cart': cart
     }
@@ -70,71 +65,60 @@ def view_cart(request):
 
 @login_required
 @require_POST
-def update_cart_item(request, item_id):
-    # ensure the cart item belongs to the user's active cart
-    cart = _get_or_create_cart(request.user)
-    cart_item = get_object_or_404(CartItem, pk=item_id, cart=cart)
+def update_cart_item(request, product_id):
+    store = get_cart_store()
 
     # get the quantity from POST data
     quantity_str = request.POST.get('quantity')
-    if quantity_str is not None:
-        try:
-            quantity = int(quantity_str)
-            if quantity <= 0:
-                cart_item.delete()
-                messages.warning(request, 'Item removed from cart.')
-            else:
-                # update to the specific quantity, not increment
-                cart_item.quantity = quantity
-                cart_item.save()
-                messages.success(request, 'Cart item updated successfully!')
-        except (ValueError, TypeError):
-            messages.error(request, 'Invalid quantity provided.')
-    else:
+    if quantity_str is None:
         messages.error(request, 'Quantity not provided.')
-    
+        return redirect('orders:view_cart')
+
+    quantity = _parse_quantity(quantity_str)
+    if quantity is None:
+        messages.error(request, 'Invalid quantity provided.')
+    elif quantity <= 0:
+        if not store.remove(request.user.pk, product_id):
+            raise Http404('No such item in your cart.')
+        messages.warning(request, 'Item removed from cart.')
+    else:
+        # update to the specific quantity, not increment
+        if not store.set_quantity(request.user.pk, product_id, quantity):
+            raise Http404('No such item in your cart.')
+        messages.success(request, 'Cart item updated successfully!')
+
     return redirect('orders:view_cart')
 
 @login_required
 def checkout(request):
-    cart = _get_or_create_cart(request.user)
+    cart = get_cart_store().load(request.user.pk)
 
-    if not cart.items.exists():
+    if not cart:
         messages.warning(request, 'Your cart is empty.')
         return redirect('orders:view_cart')
     
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
-            with transaction.atomic():
-                # create the Order object
-                order = form.save(commit=False)
-                order.user = request.user
-                order.total_price = cart.get_total_price()
-                order.status = 'PENDING'
-                order.save()
-
-                # create OrderItems from CartItems
-                for cart_item in cart.items.all():
-                    OrderItem.objects.create(
-                        order=order,
-                        product=cart_item.product,
-                        quantity=cart_item.quantity,
-                        price=cart_item.price
-                    )
-
-                    # update Inventory
-                    Inventory.objects.filter(product=cart_item.product).update(
-                        stock_quantity=F('stock_quantity') - cart_item.quantity
-                    )
-
-                # deactivate the cart
-                cart.is_active = False
-                cart.save()
+            try:
+                order = place_order_from_store(
+                    request.user,
+                    shipping_address=form.cleaned_data['shipping_address'],
+                    billing_address=form.cleaned_data['billing_address']
+                )
+            except InsufficientStockError as e:
+                messages.error(request, str(e))
+                return redirect('orders:view_cart')
 
             messages.success(request, 'Your order has been placed!')
             return redirect('orders:order_confirmation', order_id=order.id)        
     else: # GET request
+        # hold the stock while the user fills in the form
+        try:
+            reserve_cart(request.user)
+        except InsufficientStockError as e:
+            messages.error(request, str(e))
+            return redirect('orders:view_cart')
         form = OrderForm()
 
     context = {
@@ -162,15 +146,40 @@ def order_confirmation(request, order_id):
     }
     return render(request, 'orders/order_confirmation.html', context)
 
+def _cart_etag(request):
+    # the raw lines, without loading the products; their names and prices
+    # change with the catalog version
+    lines = get_cart_store().get_lines(request.user.pk)
+    return make_etag(get_catalog_version(), *[(line.product_id, line.quantity, line.price) for line in lines])
+
+@query_budget(5)
 @api_view(['GET'])
+@authentication_classes(CLAIMS_ONLY_AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
+@conditional_get(_cart_etag)
 def cart_detail_api(request):
-    cart, created = Cart.objects.get_or_create(user=request.user, is_active=True)
-    serializer = CartSerializer(cart)
+    cart = get_cart_store().load(request.user.pk)
+    serializer = CartSnapshotSerializer(cart)
     return Response(serializer.data)
 
+async def _acart_etag(request):
+    lines = await sync_to_async(get_cart_store().get_lines)(request.user.pk)
+    return make_etag(await aget_catalog_version(), *[(line.product_id, line.quantity, line.price) for line in lines])
+
+# async version, routed when settings.ASYNC_VIEWS is on
+@query_budget(5)
+@async_api_view(authentication_classes=CLAIMS_ONLY_AUTHENTICATION_CLASSES)
+@conditional_get(_acart_etag)
+async def cart_detail_api_async(request):
+    cart = await get_cart_store().aload(request.user.pk)
+    return JsonResponse(CartSnapshotSerializer(cart).data)
+
+# 10, and 5 more for an Idempotency-Key kept in the database (IDEMPOTENCY_STORE = 'db')
+@query_budget(15)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([bucket_throttle('cart')])
+@idempotent
 def add_to_cart_api(request):
     # use the serializer to validate the incoming data
     serializer = AddCartItemSerializer(data=request.data)
@@ -179,37 +188,45 @@ def add_to_cart_api(request):
     product_id = serializer.validated_data['product_id']
     quantity = serializer.validated_data['quantity']
 
-    # get the product and cart
     product = get_object_or_404(Product, pk=product_id)
-    cart = _get_or_create_cart(request.user)
+    quantity, created = get_cart_store().add(request.user.pk, product.pk, quantity, product.price)
 
-    # find or create the CartItem
-    cart_item = CartItem.objects.filter(cart=cart, product=product).first()
+    if created:
+        return Response({'message': f'Added {product.name} to cart!'},
+                        status=status.HTTP_201_CREATED)
+    return Response({'message': f'Updated quantity for {product.name} in cart!'},
+                    status=status.HTTP_200_OK)
 
-    if cart_item:
-        cart_item.quantity += quantity
-        cart_item.save()
-        return Response({'message': f'Updated quantity for {product.name} in cart!'},
-                        status=status.HTTP_200_OK)
-    else:
-        try:
-            cart_item = CartItem.objects.create(
-                cart=cart,
-                product=product,
-                quantity=quantity,
-                price=product.price
-            )
-            return Response({'message': f'Added {product.name} to cart!'},
-                            status=status.HTTP_201_CREATED)
-        except IntegrityError:
-            return Response({'error': 'Item already in cart.'},
-                            status=status.HTTP_409_CONFLICT)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([bucket_throttle('cart')])
+@idempotent
+def add_to_cart_batch_api(request):
+    # e.g. restoring a cart from a mobile client: all lines in one statement
+    serializer = AddCartItemsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data['items']
+
+    products = Product.objects.in_bulk([item['product_id'] for item in items])
+    missing = sorted({item['product_id'] for item in items} - products.keys())
+    if missing:
+        return Response({'error': 'Unknown products.', 'products': missing},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    result = get_cart_store().add_many(request.user.pk, [
+        (item['product_id'], item['quantity'], products[item['product_id']].price)
+        for item in items
+    ])
+    return Response({'items': [
+        {'product_id': product_id, 'quantity': quantity, 'created': created}
+        for product_id, (quantity, created) in result.items()
+    ]}, status=status.HTTP_200_OK)
 
 @api_view(['PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
-def update_cart_item_api(request, item_id):
-    cart = _get_or_create_cart(request.user)
-    cart_item = get_object_or_404(CartItem, pk=item_id, cart=cart)
+@idempotent
+def update_cart_item_api(request, product_id):
+    store = get_cart_store()
 
     if request.method == 'PUT':
         # use serializer to validate incoming data
@@ -217,70 +234,101 @@ def update_cart_item_api(request, item_id):
         serializer.is_valid(raise_exception=True)
 
         quantity = serializer.validated_data['quantity']
+        if not store.set_quantity(request.user.pk, product_id, quantity):
+            raise Http404('No such item in your cart.')
+        return Response({'message': 'Cart item updated successfully!'},
+                        status=status.HTTP_200_OK)
 
-        if quantity <= 0:
-            cart_item.delete()
-            return Response({'message': 'Item removed from cart.'},
-                            status=status.HTTP_204_NO_CONTENT)
-        else:
-            cart_item.quantity = quantity
-            cart_item.save()
-            return Response({'message': 'Cart item updated successfully!'},
-                            status=status.HTTP_200_OK)
-
-    elif request.method == 'DELETE':    
-        cart_item.delete()
+    elif request.method == 'DELETE':
+        if not store.remove(request.user.pk, product_id):
+            raise Http404('No such item in your cart.')
         return Response({'message': 'Item removed from cart.'},
                         status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def checkout_api(request):
-    cart = _get_or_create_cart(request.user)
-
-    if not cart.items.exists():
+def reserve_checkout_api(request):
+    # optional first step of the API checkout: hold the stock of the cart
+    if not get_cart_store().get_lines(request.user.pk):
         return Response({'error': 'Your cart is empty.'},
                         status=status.HTTP_400_BAD_REQUEST)
-    
     try:
-        with transaction.atomic():
-            # create the order
-            order = Order.objects.create(
-                user=request.user,
-                total_price=cart.get_total_price(),
-                shipping_address=request.data.get('shipping_address', ''),
-                billing_address=request.data.get('billing_address', ''),
-                status='PENDING'
-            )
-
-            # create order items from cart items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.price
-                )
-
-                # update inventory
-                Inventory.objects.filter(product=cart_item.product).update(
-                    stock_quantity=F('stock_quantity') - cart_item.quantity
-                )
+        expires_at = reserve_cart(request.user)
+    except InsufficientStockError as e:
+        return Response({'error': str(e), 'products': e.product_names},
+                        status=status.HTTP_409_CONFLICT)
+    return Response({'reserved_until': expires_at}, status=status.HTTP_200_OK)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([bucket_throttle('checkout')])
+@idempotent
+def checkout_api(request):
+    if not get_cart_store().get_lines(request.user.pk):
+        return Response({'error': 'Your cart is empty.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    # the order is placed by a Celery worker, poll the status URL for the outcome
+    order, task_id = enqueue_order(
+        request.user,
+        shipping_address=request.data.get('shipping_address', ''),
+        billing_address=request.data.get('billing_address', '')
+    )
+    return Response({
+        'order_id': order.id,
+        'task_id': task_id,
+        'checkout_status': order.checkout_status,
+        'status_url': reverse('orders:checkout-status-api', kwargs={'order_id': order.id}),
+    }, status=status.HTTP_202_ACCEPTED)
 
-            # deactivate the cart
-            cart.is_active = False
-            cart.save()
-    except Exception as e:
-        return Response({'error': str(e)},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-    serializer = OrderSerializer(order)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+@api_view(['GET'])
+@authentication_classes(CLAIMS_ONLY_AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+def checkout_status_api(request, order_id):
+    order = get_object_or_404(Order, pk=order_id, user_id=request.user.pk)
+    data = {
+        'order_id': order.id,
+        'checkout_status': order.checkout_status,
+        'error': order.checkout_error or None,
+        'order': None,
+    }
+    if order.checkout_status == 'COMPLETED':
+        data['order'] = OrderSerializer(order).data
+    return Response(data)
 
+@query_budget(4)
 @api_view(['GET'])
+@authentication_classes(CLAIMS_ONLY_AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
 def order_history_api(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    orders = Order.objects.filter(user_id=request.user.pk)
+    paginator = CreatedAtCursorPagination()
+
+    # ?view=summary renders from the denormalized columns: one query per page
+    if request.query_params.get('view') == 'summary':
+        page = paginator.paginate_queryset(orders, request)
+        serializer = OrderSummarySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    # otherwise two queries per page: the orders, then their items joined with products
+    orders = orders.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+    page = paginator.paginate_queryset(orders, request)
+    serializer = OrderSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+# async version, routed when settings.ASYNC_VIEWS is on
+@query_budget(4)
+@async_api_view(authentication_classes=CLAIMS_ONLY_AUTHENTICATION_CLASSES)
+async def order_history_api_async(request):
+    orders = Order.objects.filter(user_id=request.user.pk)
+    paginator = CreatedAtCursorPagination()
+
+    if request.query_params.get('view') == 'summary':
+        return JsonResponse(await apaginate(paginator, orders, request, OrderSummarySerializer))
+
+    orders = orders.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+    return JsonResponse(await apaginate(paginator, orders, request, OrderSerializer))
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Product, ProductImage, Inventory
+from .inventory import configure_shards
+from .models import Category, CategoryStats, Product, ProductImage, Inventory, InventoryShard, StockReservation
 
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -8,6 +9,17 @@ class CategoryAdmin(admin.ModelAdmin):
 
 admin.site.register(Category, CategoryAdmin)
 
+class CategoryStatsAdmin(admin.ModelAdmin):
+    # maintained automatically, see products.category_stats
+    list_display = ('category', 'product_count', 'min_price', 'max_price', 'updated_at')
+    list_select_related = ('category',)
+    readonly_fields = ('category', 'product_count', 'min_price', 'max_price', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+admin.site.register(CategoryStats, CategoryStatsAdmin)
+
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'price', 'is_active', 'created_at')
     list_filter = ('category', 'is_active')
@@ -24,7 +36,35 @@ class ProductAdmin(admin.ModelAdmin):
 admin.site.register(Product, ProductAdmin)
 
 class InventoryAdmin(admin.ModelAdmin):
-    list_display = ('product', 'stock_quantity', 'updated_at')
+    list_display = ('product', 'stock_quantity', 'reserved_quantity', 'shard_count', 'updated_at')
     search_fields = ('product__name',)
+    readonly_fields = ('reserved_quantity',)
+
+    class InventoryShardInline(admin.TabularInline):
+        model = InventoryShard
+        extra = 0
+        fields = ('index', 'stock_quantity')
+        readonly_fields = ('index',)
+        can_delete = False
+
+    inlines = [InventoryShardInline]
+
+    def save_model(self, request, obj, form, change):
+        shard_count = obj.shard_count
+        if change and 'shard_count' in form.changed_data:
+            # re-split the stock with the old layout still in place
+            obj.shard_count = form.initial['shard_count']
+            super().save_model(request, obj, form, change)
+            configure_shards(obj.product_id, shard_count)
+            obj.refresh_from_db()
+        else:
+            super().save_model(request, obj, form, change)
 
 admin.site.register(Inventory, InventoryAdmin)
+
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'quantity', 'created_at', 'expires_at')
+    list_select_related = ('product', 'user')
+    search_fields = ('product__name', 'user__username')
+
+admin.site.register(StockReservation, StockReservationAdmin)
@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.urls import path
 
-from products.views import ProductListAPIView
+from products.views import (
+    CategoryListAPIView, CategoryProductListAPIView, ProductListAPIView, ProductSearchAPIView,
+    product_list_api_async,
+)
 
 
 urlpatterns = [
-    path('', ProductListAPIView.as_view(), name='product-list-api'),
+    path('', product_list_api_async if settings.ASYNC_VIEWS else ProductListAPIView.as_view(), name='product-list-api'),
+    path('categories/', CategoryListAPIView.as_view(), name='category-list-api'),
+    path('categories/<slug:slug>/products/', CategoryProductListAPIView.as_view(), name='category-product-list-api'),
+    path('products/search/', ProductSearchAPIView.as_view(), name='product-search-api'),
 ]
@@ -0,0 +1,174 @@
+"""
+Versioned read-through cache for the product catalog.
+
+Every entry is stored under the current catalog version, so invalidating the
+whole catalog is a single INCR of the version key (see ``products.signals``).
+Entries written under an older version are never read again and simply age
+out of the cache.
+
+Stock is decremented at checkout with a queryset ``update()``, which does not
+send signals, so cached ``stock_quantity`` values can lag by up to
+``CATALOG_CACHE_TIMEOUT`` seconds. Checkout re-validates stock against the
+locked Inventory rows, so this only affects what is displayed.
+
+Entries are built from a read replica like any other catalog read, except
+for ``DB_PRIMARY_PIN_SECONDS`` after a version bump: a replica that hasn't
+caught up with the change yet would have its stale rows cached under the new
+version, so those builds read the primary.
+
+The ``a``-prefixed functions are the same operations for async views, built
+on the cache's async API.
+"""
+import hashlib
+import time
+import uuid
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+
+from config.db_router import read_from_primary
+from config.instrumentation import record_cache_lookup
+
+
+VERSION_KEY = 'catalog:version'
+# set for DB_PRIMARY_PIN_SECONDS by every version bump
+CHANGED_KEY = 'catalog:recently-changed'
+HITS_KEY = 'catalog:stats:hits'
+MISSES_KEY = 'catalog:stats:misses'
+
+_MISSING = object()
+
+
+def _initial_version():
+    # if the version key is ever evicted, restart from a value that is larger
+    # than any version handed out before, so old entries can't become live again
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, _initial_version(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache.set(CHANGED_KEY, 1, settings.DB_PRIMARY_PIN_SECONDS)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # the key doesn't exist yet (or was evicted)
+        version = _initial_version()
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def _build_context(cached):
+    # ``cached`` is what a get_many() of the entry and CHANGED_KEY found
+    return read_from_primary() if CHANGED_KEY in cached else nullcontext()
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+async def _aincrement(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            await cache.aincr(key)
+
+
+def _versioned_key(version, name, parts):
+    if parts:
+        digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+        name = f'{name}:{digest}'
+    return f'catalog:{version}:{name}'
+
+
+def make_key(name, *parts):
+    return _versioned_key(get_catalog_version(), name, parts)
+
+
+def get_or_build(name, builder, *parts):
+    """
+    Return the cached value for ``name`` (and the optional key ``parts``)
+    under the current catalog version, calling ``builder()`` and caching its
+    result on a miss. Exceptions raised by ``builder`` are not cached.
+    """
+    key = make_key(name, *parts)
+    cached = cache.get_many([key, CHANGED_KEY])
+    value = cached.get(key, _MISSING)
+    record_cache_lookup(hit=value is not _MISSING)
+    if value is not _MISSING:
+        _increment(HITS_KEY)
+        return value
+
+    _increment(MISSES_KEY)
+    with _build_context(cached):
+        value = builder()
+    # a fresh tag per build, so the tag changes whenever the value may have
+    cache.set_many({key: value, f'{key}:etag': uuid.uuid4().hex}, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def get_entry_etag(name, *parts):
+    """
+    A tag identifying the value ``get_or_build()`` currently serves for
+    ``name`` and ``parts``, or None if it isn't cached. One small cache read,
+    for answering conditional requests without building anything.
+    """
+    return cache.get(f'{make_key(name, *parts)}:etag')
+
+
+async def aget_or_build(name, builder, *parts):
+    """``get_or_build()`` for async views; ``builder`` is a coroutine function."""
+    key = _versioned_key(await aget_catalog_version(), name, parts)
+    cached = await cache.aget_many([key, CHANGED_KEY])
+    value = cached.get(key, _MISSING)
+    record_cache_lookup(hit=value is not _MISSING)
+    if value is not _MISSING:
+        await _aincrement(HITS_KEY)
+        return value
+
+    await _aincrement(MISSES_KEY)
+    with _build_context(cached):
+        value = await builder()
+    await cache.aset_many({key: value, f'{key}:etag': uuid.uuid4().hex}, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+async def aget_entry_etag(name, *parts):
+    return await cache.aget(f'{_versioned_key(await aget_catalog_version(), name, parts)}:etag')
+
+
+def get_cache_stats():
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = stats.get(HITS_KEY, 0)
+    misses = stats.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'version': get_catalog_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / lookups if lookups else 0.0,
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
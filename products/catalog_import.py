@@ -0,0 +1,185 @@
+"""
+Bulk catalog import, used by ``manage.py import_catalog``.
+
+Rows are streamed from a CSV or NDJSON file and written in batches. Each
+batch takes a handful of set-based statements, however many rows it has:
+one upsert each for categories, products (keyed by slug) and inventory, plus
+the search vector refresh. Model signals don't fire for bulk writes, so the
+caller refreshes the derived data (catalog cache version, category stats)
+once the import is done. Rows whose name belongs to a product with another
+slug are skipped and reported, not written.
+
+Recognised columns: ``name`` (required), ``price`` (required), ``slug``,
+``description``, ``category`` (a name), ``stock_quantity``, ``is_active``.
+"""
+import csv
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import Category, Inventory, Product
+from .search import update_search_vectors
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+SLUG_LENGTH = 50  # max_length of the SlugFields
+
+
+class ImportRowError(ValueError):
+    def __init__(self, row_number, message):
+        self.row_number = row_number
+        super().__init__(f'row {row_number}: {message}')
+
+
+def read_rows(path, file_format):
+    """Yield ``(row_number, dict)`` for every record in the file, one at a time."""
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            for row_number, row in enumerate(csv.DictReader(source), start=1):
+                yield row_number, row
+        else:
+            row_number = 0
+            for line in source:
+                if not line.strip():
+                    continue
+                row_number += 1
+                try:
+                    yield row_number, json.loads(line)
+                except json.JSONDecodeError as exc:
+                    raise ImportRowError(row_number, f'invalid JSON ({exc})')
+
+
+def make_slug(text):
+    """
+    ``slugify(text)``, shortened to fit the slug columns. A long slug keeps a
+    hash of the whole of it, so two long names with the same beginning don't
+    end up on the same slug (and the same product).
+    """
+    slug = slugify(text)
+    if len(slug) <= SLUG_LENGTH:
+        return slug
+    digest = hashlib.md5(slug.encode()).hexdigest()[:8]
+    return f'{slug[:SLUG_LENGTH - len(digest) - 1].rstrip("-")}-{digest}'
+
+
+def clean_row(row_number, row):
+    """Normalise one raw record; raise ``ImportRowError`` when it can't be imported."""
+    if not isinstance(row, dict):
+        raise ImportRowError(row_number, f'expected an object, got {type(row).__name__}')
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ImportRowError(row_number, 'name is required')
+    slug = make_slug(str(row.get('slug') or '').strip() or name)
+    if not slug:
+        raise ImportRowError(row_number, f'cannot make a slug out of {name!r}')
+    try:
+        price = Decimal(str(row.get('price', '')).strip())
+    except InvalidOperation:
+        raise ImportRowError(row_number, f"invalid price {row.get('price')!r}")
+    if not price.is_finite() or price < 0:
+        raise ImportRowError(row_number, f'invalid price {price}')
+
+    stock = row.get('stock_quantity')
+    if stock in (None, ''):
+        stock = None
+    else:
+        try:
+            stock = int(stock)
+        except (TypeError, ValueError):
+            raise ImportRowError(row_number, f'invalid stock_quantity {stock!r}')
+
+    is_active = row.get('is_active', True)
+    if isinstance(is_active, str):
+        is_active = is_active.strip().lower() in TRUE_VALUES if is_active.strip() else True
+
+    category = str(row.get('category') or '').strip() or None
+    return {
+        'row_number': row_number,
+        'name': name[:255],
+        'slug': slug,
+        'description': str(row.get('description') or ''),
+        'price': price.quantize(Decimal('0.01')),
+        'category': category[:255] if category else None,
+        'stock_quantity': stock,
+        'is_active': bool(is_active),
+    }
+
+
+class CatalogImporter:
+    def __init__(self):
+        # category name -> id, grows with the number of distinct categories only
+        self.category_ids = {}
+
+    def _upsert_categories(self, names):
+        missing = [name for name in names if name not in self.category_ids]
+        if not missing:
+            return
+        Category.objects.bulk_create(
+            [Category(name=name, slug=make_slug(name) or 'category') for name in missing],
+            ignore_conflicts=True
+        )
+        self.category_ids.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+        # "T-Shirts" vs "T Shirts": same slug, so the existing category is used
+        by_slug = {make_slug(name): name for name in missing if name not in self.category_ids}
+        for slug, pk in Category.objects.filter(slug__in=by_slug).values_list('slug', 'pk'):
+            self.category_ids[by_slug[slug]] = pk
+
+    def _reject_name_conflicts(self, by_slug):
+        """
+        Drop the rows whose name belongs to a product with another slug, in the
+        database or earlier in the batch: ``Product.name`` is unique too, and
+        one such row would abort the whole upsert. Returns them as errors.
+        """
+        owners = dict(Product.objects.filter(name__in=[row['name'] for row in by_slug.values()])
+                      .values_list('name', 'slug'))
+        rejected = []
+        for slug, row in list(by_slug.items()):
+            owner = owners.setdefault(row['name'], slug)
+            if owner != slug:
+                del by_slug[slug]
+                rejected.append(ImportRowError(row['row_number'], f"name {row['name']!r} is taken by {owner!r}"))
+        return rejected
+
+    def import_batch(self, rows):
+        """
+        Upsert a batch of cleaned rows in one transaction. Later rows win over
+        earlier ones with the same slug. Returns the number of products written
+        and the ``ImportRowError`` of every row left out because its name was
+        taken.
+        """
+        by_slug = {row['slug']: row for row in rows}
+        rejected = self._reject_name_conflicts(by_slug)
+        if not by_slug:
+            return 0, rejected
+        with transaction.atomic():
+            self._upsert_categories({row['category'] for row in by_slug.values() if row['category']})
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        name=row['name'], slug=slug, description=row['description'], price=row['price'],
+                        is_active=row['is_active'], category_id=self.category_ids.get(row['category'])
+                    )
+                    for slug, row in by_slug.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=['name', 'description', 'price', 'is_active', 'category', 'updated_at'],
+            )
+            product_ids = dict(Product.objects.filter(slug__in=by_slug).values_list('slug', 'pk'))
+
+            stock = {product_ids[slug]: row['stock_quantity']
+                     for slug, row in by_slug.items() if row['stock_quantity'] is not None}
+            # sharded stock lives on the shards, see products.inventory
+            for product_id in Inventory.objects.filter(product_id__in=stock, shard_count__gt=1).values_list(
+                    'product_id', flat=True):
+                del stock[product_id]
+            Inventory.objects.bulk_create(
+                [Inventory(product_id=product_id, stock_quantity=quantity) for product_id, quantity in stock.items()],
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['stock_quantity', 'updated_at'],
+            )
+            update_search_vectors(list(product_ids.values()))
+        return len(by_slug), rejected
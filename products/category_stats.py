@@ -0,0 +1,101 @@
+"""
+Per-category facet counts: how many active products a category has and their
+price range, kept in ``CategoryStats`` so that category pages don't have to
+``COUNT(*) ... GROUP BY category`` on every request.
+
+Every product save or delete adjusts the counters of the categories it left
+and joined (see ``products.signals``). The price bounds only need a query
+when the product that left held one of them. Writes that skip model signals
+(``QuerySet.update()``, raw SQL, bulk imports) must be followed by
+``rebuild_category_stats()``, which is also what ``manage.py
+rebuild_category_stats`` runs to repair drift.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from .models import Category, CategoryStats, Product
+
+
+def facet_state(category_id, is_active, price):
+    """What a product contributes to the stats: ``(category_id, price)``, or None."""
+    if category_id is None or not is_active:
+        return None
+    return category_id, Decimal(str(price))
+
+
+def _active_price_bounds(category_id):
+    bounds = Product.objects.filter(category_id=category_id, is_active=True).aggregate(
+        min_price=Min('price'), max_price=Max('price'))
+    return bounds['min_price'], bounds['max_price']
+
+
+def record_product_change(before, after):
+    """
+    Move a product's contribution from ``before`` to ``after`` (both
+    ``facet_state()`` values). Call it once the product row is written, so a
+    bounds recomputation sees the new row.
+    """
+    if before == after:
+        return
+    changes = defaultdict(lambda: {'removed': None, 'added': None})
+    if before is not None:
+        changes[before[0]]['removed'] = before[1]
+    if after is not None:
+        changes[after[0]]['added'] = after[1]
+
+    with transaction.atomic():
+        # category id order, so two moves in opposite directions can't deadlock
+        for category_id in sorted(changes):
+            _apply(category_id, **changes[category_id])
+
+
+def _apply(category_id, removed, added):
+    stats, _ = CategoryStats.objects.select_for_update().get_or_create(category_id=category_id)
+    recompute = False
+    if removed is not None:
+        stats.product_count = max(stats.product_count - 1, 0)
+        # only losing a bound needs a look at the other products
+        recompute = removed in (stats.min_price, stats.max_price)
+    if added is not None:
+        stats.product_count += 1
+        stats.min_price = added if stats.min_price is None else min(stats.min_price, added)
+        stats.max_price = added if stats.max_price is None else max(stats.max_price, added)
+    if recompute:
+        stats.min_price, stats.max_price = _active_price_bounds(category_id)
+    stats.save()
+
+
+def rebuild_category_stats(category_ids=None):
+    """Recompute the stats of the given categories (all of them when None) from scratch."""
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    category_ids = list(categories.values_list('pk', flat=True))
+
+    totals = {
+        row['category_id']: row
+        for row in Product.objects.filter(is_active=True, category_id__in=category_ids)
+        .values('category_id')
+        .annotate(product_count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+        .order_by()
+    }
+    empty = {'product_count': 0, 'min_price': None, 'max_price': None}
+    with transaction.atomic():
+        CategoryStats.objects.bulk_create(
+            [
+                CategoryStats(
+                    category_id=category_id,
+                    product_count=totals.get(category_id, empty)['product_count'],
+                    min_price=totals.get(category_id, empty)['min_price'],
+                    max_price=totals.get(category_id, empty)['max_price'],
+                )
+                for category_id in category_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['category'],
+            update_fields=['product_count', 'min_price', 'max_price', 'updated_at'],
+        )
+    return len(category_ids)
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+# mounted at /categories/, outside /products/<slug>/ so no product slug can shadow them
+app_name = 'categories'
+
+urlpatterns = [
+    path('', views.category_list, name='category_list'),
+    path('<slug:slug>/', views.category_detail, name='category_detail'),
+]
@@ -0,0 +1,104 @@
+"""
+Resized variants ("derivatives") of product images.
+
+For every width in ``settings.PRODUCT_IMAGE_WIDTHS`` narrower than the
+original, a JPEG and a WebP copy are stored next to the original, e.g.
+``product_images/shoe_400w.jpg`` and ``product_images/shoe_400w.webp``, and
+recorded in ``ProductImage.derivatives``::
+
+    {"source": "product_images/shoe.png", "width": 1600,
+     "widths": {"400": {"jpeg": "...", "webp": "..."}}}
+
+They are generated by a Celery task after an image is uploaded or replaced
+(see ``products.signals``), and in bulk by ``manage.py
+regenerate_image_derivatives``. Until they exist, templates and the API fall
+back to the original.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+from .models import ProductImage
+
+FORMATS = {
+    # format: (file extension, Pillow save options)
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+}
+
+
+def render_derivatives(data, widths):
+    """
+    Resize the encoded image ``data`` to each of ``widths`` (skipping those not
+    narrower than the original). Returns the original's width and
+    ``{width: {format: bytes}}``. Pure CPU work on bytes, so it can run in a
+    worker process.
+    """
+    with Image.open(BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        rendered = {}
+        for width in sorted(set(widths)):
+            if width >= original.width:
+                continue
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.Resampling.LANCZOS)
+            variants = {}
+            for name, (_extension, options) in FORMATS.items():
+                image = resized
+                if name == 'jpeg' and image.mode != 'RGB':
+                    image = image.convert('RGB')
+                elif name == 'webp' and image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+                buffer = BytesIO()
+                image.save(buffer, **options)
+                variants[name] = buffer.getvalue()
+            rendered[width] = variants
+        return original.width, rendered
+
+
+def delete_derivatives(derivatives):
+    for variants in (derivatives or {}).get('widths', {}).values():
+        for name in variants.values():
+            default_storage.delete(name)
+
+
+def store_derivatives(image, original_width, rendered):
+    """Save the output of ``render_derivatives()`` for ``image`` and record it, replacing older variants."""
+    stem = image.image.name.rsplit('.', 1)[0]
+    widths = {}
+    for width, variants in rendered.items():
+        widths[str(width)] = {
+            name: default_storage.save(f'{stem}_{width}w.{FORMATS[name][0]}', ContentFile(data))
+            for name, data in variants.items()
+        }
+    derivatives = {'source': image.image.name, 'width': original_width, 'widths': widths}
+    # update(), not save(): this must not queue another round of derivatives.
+    # The filter on the file name skips images replaced while we were working.
+    if not ProductImage.objects.filter(pk=image.pk, image=image.image.name).update(derivatives=derivatives):
+        delete_derivatives(derivatives)
+        return
+    delete_derivatives(image.derivatives)
+    image.derivatives = derivatives
+    # cached catalog pages still point at the originals
+    transaction.on_commit(bump_catalog_version)
+
+
+def generate_derivatives(image_id, widths=None):
+    """Render and store the derivatives of one ``ProductImage``; return how many widths were made."""
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return 0
+    with image.image.open('rb') as source:
+        data = source.read()
+    original_width, rendered = render_derivatives(data, widths or settings.PRODUCT_IMAGE_WIDTHS)
+    store_derivatives(image, original_width, rendered)
+    return len(rendered)
+
+
+def needs_derivatives(image):
+    return bool(image.image) and (image.derivatives or {}).get('source') != image.image.name
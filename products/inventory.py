@@ -0,0 +1,283 @@
+"""
+Stock reservations and sharded stock counters.
+
+Plain products keep their stock on their single ``Inventory`` row:
+``stock_quantity`` is what is on hand and ``reserved_quantity`` is what is held
+by checkouts in progress. Holding, committing and releasing stock lock those
+rows in product id order and change them with one set-based UPDATE.
+
+A hot product can be split across ``Inventory.shard_count`` ``InventoryShard``
+rows that each hold part of its *available* stock. A hold or a sale then
+decrements one shard picked at random, so concurrent checkouts of that product
+mostly lock different rows. Sharded products are always visited in product id
+order, after the plain ones, so shard locks are taken in one global order.
+For sharded products, ``Inventory.stock_quantity`` and ``reserved_quantity``
+are derived totals refreshed by ``sync_sharded_inventory()``.
+
+A hold (``StockReservation``) is taken when a cart enters checkout and is
+consumed by ``commit_stock()`` when the order is placed. Holds that expire are
+returned to stock by ``release_expired_reservations()``, which Celery beat runs
+periodically (see ``products.tasks``).
+"""
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import Inventory, InventoryShard, Product, StockReservation
+
+
+class InsufficientStockError(Exception):
+    """Raised when a cart asks for more units of a product than are available."""
+
+    def __init__(self, product_names):
+        self.product_names = product_names
+        super().__init__(f"Not enough stock for: {', '.join(product_names)}")
+
+    @classmethod
+    def for_products(cls, product_ids):
+        return cls(list(Product.objects.filter(pk__in=product_ids).order_by('name')
+                        .values_list('name', flat=True)))
+
+
+def _case(column_values):
+    # CASE product_id WHEN ... THEN ... END, for one set-based UPDATE
+    return Case(
+        *[When(product_id=product_id, then=Value(value)) for product_id, value in column_values.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def _split_by_sharding(product_ids):
+    # no lock needed: shard_count only changes through configure_shards().
+    # In product id order: the shards are locked in the order of this dict
+    shard_counts = (Inventory.objects.filter(product_id__in=product_ids, shard_count__gt=1)
+                    .order_by('product_id').values_list('product_id', 'shard_count'))
+    return dict(shard_counts)
+
+
+def _lock_inventory(product_ids):
+    # fixed lock order, so two checkouts can never deadlock each other
+    return {
+        product_id: (stock, reserved)
+        for product_id, stock, reserved in Inventory.objects.select_for_update()
+        .filter(product_id__in=product_ids)
+        .order_by('product_id')
+        .values_list('product_id', 'stock_quantity', 'reserved_quantity')
+    }
+
+
+def _take_from_shards(product_id, quantity, shard_count):
+    """
+    Remove ``quantity`` available units of a sharded product; return False if
+    there aren't enough. Either path locks only shards of this product, and
+    the fast path only when it succeeds, so calling it product by product in
+    id order keeps the lock order consistent.
+    """
+    shards = InventoryShard.objects.filter(inventory__product_id=product_id)
+
+    # fast path: one conditional decrement on a random shard, without waiting on the others
+    index = random.randrange(shard_count)
+    if shards.filter(index=index, stock_quantity__gte=quantity).update(
+            stock_quantity=F('stock_quantity') - quantity):
+        return True
+
+    # slow path: gather the units from several shards
+    locked = list(shards.select_for_update().filter(stock_quantity__gt=0).order_by('index'))
+    if sum(shard.stock_quantity for shard in locked) < quantity:
+        return False
+    remaining = quantity
+    for shard in locked:
+        taken = min(shard.stock_quantity, remaining)
+        shard.stock_quantity -= taken
+        remaining -= taken
+        if not remaining:
+            break
+    InventoryShard.objects.bulk_update(locked, ['stock_quantity'])
+    return True
+
+
+def _return_to_shards(product_id, quantity, shard_count):
+    InventoryShard.objects.filter(
+        inventory__product_id=product_id, index=random.randrange(shard_count)
+    ).update(stock_quantity=F('stock_quantity') + quantity)
+
+
+def _lock_user(user):
+    # one change to a user's holds at a time: two reserve_stock() calls would
+    # both find no hold to replace and collide on unique_product_user_reservation.
+    # NO KEY UPDATE, so inserts that reference the user don't wait on it
+    list(get_user_model().objects.select_for_update(no_key=True).filter(pk=user.pk).values_list('pk'))
+
+
+def _release(holds, skip_locked=False):
+    """
+    Return the stock of the given holds (a StockReservation queryset) and
+    delete them. With ``skip_locked``, holds that another transaction is
+    working on are left alone instead of waited for.
+    """
+    with transaction.atomic():
+        locked = list(holds.select_for_update(skip_locked=skip_locked).values_list('id', 'product_id', 'quantity'))
+        if not locked:
+            return 0
+
+        quantities = defaultdict(int)
+        for _id, product_id, quantity in locked:
+            quantities[product_id] += quantity
+
+        sharded = _split_by_sharding(quantities)
+        plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in sharded}
+        if plain:
+            _lock_inventory(plain)
+            Inventory.objects.filter(product_id__in=plain).update(
+                reserved_quantity=F('reserved_quantity') - _case(plain)
+            )
+        for product_id, shard_count in sharded.items():
+            _return_to_shards(product_id, quantities[product_id], shard_count)
+
+        StockReservation.objects.filter(pk__in=[hold[0] for hold in locked]).delete()
+    return len(locked)
+
+
+def reserve_stock(user, quantities, ttl=None):
+    """
+    Hold ``quantities`` (a ``{product_id: quantity}`` dict) for ``user`` for
+    ``ttl`` seconds (``settings.STOCK_RESERVATION_TTL`` by default), replacing
+    any hold the user already has on those products. Raises
+    ``InsufficientStockError`` without holding anything if a product doesn't
+    have enough available units. Returns the expiry time.
+    """
+    ttl = ttl or settings.STOCK_RESERVATION_TTL
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+
+    with transaction.atomic():
+        _lock_user(user)
+        release_reservations(user, quantities)
+
+        sharded = _split_by_sharding(quantities)
+        plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in sharded}
+
+        stock = _lock_inventory(plain)
+        short = [product_id for product_id, quantity in plain.items()
+                 if product_id not in stock or stock[product_id][0] - stock[product_id][1] < quantity]
+        short += [product_id for product_id, shard_count in sharded.items()
+                  if not _take_from_shards(product_id, quantities[product_id], shard_count)]
+        if short:
+            # the shard decrements above are rolled back with the transaction
+            raise InsufficientStockError.for_products(short)
+
+        if plain:
+            Inventory.objects.filter(product_id__in=plain).update(
+                reserved_quantity=F('reserved_quantity') + _case(plain)
+            )
+        StockReservation.objects.bulk_create([
+            StockReservation(product_id=product_id, user=user, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+    return expires_at
+
+
+def commit_stock(user, quantities):
+    """
+    Take ``quantities`` out of stock for an order placed by ``user``,
+    consuming the user's holds on those products. Must be called inside the
+    transaction that creates the order. Raises ``InsufficientStockError`` if
+    a product doesn't have enough units, counting the user's own hold.
+    """
+    held = defaultdict(int)
+    for product_id, quantity in (StockReservation.objects.select_for_update()
+                                 .filter(user=user, product_id__in=quantities)
+                                 .values_list('product_id', 'quantity')):
+        held[product_id] += quantity
+
+    sharded = _split_by_sharding(quantities)
+    plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in sharded}
+
+    stock = _lock_inventory(plain)
+    # a product without an Inventory row has nothing to sell
+    short = [product_id for product_id, quantity in plain.items()
+             if product_id not in stock or stock[product_id][0] - stock[product_id][1] + held[product_id] < quantity]
+    for product_id, shard_count in sharded.items():
+        # the held units have already left the shards
+        extra = quantities[product_id] - held[product_id]
+        if extra > 0 and not _take_from_shards(product_id, extra, shard_count):
+            short.append(product_id)
+        elif extra < 0:
+            _return_to_shards(product_id, -extra, shard_count)
+    if short:
+        raise InsufficientStockError.for_products(short)
+
+    if plain:
+        Inventory.objects.filter(product_id__in=plain).update(
+            stock_quantity=F('stock_quantity') - _case(plain),
+            reserved_quantity=F('reserved_quantity') - _case({product_id: held[product_id] for product_id in plain})
+        )
+    if held:
+        StockReservation.objects.filter(user=user, product_id__in=held).delete()
+
+
+def release_reservations(user, product_ids=None):
+    """Give back the user's holds (on ``product_ids`` only, if given)."""
+    holds = StockReservation.objects.filter(user=user)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    return _release(holds)
+
+
+def release_expired_reservations(now=None):
+    """Give back every hold that has expired; return how many were released."""
+    # holds being committed or replaced right now are theirs to delete
+    return _release(StockReservation.objects.filter(expires_at__lte=now or timezone.now()), skip_locked=True)
+
+
+def sync_sharded_inventory():
+    """Refresh the derived ``Inventory`` totals of sharded products."""
+    inventories = list(Inventory.objects.filter(shard_count__gt=1))
+    if not inventories:
+        return 0
+    available = dict(InventoryShard.objects.filter(inventory__in=inventories)
+                     .values('inventory_id').annotate(total=Sum('stock_quantity'))
+                     .values_list('inventory_id', 'total'))
+    reserved = dict(StockReservation.objects.filter(product_id__in=[inv.product_id for inv in inventories])
+                    .values('product_id').annotate(total=Sum('quantity'))
+                    .values_list('product_id', 'total'))
+    for inventory in inventories:
+        inventory.reserved_quantity = reserved.get(inventory.product_id, 0)
+        inventory.stock_quantity = available.get(inventory.pk, 0) + inventory.reserved_quantity
+    Inventory.objects.bulk_update(inventories, ['stock_quantity', 'reserved_quantity'])
+    return len(inventories)
+
+
+def configure_shards(product_id, shard_count):
+    """
+    Spread a product's available stock across ``shard_count`` shards, or fold
+    it back onto the Inventory row when ``shard_count`` is 1.
+    """
+    with transaction.atomic():
+        inventory = Inventory.objects.select_for_update().get(product_id=product_id)
+        shards = InventoryShard.objects.select_for_update().filter(inventory=inventory)
+        if inventory.is_sharded:
+            # fold the shards back first, so we start from plain totals
+            available = shards.aggregate(total=Sum('stock_quantity'))['total'] or 0
+            reserved = StockReservation.objects.filter(product_id=product_id).aggregate(
+                total=Sum('quantity'))['total'] or 0
+            inventory.stock_quantity = available + reserved
+            inventory.reserved_quantity = reserved
+        shards.delete()
+
+        if shard_count > 1:
+            available = inventory.stock_quantity - inventory.reserved_quantity
+            base, extra = divmod(max(available, 0), shard_count)
+            InventoryShard.objects.bulk_create([
+                InventoryShard(inventory=inventory, index=index, stock_quantity=base + (index < extra))
+                for index in range(shard_count)
+            ])
+        inventory.shard_count = shard_count
+        inventory.save(update_fields=['stock_quantity', 'reserved_quantity', 'shard_count', 'updated_at'])
+    return inventory
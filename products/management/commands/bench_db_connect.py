@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = ('Compare the database cost of a request that opens its own connection with one that '
+            'goes through the configured pool or persistent connections.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def _report(self, label, latencies):
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(f'{label:<12} p50={statistics.median(latencies) * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms')
+        return statistics.median(latencies)
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        pool = settings_dict.get('OPTIONS', {}).get('pool')
+        self.stdout.write(
+            f"{connection.vendor}: pool={pool or 'off'}  CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}  "
+            f"health checks={settings_dict['CONN_HEALTH_CHECKS']}"
+        )
+
+        # a fresh driver connection per request: what every request paid before
+        params = connection.get_connection_params()
+        fresh = []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            raw = connection.Database.connect(**params)
+            cursor = raw.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            raw.close()
+            fresh.append(time.perf_counter() - started)
+
+        # the request lifecycle Django runs: connection checks on request
+        # start and end (close_old_connections), one query in between
+        managed = []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            request_finished.send(sender=self.__class__)
+            managed.append(time.perf_counter() - started)
+
+        fresh_median = self._report('fresh', fresh)
+        managed_median = self._report('configured', managed)
+        self.stdout.write(f'connection setup saved per request: {(fresh_median - managed_median) * 1000:.2f}ms')
@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def _read_response(reader):
+    """Read one HTTP/1.1 response; return (status, keep_alive)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    status = int(status_line.split()[1])
+    headers = {}
+    for line in header_lines:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif status not in (204, 304):
+        await reader.read()  # body runs until the server closes
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+class Command(BaseCommand):
+    help = ('Load an HTTP endpoint with many concurrent keep-alive connections and report '
+            'requests/s and latency percentiles, e.g. to compare the WSGI and ASGI servers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--concurrency', type=int, default=100, help='Open connections (e.g. 100-1000).')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run.')
+        parser.add_argument('--header', action='append', default=[], dest='headers',
+                            help='Extra request header, "Name: value" (repeatable).')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds.')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only plain http:// URLs are supported.')
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+        for header in options['headers']:
+            if ':' not in header:
+                raise CommandError(f'Bad header {header!r}, expected "Name: value".')
+
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        request = (
+            f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nConnection: keep-alive\r\n'
+            + ''.join(f'{header}\r\n' for header in options['headers'])
+            + '\r\n'
+        ).encode('latin-1')
+
+        latencies, statuses, errors = asyncio.run(self._run(
+            url.hostname, url.port or 80, request,
+            options['concurrency'], options['duration'], options['timeout'],
+        ))
+        if not latencies:
+            raise CommandError(f'No request completed ({errors} errors).')
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"c={options['concurrency']}: {len(latencies) / options['duration']:8.0f} requests/s  "
+            f'p50={statistics.median(latencies) * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms  '
+            f'errors={errors}'
+        )
+        self.stdout.write('status codes: ' + ', '.join(f'{code}={count}' for code, count in sorted(statuses.items())))
+
+    async def _run(self, host, port, request, concurrency, duration, timeout):
+        latencies, statuses = [], {}
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            nonlocal errors
+            writer = None
+            while time.perf_counter() < deadline:
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                    started = time.perf_counter()
+                    writer.write(request)
+                    status, keep_alive = await asyncio.wait_for(_read_response(reader), timeout)
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    errors += 1
+                    keep_alive = False
+                else:
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] = statuses.get(status, 0) + 1
+                if not keep_alive and writer is not None:
+                    writer.close()
+                    writer = None
+            if writer is not None:
+                writer.close()
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return latencies, statuses, errors
@@ -0,0 +1,89 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from products.inventory import InsufficientStockError, commit_stock, configure_shards, reserve_stock
+from products.models import Inventory, Product
+
+
+class Command(BaseCommand):
+    help = ('Measure checkout throughput on a single hot product, unsharded vs. sharded. '
+            'Creates a throwaway product and users, and removes them afterwards. '
+            'Only meaningful against PostgreSQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent checkouts (threads).')
+        parser.add_argument('--orders', type=int, default=50, help='Checkouts per worker.')
+        parser.add_argument('--shards', default='1,4,16', help='Comma-separated shard counts to compare.')
+        parser.add_argument('--reserve', action='store_true',
+                            help='Hold the stock before committing it, like the HTML checkout does.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError('SQLite serializes all writers; run this against PostgreSQL.')
+
+        workers, orders = options['workers'], options['orders']
+        shard_counts = [int(count) for count in options['shards'].split(',')]
+        tag = uuid.uuid4().hex[:8]
+
+        User = get_user_model()
+        users = [User.objects.create(username=f'bench-inventory-{tag}-{i}') for i in range(workers)]
+        product = Product.objects.create(name=f'bench-inventory-{tag}', slug=f'bench-inventory-{tag}', price=1)
+        try:
+            self.stdout.write(f'{workers} workers x {orders} checkouts of 1 unit')
+            for shard_count in shard_counts:
+                Inventory.objects.update_or_create(
+                    product=product,
+                    defaults={'stock_quantity': workers * orders, 'reserved_quantity': 0, 'shard_count': 1}
+                )
+                configure_shards(product.pk, shard_count)
+                self._run(product, users, orders, shard_count, options['reserve'])
+        finally:
+            product.delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def _run(self, product, users, orders, shard_count, reserve):
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+        start_gate = threading.Barrier(len(users))
+
+        def worker(user):
+            own = []
+            start_gate.wait()
+            try:
+                for _ in range(orders):
+                    started = time.perf_counter()
+                    try:
+                        if reserve:
+                            reserve_stock(user, {product.pk: 1})
+                        with transaction.atomic():
+                            commit_stock(user, {product.pk: 1})
+                    except InsufficientStockError:
+                        failures.append(user.pk)
+                    own.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(own)
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f'shards={shard_count:<3} {len(latencies) / elapsed:8.0f} checkouts/s  '
+            f'p50={statistics.median(latencies) * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms  '
+            f'out of stock={len(failures)}'
+        )
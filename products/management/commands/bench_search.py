@@ -0,0 +1,60 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from products.models import Product
+from products.search import InvertedIndex, PostgresSearchBackend, tokenize
+
+WORDS = ('red blue green black white leather cotton wool steel wooden classic modern slim large small '
+         'shirt jacket shoe boot lamp chair table desk mug bottle bag watch phone cable charger').split()
+
+
+class Command(BaseCommand):
+    help = ('Measure product search latency. The memory backend runs over a synthetic catalog; '
+            'the postgres backend runs over the products in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['memory', 'postgres'], default='memory')
+        parser.add_argument('--products', type=int, default=100_000, help='Synthetic catalog size (memory).')
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['backend'] == 'memory':
+            documents = [
+                (i, ' '.join(rng.choices(WORDS, k=3)), ' '.join(rng.choices(WORDS, k=20)),
+                 rng.randint(1, 500), rng.choice(['a', 'b', 'c']))
+                for i in range(1, options['products'] + 1)
+            ]
+            started = time.perf_counter()
+            index = InvertedIndex(documents)
+            self.stdout.write(f'indexed {len(documents)} products in {time.perf_counter() - started:.2f}s')
+            search = index.search
+            vocabulary = WORDS
+        else:
+            if connection.vendor != 'postgresql':
+                raise CommandError('The postgres backend needs a PostgreSQL database.')
+            search = PostgresSearchBackend().search
+            names = Product.objects.filter(is_active=True).values_list('name', flat=True)[:1000]
+            vocabulary = sorted({token for name in names for token in tokenize(name)})
+            if not vocabulary:
+                raise CommandError('No active products to search.')
+
+        latencies = []
+        for _ in range(options['queries']):
+            query = ' '.join(rng.sample(vocabulary, k=rng.randint(1, 2)))
+            started = time.perf_counter()
+            search(query, limit=options['limit'])
+            latencies.append(time.perf_counter() - started)
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"{options['backend']}: {len(latencies) / sum(latencies):8.0f} queries/s  "
+            f'p50={statistics.median(latencies) * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms'
+        )
@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from rest_framework.request import Request
+
+from config.throttling import InMemoryBucketStore, RedisBucketStore, bucket_throttle, get_bucket_store
+
+
+class Command(BaseCommand):
+    help = ('Measure the cost of one rate-limit check: the bucket stores on their own, and a whole '
+            'DRF throttle check (key, rate, store) with the configured store.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=20000)
+        parser.add_argument('--clients', type=int, default=1000, help='Distinct buckets the checks are spread over.')
+        parser.add_argument('--redis-url', default=settings.REDIS_URL,
+                            help='Redis to benchmark RedisBucketStore against (default: REDIS_URL).')
+
+    def _measure(self, label, check, checks):
+        timings = []
+        for i in range(checks):
+            started = time.perf_counter_ns()
+            check(i)
+            timings.append(time.perf_counter_ns() - started)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(f'{label:<32} mean={statistics.mean(timings) / 1000:8.1f}us  '
+                          f'p50={statistics.median(timings) / 1000:8.1f}us  p99={p99 / 1000:8.1f}us')
+
+    def handle(self, *args, **options):
+        checks, clients = options['checks'], options['clients']
+        if checks < 1 or clients < 1:
+            raise CommandError('--checks and --clients must be positive.')
+        # a bucket that never runs dry: every check does the full update
+        capacity, rate = 10 ** 9, 10 ** 9
+
+        stores = [('InMemoryBucketStore', InMemoryBucketStore())]
+        if options['redis_url']:
+            stores.append(('RedisBucketStore', RedisBucketStore(options['redis_url'])))
+        else:
+            self.stdout.write('no --redis-url or REDIS_URL, skipping RedisBucketStore')
+        for label, store in stores:
+            self._measure(label, lambda i: store.consume(f'ratelimit:bench:ip:{i % clients}', capacity, rate), checks)
+
+        # the throttle as the views run it, over anonymous requests from many addresses
+        throttle = bucket_throttle('bench', key_by='ip')()
+        factory = RequestFactory()
+        requests = []
+        for i in range(min(clients, checks)):
+            request = Request(factory.post('/', REMOTE_ADDR=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}'))
+            request.user = AnonymousUser()
+            requests.append(request)
+        rate_limits = {**settings.RATE_LIMITS, 'bench': f'{10 ** 9}/second'}
+        with override_settings(RATE_LIMITS=rate_limits):
+            self._measure(f'throttle ({type(get_bucket_store()).__name__})',
+                          lambda i: throttle.allow_request(requests[i % len(requests)], None), checks)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products.cache import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the catalog cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them.')
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        self.stdout.write(f"version:   {stats['version']}")
+        self.stdout.write(f"hits:      {stats['hits']}")
+        self.stdout.write(f"misses:    {stats['misses']}")
+        self.stdout.write(f"hit ratio: {stats['hit_ratio']:.2%}")
+        if options['reset']:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
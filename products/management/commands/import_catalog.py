@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from products.cache import bump_catalog_version
+from products.catalog_import import CatalogImporter, ImportRowError, clean_row, read_rows
+from products.category_stats import rebuild_category_stats
+
+
+class Command(BaseCommand):
+    help = ('Stream a CSV or NDJSON catalog into the database in batches, upserting categories, '
+            'products (by slug) and inventory. Progress is checkpointed after every batch, so an '
+            'interrupted import resumes where it stopped when run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or NDJSON file.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per transaction.')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint).')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+
+        done = 0 if options['restart'] else self._read_checkpoint(checkpoint_path, path)
+        if done:
+            self.stdout.write(f'Resuming after row {done}.')
+
+        importer = CatalogImporter()
+        started = time.perf_counter()
+        imported = rejected = 0
+        batch = []
+        last_row = done
+
+        def flush():
+            nonlocal imported, rejected
+            try:
+                written, errors = importer.import_batch(batch)
+            except IntegrityError as exc:
+                raise CommandError(f'Rows {batch_start} to {last_row} failed, nothing from them was saved: {exc}')
+            imported += written
+            rejected += len(errors)
+            for error in errors:
+                self.stderr.write(f'Skipped {error}')
+            self._write_checkpoint(checkpoint_path, path, last_row)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{last_row} rows done, {imported / elapsed:.0f} rows/s')
+            batch.clear()
+
+        try:
+            for row_number, row in read_rows(path, file_format):
+                if row_number <= done:
+                    continue
+                if not batch:
+                    batch_start = row_number
+                batch.append(clean_row(row_number, row))
+                last_row = row_number
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+        except ImportRowError as exc:
+            # keep the good rows before the bad one, so a rerun resumes at it
+            if batch:
+                flush()
+            raise CommandError(f'{exc}. Fix the row and run the command again to resume.')
+        finally:
+            if imported:
+                # bulk writes skip the model signals
+                bump_catalog_version()
+                rebuild_category_stats()
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} products from {last_row - done} rows in {elapsed:.1f}s '
+            f'({imported / elapsed if elapsed else 0:.0f} rows/s), skipped {rejected} rows.'
+        ))
+
+    def _read_checkpoint(self, checkpoint_path, path):
+        try:
+            with open(checkpoint_path) as checkpoint:
+                state = json.load(checkpoint)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            raise CommandError(f'{checkpoint_path} is corrupt; pass --restart to start over.')
+        if state.get('source') != path:
+            raise CommandError(f"{checkpoint_path} belongs to {state.get('source')}; pass --restart to start over.")
+        return state['rows']
+
+    def _write_checkpoint(self, checkpoint_path, path, rows):
+        # write-then-rename, so a crash never leaves half a checkpoint behind
+        temporary = f'{checkpoint_path}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump({'source': path, 'rows': rows}, checkpoint)
+        os.replace(temporary, checkpoint_path)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products.category_stats import rebuild_category_stats
+
+
+class Command(BaseCommand):
+    help = ('Recompute the per-category product counts and price ranges from the products table. '
+            'Run it after bulk updates that bypass model signals, or to repair drift.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('categories', nargs='*', type=int, help='Category ids (default: all).')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_category_stats(options['categories'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} categories.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from products.models import Product
+from products.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.search_vector for every product (PostgreSQL only), e.g. after a bulk import.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Products updated per statement.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write('Not on PostgreSQL; the in-memory search index rebuilds itself.')
+            return
+        batch_size = options['batch_size']
+        ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            update_search_vectors(ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'Reindexed {len(ids)} products.'))
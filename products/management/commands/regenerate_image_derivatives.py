@@ -0,0 +1,73 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.images import needs_derivatives, render_derivatives, store_derivatives
+from products.models import ProductImage
+
+
+def _render(image_id, data, widths):
+    return image_id, render_derivatives(data, widths)
+
+
+class Command(BaseCommand):
+    help = ('Regenerate the resized JPEG/WebP copies of product images, decoding and resizing '
+            'in a pool of worker processes. Run it after changing PRODUCT_IMAGE_WIDTHS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Only images without up-to-date copies (default: all images).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes.')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Images read and submitted to the pool at a time.')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='').order_by('pk')
+        widths = settings.PRODUCT_IMAGE_WIDTHS
+        started = time.perf_counter()
+        done = failed = 0
+
+        # django.setup() makes the workers usable with the spawn/forkserver start methods too
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            chunk = []
+            for image in images.iterator(chunk_size=options['chunk_size']):
+                if options['missing'] and not needs_derivatives(image):
+                    continue
+                chunk.append(image)
+                if len(chunk) >= options['chunk_size']:
+                    ok, errors = self._process(pool, chunk, widths)
+                    done, failed = done + ok, failed + errors
+                    chunk = []
+            if chunk:
+                ok, errors = self._process(pool, chunk, widths)
+                done, failed = done + ok, failed + errors
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Regenerated {done} image(s) in {elapsed:.1f}s, {failed} failed.'
+        ))
+
+    def _process(self, pool, chunk, widths):
+        # files are read and written here; the pool only gets bytes to resize
+        by_id = {image.pk: image for image in chunk}
+        futures = []
+        for image in chunk:
+            try:
+                with image.image.open('rb') as source:
+                    futures.append(pool.submit(_render, image.pk, source.read(), widths))
+            except OSError as exc:
+                self.stderr.write(f'Image {image.pk} ({image.image.name}): {exc}')
+        done = 0
+        for future in futures:
+            try:
+                image_id, (original_width, rendered) = future.result()
+            except Exception as exc:
+                self.stderr.write(f'Could not resize an image: {exc}')
+                continue
+            store_derivatives(by_id[image_id], original_width, rendered)
+            done += 1
+        return done, len(chunk) - done
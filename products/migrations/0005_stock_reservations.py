@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_product_created_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='reserved_quantity',
+            field=models.IntegerField(default=0, help_text='Units held by checkouts in progress.'),
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Split the stock of a hot product across this many counter rows. When above 1, the stock is edited on the shards and the totals here are derived.'),
+        ),
+        migrations.CreateModel(
+            name='InventoryShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('stock_quantity', models.IntegerField(default=0)),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='products.inventory')),
+            ],
+            options={
+                'ordering': ['inventory', 'index'],
+                'constraints': [models.UniqueConstraint(fields=('inventory', 'index'), name='unique_inventory_shard')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'user'), name='unique_product_user_reservation')],
+            },
+        ),
+    ]
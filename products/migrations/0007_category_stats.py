@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def populate_category_stats(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    CategoryStats = apps.get_model('products', 'CategoryStats')
+    Product = apps.get_model('products', 'Product')
+    totals = {
+        row['category_id']: row
+        for row in Product.objects.filter(is_active=True, category__isnull=False)
+        .values('category_id')
+        .annotate(product_count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+        .order_by()
+    }
+    CategoryStats.objects.bulk_create([
+        CategoryStats(
+            category_id=category_id,
+            product_count=totals[category_id]['product_count'] if category_id in totals else 0,
+            min_price=totals[category_id]['min_price'] if category_id in totals else None,
+            max_price=totals[category_id]['max_price'] if category_id in totals else None,
+        )
+        for category_id in Category.objects.values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='products.category')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Category stats',
+            },
+        ),
+        migrations.RunPython(populate_category_stats, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,7 @@
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import default_storage
 from django.db import models
 
 
@@ -15,6 +19,33 @@ class Category(models.Model):
         return self.name
 
 
+class CategoryStats(models.Model):
+    """
+    Facet counts of a category's active products, maintained incrementally
+    by ``products.category_stats`` and repaired by ``rebuild_category_stats``.
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    product_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Category stats"
+
+    def __str__(self):
+        return f"{self.category}: {self.product_count} products"
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_featured_image(self):
+        # one extra query for the whole page instead of one per product
+        return self.prefetch_related(
+            models.Prefetch('images', queryset=ProductImage.objects.filter(is_featured=True),
+                            to_attr='featured_images')
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255, unique=True)
     slug = models.SlugField(unique=True, help_text="A URL-friendly unique identifier for the product.")
@@ -25,14 +56,29 @@ class Product(models.Model):
                                  related_name='products')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # name (weight A) + description (weight B), kept in sync by products.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # keyset pagination of the catalog API
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.name
-    
+
     def get_featured_image(self):
+        # prefetched by ProductQuerySet.with_featured_image()
+        if hasattr(self, 'featured_images'):
+            return self.featured_images[0] if self.featured_images else None
+        # all images prefetched (e.g. the detail page), pick it from memory
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            return next((image for image in self.images.all() if image.is_featured), None)
         return self.images.filter(is_featured=True).first()
 
 
@@ -42,6 +88,8 @@ class ProductImage(models.Model):
     is_featured = models.BooleanField(default=False)
     alt_text = models.CharField(max_length=255, blank=True, help_text="Descriptive text for accessibility.")
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # resized JPEG/WebP copies, see products.images
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['-is_featured', 'uploaded_at']
@@ -49,10 +97,48 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"Image for {self.product.name} (Alt: {self.alt_text[:50]}...)"
 
+    def _variants(self):
+        # derivatives of a replaced file are stale until regenerated
+        if not self.derivatives or self.derivatives.get('source') != self.image.name:
+            return []
+        return sorted((int(width), names) for width, names in self.derivatives['widths'].items())
+
+    def get_variant_urls(self, file_format='jpeg'):
+        """``{width: url}`` of the resized copies in ``file_format`` (``'jpeg'`` or ``'webp'``)."""
+        return {width: default_storage.url(names[file_format]) for width, names in self._variants()}
+
+    def get_srcset_candidates(self, file_format='jpeg'):
+        """``[(url, width)]`` for a ``srcset``, empty until the resized copies exist."""
+        candidates = [(url, width) for width, url in self.get_variant_urls(file_format).items()]
+        if candidates and file_format == 'jpeg':
+            # let large screens still pick the original
+            candidates.append((self.image.url, self.derivatives['width']))
+        return candidates
+
+    @property
+    def srcset(self):
+        return ', '.join(f"{url} {width}w" for url, width in self.get_srcset_candidates('jpeg'))
+
+    @property
+    def webp_srcset(self):
+        return ', '.join(f"{url} {width}w" for url, width in self.get_srcset_candidates('webp'))
+
+    @property
+    def thumbnail_url(self):
+        """The smallest resized copy, or the original until the copies exist."""
+        variants = self._variants()
+        return default_storage.url(variants[0][1]['jpeg']) if variants else self.image.url
+
 
 class Inventory(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name="inventory")
     stock_quantity = models.IntegerField(default=0)
+    reserved_quantity = models.IntegerField(default=0, help_text="Units held by checkouts in progress.")
+    shard_count = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Split the stock of a hot product across this many counter rows. "
+                  "When above 1, the stock is edited on the shards and the totals here are derived."
+    )
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -60,3 +146,43 @@ class Inventory(models.Model):
 
     def __str__(self):
         return f"Inventory for {self.product.name}: {self.stock_quantity} in stock"
+
+    @property
+    def is_sharded(self):
+        return self.shard_count > 1
+
+    @property
+    def available_quantity(self):
+        return self.stock_quantity - self.reserved_quantity
+
+
+class InventoryShard(models.Model):
+    # available (unreserved) units of a sharded product, see products.inventory
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name="shards")
+    index = models.PositiveSmallIntegerField()
+    stock_quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['inventory', 'index'], name='unique_inventory_shard')
+        ]
+        ordering = ['inventory', 'index']
+
+    def __str__(self):
+        return f"Shard {self.index} of {self.inventory}: {self.stock_quantity}"
+
+
+class StockReservation(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name="stock_reservations")
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'user'], name='unique_product_user_reservation')
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held for user {self.user_id} until {self.expires_at}"
@@ -0,0 +1,168 @@
+"""
+Full-text product search with pluggable backends.
+
+``PostgresSearchBackend`` (production) queries ``Product.search_vector``, a
+``tsvector`` of the name (weight A) and description (weight B) behind a GIN
+index. The column is refreshed by ``update_search_vectors()`` whenever a
+product is saved (see ``products.signals``) or bulk-imported.
+
+``InMemorySearchBackend`` (tests, SQLite dev) keeps an inverted index of the
+active products in process memory and rebuilds it when the catalog version
+changes (see ``products.cache``).
+
+``settings.SEARCH_BACKEND`` picks the backend; when it is empty the Postgres
+backend is used on PostgreSQL and the in-memory one everywhere else.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .cache import get_catalog_version
+from .models import Product
+
+SEARCH_CONFIG = 'english'
+
+
+def update_search_vectors(product_ids=None):
+    """Refresh ``search_vector`` of the given products (all of them when None). No-op off PostgreSQL."""
+    if connection.vendor != 'postgresql':
+        return
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    products.update(
+        search_vector=SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+class PostgresSearchBackend:
+    def search(self, query, category=None, min_price=None, max_price=None, limit=20):
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        products = Product.objects.filter(is_active=True, search_vector=search_query)
+        if category:
+            products = products.filter(category__slug=category)
+        if min_price is not None:
+            products = products.filter(price__gte=min_price)
+        if max_price is not None:
+            products = products.filter(price__lte=max_price)
+        products = products.annotate(rank=SearchRank(F('search_vector'), search_query))
+        products = products.select_related('inventory').with_featured_image()
+        return list(products.order_by('-rank', '-created_at', '-id')[:limit])
+
+
+_TOKEN_RE = re.compile(r'\w\w+')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    NAME_WEIGHT = 1.0
+    DESCRIPTION_WEIGHT = 0.4
+
+    def __init__(self, documents):
+        """``documents`` yields ``(id, name, description, price, category_slug)``."""
+        self.postings = defaultdict(dict)
+        self.meta = {}
+        for product_id, name, description, price, category in documents:
+            self.meta[product_id] = (price, category)
+            for weight, text in ((self.NAME_WEIGHT, name), (self.DESCRIPTION_WEIGHT, description)):
+                for token in tokenize(text):
+                    scores = self.postings[token]
+                    scores[product_id] = scores.get(product_id, 0.0) + weight
+        self.postings = dict(self.postings)
+
+    def search(self, query, category=None, min_price=None, max_price=None, limit=20):
+        """Return up to ``limit`` product ids matching every query term, best first."""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        postings = [self.postings.get(token) for token in tokens]
+        if not all(postings):
+            return []
+        # walk the rarest term, look the others up
+        postings.sort(key=len)
+        document_count = len(self.meta)
+        idf = [math.log(1 + document_count / len(scores)) for scores in postings]
+
+        def matches():
+            for product_id, score in postings[0].items():
+                price, product_category = self.meta[product_id]
+                if category and product_category != category:
+                    continue
+                if min_price is not None and price < min_price:
+                    continue
+                if max_price is not None and price > max_price:
+                    continue
+                total = score * idf[0]
+                for weight, scores in zip(idf[1:], postings[1:]):
+                    term_score = scores.get(product_id)
+                    if term_score is None:
+                        break
+                    total += term_score * weight
+                else:
+                    # newer products (higher ids) win ties, like the Postgres ordering
+                    yield total, product_id
+
+        return [product_id for score, product_id in heapq.nlargest(limit, matches())]
+
+
+class InMemorySearchBackend:
+    def __init__(self):
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _documents(self):
+        return (
+            Product.objects.filter(is_active=True)
+            .values_list('id', 'name', 'description', 'price', 'category__slug')
+            .iterator(chunk_size=5000)
+        )
+
+    def get_index(self):
+        version = get_catalog_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._index = InvertedIndex(self._documents())
+                    self._version = version
+        return self._index
+
+    def search(self, query, category=None, min_price=None, max_price=None, limit=20):
+        product_ids = self.get_index().search(query, category, min_price, max_price, limit)
+        products = Product.objects.select_related('inventory').with_featured_image().in_bulk(product_ids)
+        return [products[product_id] for product_id in product_ids if product_id in products]
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        path = settings.SEARCH_BACKEND
+        if not path:
+            path = ('products.search.PostgresSearchBackend' if connection.vendor == 'postgresql'
+                    else 'products.search.InMemorySearchBackend')
+        _backend = import_string(path)()
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_search_backend(setting, **kwargs):
+    global _backend
+    if setting == 'SEARCH_BACKEND':
+        _backend = None
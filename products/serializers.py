@@ -1,11 +1,56 @@
 from rest_framework import serializers
 
-from .models import Product
+from .models import Category, Product, ProductImage
+
+
+class ProductImageSerializer(serializers.ModelSerializer):
+    url = serializers.ImageField(source='image', read_only=True)
+    # {width: url} of the resized copies, empty until they are generated
+    variants = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    webp_srcset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductImage
+        fields = ['url', 'alt_text', 'variants', 'srcset', 'webp_srcset']
+
+    def _absolute(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_variants(self, image):
+        webp = image.get_variant_urls('webp')
+        return {
+            width: {'jpeg': self._absolute(url), 'webp': self._absolute(webp[width])}
+            for width, url in image.get_variant_urls('jpeg').items()
+        }
+
+    def _srcset(self, image, file_format):
+        return ', '.join(f"{self._absolute(url)} {width}w" for url, width in image.get_srcset_candidates(file_format))
+
+    def get_srcset(self, image):
+        return self._srcset(image, 'jpeg')
+
+    def get_webp_srcset(self, image):
+        return self._srcset(image, 'webp')
 
 
 class ProductSerializer(serializers.ModelSerializer):
     stock_quantity = serializers.IntegerField(source='inventory.stock_quantity', read_only=True)
+    # prefetched by ProductQuerySet.with_featured_image()
+    featured_image = ProductImageSerializer(source='get_featured_image', read_only=True)
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'slug', 'description', 'price', 'stock_quantity']
+        fields = ['id', 'name', 'slug', 'description', 'price', 'stock_quantity', 'featured_image']
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    # maintained by products.category_stats
+    product_count = serializers.IntegerField(source='stats.product_count', read_only=True)
+    min_price = serializers.DecimalField(source='stats.min_price', max_digits=10, decimal_places=2, read_only=True)
+    max_price = serializers.DecimalField(source='stats.max_price', max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'description', 'product_count', 'min_price', 'max_price']
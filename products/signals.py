@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .category_stats import facet_state, record_product_change
+from .images import delete_derivatives, needs_derivatives
+from .models import Category, CategoryStats, Inventory, Product, ProductImage
+from .search import update_search_vectors
+from .tasks import generate_image_derivatives_task
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def invalidate_catalog_cache(sender, **kwargs):
+    # bump after commit, otherwise a concurrent request could rebuild the new
+    # version from the old rows
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Product)
+def refresh_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'description'} & set(update_fields):
+        return
+    update_search_vectors([instance.pk])
+
+
+FACET_FIELDS = {'category', 'category_id', 'is_active', 'price'}
+
+
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.objects.get_or_create(category=instance)
+
+
+@receiver(pre_save, sender=Product)
+def remember_facet_state(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not FACET_FIELDS & set(update_fields):
+        return
+    before = None
+    if not instance._state.adding:
+        # the stored row, not whatever was loaded into this instance
+        row = Product.objects.filter(pk=instance.pk).values_list('category_id', 'is_active', 'price').first()
+        before = facet_state(*row) if row else None
+    instance._facet_state_before = before
+
+
+@receiver(post_save, sender=Product)
+def update_category_stats(sender, instance, **kwargs):
+    if not hasattr(instance, '_facet_state_before'):
+        return
+    before = instance.__dict__.pop('_facet_state_before')
+    record_product_change(before, facet_state(instance.category_id, instance.is_active, instance.price))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_category_stats(sender, instance, **kwargs):
+    record_product_change(facet_state(instance.category_id, instance.is_active, instance.price), None)
+
+
+@receiver(post_save, sender=ProductImage)
+def queue_image_derivatives(sender, instance, **kwargs):
+    if needs_derivatives(instance):
+        transaction.on_commit(lambda: generate_image_derivatives_task.delay(instance.pk))
+
+
+@receiver(post_delete, sender=ProductImage)
+def remove_image_derivatives(sender, instance, **kwargs):
+    transaction.on_commit(lambda: delete_derivatives(instance.derivatives))
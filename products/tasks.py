@@ -0,0 +1,19 @@
+from celery import shared_task
+
+from .images import generate_derivatives
+from .inventory import release_expired_reservations, sync_sharded_inventory
+
+
+@shared_task(name='products.release_expired_reservations')
+def release_expired_reservations_task():
+    return release_expired_reservations()
+
+
+@shared_task(name='products.sync_sharded_inventory')
+def sync_sharded_inventory_task():
+    return sync_sharded_inventory()
+
+
+@shared_task(name='products.generate_image_derivatives')
+def generate_image_derivatives_task(image_id):
+    return generate_derivatives(image_id)
@@ -0,0 +1,92 @@
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from products.catalog_import import CatalogImporter, ImportRowError, clean_row
+from products.models import Inventory, Product
+
+
+def _rows(*records):
+    return [clean_row(row_number, record) for row_number, record in enumerate(records, start=1)]
+
+
+def test_rows_are_upserted_by_slug(make_product):
+    make_product(name='Mug', slug='mug', price='5.00', stock=3)
+
+    written, rejected = CatalogImporter().import_batch(_rows(
+        {'name': 'Mug', 'slug': 'mug', 'price': '6.50', 'stock_quantity': '7'},
+        {'name': 'Teapot', 'price': '20', 'category': 'Kitchen'},
+    ))
+
+    assert (written, rejected) == (2, [])
+    mug = Product.objects.get(slug='mug')
+    assert mug.price == Decimal('6.50')
+    assert Inventory.objects.get(product=mug).stock_quantity == 7
+    assert Product.objects.get(slug='teapot').category.name == 'Kitchen'
+
+
+def test_rows_with_a_taken_name_are_rejected(make_product):
+    make_product(name='Mug', slug='mug')
+
+    written, rejected = CatalogImporter().import_batch(_rows(
+        {'name': 'Mug', 'slug': 'coffee-mug', 'price': '5'},
+        {'name': 'Cup', 'slug': 'cup', 'price': '3'},
+        {'name': 'Cup', 'slug': 'tea-cup', 'price': '4'},
+        {'name': 'Plate', 'price': '8'},
+    ))
+
+    assert written == 2
+    assert [(error.row_number, str(error)) for error in rejected] == [
+        (1, "row 1: name 'Mug' is taken by 'mug'"),
+        (3, "row 3: name 'Cup' is taken by 'cup'"),
+    ]
+    assert sorted(Product.objects.values_list('slug', flat=True)) == ['cup', 'mug', 'plate']
+
+
+def test_the_command_skips_rejected_rows(make_product, tmp_path, capsys):
+    make_product(name='Mug', slug='mug')
+    source = tmp_path / 'catalog.csv'
+    source.write_text('name,slug,price\nMug,coffee-mug,5\nPlate,plate,8\n')
+
+    call_command('import_catalog', str(source))
+
+    out, err = capsys.readouterr()
+    assert "Skipped row 1: name 'Mug' is taken by 'mug'" in err
+    assert 'Imported 1 products from 2 rows' in out
+    assert Product.objects.filter(slug='plate').exists()
+    assert not (tmp_path / 'catalog.csv.checkpoint').exists()
+
+
+def test_long_names_with_the_same_beginning_get_different_slugs(db):
+    beginning = 'Extra large hand thrown stoneware coffee mug with a '
+    rows = _rows({'name': beginning + 'blue glaze', 'price': '5'}, {'name': beginning + 'red glaze', 'price': '6'})
+
+    assert CatalogImporter().import_batch(rows) == (2, [])
+
+    slugs = [row['slug'] for row in rows]
+    assert len(set(slugs)) == 2
+    assert all(len(slug) <= 50 for slug in slugs)
+    assert Product.objects.get(slug=slugs[0]).name == beginning + 'blue glaze'
+    # the same name gets the same slug on the next import
+    assert _rows({'name': beginning + 'blue glaze', 'price': '5'})[0]['slug'] == slugs[0]
+
+
+@pytest.mark.parametrize('record', [[1, 2], 'mug', None])
+def test_a_record_that_isnt_an_object_is_rejected(record):
+    with pytest.raises(ImportRowError, match='row 3: expected an object'):
+        clean_row(3, record)
+
+
+def test_the_command_stops_at_a_record_that_isnt_an_object(db, tmp_path):
+    source = tmp_path / 'catalog.ndjson'
+    source.write_text('{"name": "Mug", "price": "5"}\n[1, 2]\n')
+
+    with pytest.raises(CommandError, match='row 2: expected an object, got list'):
+        call_command('import_catalog', str(source), stdout=StringIO())
+
+    # the row before it is kept, and a rerun resumes at the bad one
+    assert Product.objects.filter(slug='mug').exists()
+    assert (tmp_path / 'catalog.ndjson.checkpoint').exists()
@@ -0,0 +1,111 @@
+"""The incrementally kept CategoryStats agree with a rebuild from the products table."""
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from products.models import Category, CategoryStats
+
+
+def _stats():
+    return {stats.category_id: (stats.product_count, stats.min_price, stats.max_price)
+            for stats in CategoryStats.objects.all()}
+
+
+def _assert_matches_rebuild():
+    kept = _stats()
+    call_command('rebuild_category_stats', stdout=StringIO())
+    assert kept == _stats()
+    return kept
+
+
+@pytest.fixture
+def categories(db):
+    return Category.objects.create(name='Kitchen', slug='kitchen'), Category.objects.create(name='Garden', slug='garden')
+
+
+def test_create(make_product, categories):
+    kitchen, garden = categories
+    make_product(price='5.00', category=kitchen)
+    make_product(price='9.00', category=kitchen)
+    make_product(price='3.00', category=kitchen, is_active=False)
+    make_product(price='1.00')
+
+    stats = _assert_matches_rebuild()
+    assert stats[kitchen.pk] == (2, Decimal('5.00'), Decimal('9.00'))
+    assert stats[garden.pk] == (0, None, None)
+
+
+def test_recategorize(make_product, categories):
+    kitchen, garden = categories
+    cheapest = make_product(price='2.00', category=kitchen)
+    make_product(price='7.00', category=kitchen)
+
+    cheapest.category = garden
+    cheapest.save()
+
+    stats = _assert_matches_rebuild()
+    assert stats[kitchen.pk] == (1, Decimal('7.00'), Decimal('7.00'))
+    assert stats[garden.pk] == (1, Decimal('2.00'), Decimal('2.00'))
+
+
+def test_deactivate_and_reactivate(make_product, categories):
+    kitchen, _garden = categories
+    make_product(price='4.00', category=kitchen)
+    priciest = make_product(price='8.00', category=kitchen)
+
+    priciest.is_active = False
+    priciest.save(update_fields=['is_active'])
+    assert _assert_matches_rebuild()[kitchen.pk] == (1, Decimal('4.00'), Decimal('4.00'))
+
+    priciest.is_active = True
+    priciest.save()
+    assert _assert_matches_rebuild()[kitchen.pk] == (2, Decimal('4.00'), Decimal('8.00'))
+
+
+def test_price_change(make_product, categories):
+    kitchen, _garden = categories
+    product = make_product(price='4.00', category=kitchen)
+    make_product(price='6.00', category=kitchen)
+
+    product.price = Decimal('5.00')
+    product.save()
+    assert _assert_matches_rebuild()[kitchen.pk] == (2, Decimal('5.00'), Decimal('6.00'))
+
+    # a save of unrelated fields leaves the stats alone
+    product.description = 'Now with a lid'
+    product.save(update_fields=['description'])
+    _assert_matches_rebuild()
+
+
+def test_delete(make_product, categories):
+    kitchen, _garden = categories
+    make_product(price='4.00', category=kitchen)
+    priciest = make_product(price='8.00', category=kitchen)
+
+    priciest.delete()
+
+    assert _assert_matches_rebuild()[kitchen.pk] == (1, Decimal('4.00'), Decimal('4.00'))
+
+
+def test_a_stale_instance_moves_the_stored_row(make_product, categories):
+    kitchen, garden = categories
+    product = make_product(price='4.00', category=kitchen)
+    stale = type(product).objects.get(pk=product.pk)
+    product.category = garden
+    product.save()
+
+    # the stats follow the row, not what the stale copy was loaded with
+    stale.price = Decimal('5.00')
+    stale.save()
+
+    _assert_matches_rebuild()
+
+
+def test_a_product_slug_doesnt_shadow_the_category_pages(client, make_product, categories):
+    product = make_product(name='Categories', slug='categories')
+
+    assert client.get('/products/categories/').context['product'] == product
+    assert client.get('/categories/').status_code == 200
+    assert client.get('/categories/kitchen/').context['category'] == categories[0]
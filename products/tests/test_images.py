@@ -0,0 +1,71 @@
+from io import BytesIO, StringIO
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+
+from products.models import ProductImage
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.PRODUCT_IMAGE_WIDTHS = [200, 400, 800]
+    return tmp_path
+
+
+def _png(width, height):
+    buffer = BytesIO()
+    Image.new('RGBA', (width, height), (200, 40, 40, 255)).save(buffer, format='PNG')
+    return SimpleUploadedFile('mug.png', buffer.getvalue(), content_type='image/png')
+
+
+def _stored_files(media):
+    return sorted(str(path.relative_to(media)) for path in media.rglob('*') if path.is_file())
+
+
+def _assert_derivatives(image, widths, height_ratio):
+    image.refresh_from_db()
+    assert image.derivatives['source'] == image.image.name
+    assert image.derivatives['width'] == 500
+    assert sorted(map(int, image.derivatives['widths'])) == widths
+    for width, names in image.derivatives['widths'].items():
+        for file_format, name in names.items():
+            with default_storage.open(name) as stored, Image.open(stored) as derivative:
+                assert derivative.format == file_format.upper()
+                assert derivative.size == (int(width), round(int(width) * height_ratio))
+
+
+def test_an_upload_gets_derivatives(make_product, celery_eager, django_capture_on_commit_callbacks):
+    product = make_product()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        image = ProductImage.objects.create(product=product, image=_png(500, 250), is_featured=True)
+
+    # only the widths narrower than the original
+    _assert_derivatives(image, [200, 400], 0.5)
+    assert [width for _url, width in image.get_srcset_candidates('webp')] == [200, 400]
+
+
+def test_the_command_is_idempotent_and_skips_products_without_an_image(make_product, media):
+    image = ProductImage.objects.create(product=make_product(), image=_png(500, 300))
+    ProductImage.objects.create(product=make_product(), image='')
+    out = StringIO()
+
+    call_command('regenerate_image_derivatives', workers=1, stdout=out)
+    assert 'Regenerated 1 image(s)' in out.getvalue()
+    _assert_derivatives(image, [200, 400], 0.6)
+    files = _stored_files(media)
+    # the original and two formats of two widths
+    assert len(files) == 5
+
+    call_command('regenerate_image_derivatives', workers=1, stdout=out)
+    _assert_derivatives(image, [200, 400], 0.6)
+    # the copies were replaced, not added to
+    assert len(_stored_files(media)) == 5
+
+    out = StringIO()
+    call_command('regenerate_image_derivatives', '--missing', workers=1, stdout=out)
+    assert 'Regenerated 0 image(s)' in out.getvalue()
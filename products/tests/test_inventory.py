@@ -0,0 +1,118 @@
+"""Held, sold and released units add up, on plain and on sharded products."""
+from datetime import timedelta
+
+import pytest
+from django.db.models import Sum
+from django.utils import timezone
+
+from products import inventory
+from products.inventory import (InsufficientStockError, commit_stock, configure_shards, release_expired_reservations,
+                                release_reservations, reserve_stock, sync_sharded_inventory)
+from products.models import Inventory, InventoryShard, StockReservation
+
+
+@pytest.fixture(params=[1, 4], ids=['unsharded', 'sharded'])
+def product(request, make_product):
+    product = make_product(stock=10)
+    configure_shards(product.pk, request.param)
+    return product
+
+
+def _stock(product):
+    """``(on hand, reserved, held)`` of a product, with the derived totals of a sharded one refreshed."""
+    sync_sharded_inventory()
+    inventory = Inventory.objects.get(product=product)
+    held = StockReservation.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+    if inventory.is_sharded:
+        available = InventoryShard.objects.filter(inventory=inventory).aggregate(
+            total=Sum('stock_quantity'))['total']
+        assert available == inventory.available_quantity
+    return inventory.stock_quantity, inventory.reserved_quantity, held
+
+
+def test_configure_shards_keeps_the_stock(make_product):
+    product = make_product(stock=10)
+    configure_shards(product.pk, 4)
+
+    assert sorted(InventoryShard.objects.values_list('stock_quantity', flat=True)) == [2, 2, 3, 3]
+
+    configure_shards(product.pk, 1)
+
+    assert not InventoryShard.objects.exists()
+    assert _stock(product) == (10, 0, 0)
+
+
+def test_reserve_and_release(product, user):
+    reserve_stock(user, {product.pk: 3})
+    assert _stock(product) == (10, 3, 3)
+
+    assert release_reservations(user) == 1
+    assert _stock(product) == (10, 0, 0)
+
+
+def test_reserving_again_replaces_the_hold(product, user):
+    reserve_stock(user, {product.pk: 3})
+    reserve_stock(user, {product.pk: 5})
+
+    assert _stock(product) == (10, 5, 5)
+
+
+def test_commit_consumes_the_hold(product, user):
+    reserve_stock(user, {product.pk: 4})
+    commit_stock(user, {product.pk: 4})
+
+    assert _stock(product) == (6, 0, 0)
+
+
+@pytest.mark.parametrize('held, ordered', [(0, 3), (2, 3), (5, 3)])
+def test_commit_more_or_less_than_held(product, user, held, ordered):
+    if held:
+        reserve_stock(user, {product.pk: held})
+    commit_stock(user, {product.pk: ordered})
+
+    assert _stock(product) == (10 - ordered, 0, 0)
+
+
+def test_other_users_holds_count_against_the_stock(product, user, django_user_model):
+    other = django_user_model.objects.create_user('bob', 'bob@example.com', 'pass-word-1')
+    reserve_stock(other, {product.pk: 8})
+
+    with pytest.raises(InsufficientStockError):
+        reserve_stock(user, {product.pk: 3})
+    with pytest.raises(InsufficientStockError):
+        commit_stock(user, {product.pk: 3})
+    assert _stock(product) == (10, 8, 8)
+
+    commit_stock(user, {product.pk: 2})
+    assert _stock(product) == (8, 8, 8)
+
+
+def test_expired_holds_are_released(product, user):
+    reserve_stock(user, {product.pk: 3}, ttl=60)
+
+    assert release_expired_reservations() == 0
+    assert release_expired_reservations(now=timezone.now() + timedelta(minutes=2)) == 1
+    assert _stock(product) == (10, 0, 0)
+
+
+
+def test_shards_are_visited_in_product_order(make_product, user, monkeypatch):
+    products = [make_product(stock=10) for _ in range(4)]
+    for product in products:
+        configure_shards(product.pk, 4)
+    visited = []
+    take_from_shards = inventory._take_from_shards
+
+    def spy(product_id, quantity, shard_count):
+        visited.append(product_id)
+        return take_from_shards(product_id, quantity, shard_count)
+
+    monkeypatch.setattr(inventory, '_take_from_shards', spy)
+
+    # more than any one shard holds: every product takes the slow path,
+    # which locks all its shards
+    reserve_stock(user, {product.pk: 5 for product in reversed(products)})
+    commit_stock(user, {product.pk: 6 for product in reversed(products)})
+
+    ids = [product.pk for product in products]
+    assert visited == ids + ids
@@ -0,0 +1,31 @@
+"""The catalog reads take a fixed number of queries, however many products a page shows."""
+import pytest
+from rest_framework.test import APIClient
+
+from config.pagination import CreatedAtCursorPagination
+
+
+@pytest.fixture
+def catalog(make_product):
+    return [make_product(featured_image=True) for _ in range(60)]
+
+
+@pytest.mark.parametrize('page_size', [1, 50])
+def test_product_list_page(client, settings, catalog, page_size, django_assert_num_queries):
+    settings.CATALOG_PAGE_SIZE = page_size
+    # the products, then the featured images of the page
+    with django_assert_num_queries(2):
+        response = client.get('/products/')
+    assert response.status_code == 200
+    assert len(response.context['products']) == page_size
+
+
+@pytest.mark.parametrize('page_size', [1, 50])
+def test_product_list_api(user, catalog, page_size, django_assert_num_queries):
+    client = APIClient()
+    client.force_authenticate(user)
+    # the products with their inventory, then the featured images of the page
+    with django_assert_num_queries(2):
+        response = client.get('/api/', {CreatedAtCursorPagination.page_size_query_param: page_size})
+    assert response.status_code == 200
+    assert len(response.data['results']) == page_size
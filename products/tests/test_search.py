@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+
+from products.cache import bump_catalog_version
+from products.models import Category
+from products.search import InMemorySearchBackend, InvertedIndex, PostgresSearchBackend, tokenize
+
+
+def test_tokenize():
+    # lowercased words of two characters or more
+    assert tokenize('Blue MUG, 350ml - a gift!') == ['blue', 'mug', '350ml', 'gift']
+
+
+@pytest.fixture
+def index():
+    return InvertedIndex([
+        (1, 'Blue mug', 'A large ceramic mug', Decimal('8.00'), 'kitchen'),
+        (2, 'Red mug', 'Ceramic', Decimal('12.00'), 'kitchen'),
+        (3, 'Blue teapot', 'Goes with the blue mug', Decimal('30.00'), 'kitchen'),
+        (4, 'Blue shirt', 'Cotton', Decimal('20.00'), 'clothing'),
+    ])
+
+
+def test_every_term_must_match(index):
+    assert sorted(index.search('mug')) == [1, 2, 3]
+    assert sorted(index.search('blue mug')) == [1, 3]
+    assert index.search('blue kettle') == []
+    assert index.search('a') == []
+
+
+def test_name_matches_rank_first(index):
+    # 1 has both terms in its name, 3 only one; 4 is the newest of the "blue" names
+    assert index.search('blue mug') == [1, 3]
+    assert index.search('blue') == [3, 4, 1]
+    assert index.search('blue', limit=1) == [3]
+
+
+def test_filters(index):
+    assert sorted(index.search('blue', category='kitchen')) == [1, 3]
+    assert sorted(index.search('mug', min_price=Decimal('10'))) == [2, 3]
+    assert index.search('mug', max_price=Decimal('10')) == [1]
+
+
+@pytest.fixture
+def kitchen(db):
+    return Category.objects.create(name='Kitchen', slug='kitchen')
+
+
+def test_the_index_follows_catalog_changes(make_product, kitchen):
+    backend = InMemorySearchBackend()
+    mug = make_product(name='Blue mug', category=kitchen)
+    teapot = make_product(name='Blue teapot', category=kitchen)
+    assert backend.search('blue') == [teapot, mug]
+
+    teapot.name = 'Green teapot'
+    teapot.save()
+    mug.is_active = False
+    mug.save()
+    # what the signals do once the transaction commits
+    bump_catalog_version()
+
+    assert backend.search('blue') == []
+    assert backend.search('green teapot') == [teapot]
+
+
+def test_search_api(api_client, make_product, kitchen, django_assert_num_queries):
+    for i in range(30):
+        make_product(name=f'Mug {i}', category=kitchen, featured_image=True)
+    make_product(name='Teapot', category=kitchen)
+    api_client.get('/api/')  # loads the user into the authentication cache
+
+    # the index, the products and their featured images
+    with django_assert_num_queries(3):
+        response = api_client.get('/api/products/search/', {'q': 'mug', 'limit': 25})
+    assert response.status_code == 200
+    assert len(response.data['results']) == 25
+    assert all(result['name'].startswith('Mug ') for result in response.data['results'])
+
+    # served from the catalog cache
+    with django_assert_num_queries(0):
+        api_client.get('/api/products/search/', {'q': 'mug', 'limit': 25})
+
+
+def test_search_api_needs_a_query(api_client):
+    assert api_client.get('/api/products/search/').status_code == 400
+    assert api_client.get('/api/products/search/', {'q': 'mug', 'limit': 'x'}).status_code == 400
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='needs PostgreSQL')
+def test_postgres_backend(make_product, kitchen):
+    mug = make_product(name='Blue mug', description='Ceramic', category=kitchen)
+    teapot = make_product(name='Teapot', description='Goes with the blue mug', category=kitchen)
+    make_product(name='Blue shirt')
+
+    assert PostgresSearchBackend().search('blue mug') == [mug, teapot]
+    assert PostgresSearchBackend().search('mugs', category='kitchen') == [mug, teapot]
@@ -1,9 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'products'
 
 urlpatterns = [
-    path('', views.product_list, name='product_list'),
-    path('<slug:slug>/', views.product_detail, name='product_detail'),
+    path('', views.product_list_async if settings.ASYNC_VIEWS else views.product_list, name='product_list'),
+    path('<slug:slug>/', views.product_detail_async if settings.ASYNC_VIEWS else views.product_detail, name='product_detail'),
 ]
@@ -1,24 +1,232 @@
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404
-from rest_framework import generics
+from django.utils.decorators import method_decorator
+from decimal import Decimal, InvalidOperation
 
-from .serializers import ProductSerializer
+from rest_framework import generics, status
+from rest_framework.response import Response
+
+from config.async_api import apaginate, async_api_view
+from config.conditional import apage_etag, conditional_get, make_etag, page_etag
+from config.pagination import CreatedAtCursorPagination
+from config.query_analysis import query_budget
+
+from .cache import aget_entry_etag, aget_or_build, get_entry_etag, get_or_build
+from .search import get_search_backend
+from .serializers import CategorySerializer, ProductSerializer
 from .models import Product, Category
 
 
-def product_list(request):
-    active_products = Product.objects.filter(is_active=True)
-    context = {
-        'products': active_products
+def _page_number(request):
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404('Invalid page.')
+    if page < 1:
+        raise Http404('Invalid page.')
+    return page
+
+
+def _page_slice(page):
+    # one row past the page tells whether there is a next one, without a COUNT
+    size = settings.CATALOG_PAGE_SIZE
+    return slice((page - 1) * size, page * size + 1)
+
+
+def _page_context(products, page):
+    size = settings.CATALOG_PAGE_SIZE
+    if not products and page > 1:
+        raise Http404('No such page.')
+    return {
+        'products': products[:size],
+        'page_number': page,
+        'has_previous': page > 1,
+        'has_next': len(products) > size,
     }
-    return render(request, 'products/product_list.html', context)
 
+
+# each page of the catalog is cached on its own, so a catalog change only
+# costs the pages that are requested again, however large the catalog
+@query_budget(5)
+@conditional_get(lambda request: page_etag(request, get_entry_etag('product_list', _page_number(request))))
+def product_list(request):
+    page = _page_number(request)
+    products = get_or_build(
+        'product_list',
+        lambda: list(Product.objects.filter(is_active=True).with_featured_image()[_page_slice(page)]),
+        page
+    )
+    return render(request, 'products/product_list.html', _page_context(products, page))
+
+@query_budget(5)
+@conditional_get(lambda request, slug: page_etag(request, get_entry_etag('product_detail', slug)))
 def product_detail(request, slug):
-    product = get_object_or_404(Product.objects.filter(is_active=True), slug=slug)
+    product = get_or_build(
+        'product_detail',
+        lambda: get_object_or_404(Product.objects.filter(is_active=True).prefetch_related('images'), slug=slug),
+        slug
+    )
     context = {
         'product': product
     }
     return render(request, 'products/product_detail.html', context)
 
+# async versions of the hot pages, routed when settings.ASYNC_VIEWS is on
+# (ASGI deployments); same cache entries and templates as the sync ones
+
+async def _aproduct_list_etag(request):
+    return await apage_etag(request, await aget_entry_etag('product_list', _page_number(request)))
+
+@query_budget(5)
+@conditional_get(_aproduct_list_etag)
+async def product_list_async(request):
+    page = _page_number(request)
+
+    async def build():
+        queryset = Product.objects.filter(is_active=True).with_featured_image()[_page_slice(page)]
+        return [product async for product in queryset]
+
+    products = await aget_or_build('product_list', build, page)
+    return render(request, 'products/product_list.html', _page_context(products, page))
+
+async def _aproduct_detail_etag(request, slug):
+    return await apage_etag(request, await aget_entry_etag('product_detail', slug))
+
+@query_budget(5)
+@conditional_get(_aproduct_detail_etag)
+async def product_detail_async(request, slug):
+    async def build():
+        try:
+            return await Product.objects.filter(is_active=True).prefetch_related('images').aget(slug=slug)
+        except Product.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+
+    context = {
+        'product': await aget_or_build('product_detail', build, slug)
+    }
+    return render(request, 'products/product_detail.html', context)
+
+def category_list(request):
+    categories = get_or_build(
+        'category_list',
+        lambda: list(Category.objects.filter(is_active=True).select_related('stats'))
+    )
+    return render(request, 'products/category_list.html', {'categories': categories})
+
+def category_detail(request, slug):
+    page = _page_number(request)
+    category, products = get_or_build(
+        'category_detail',
+        lambda: (
+            get_object_or_404(Category.objects.filter(is_active=True).select_related('stats'), slug=slug),
+            list(Product.objects.filter(is_active=True, category__slug=slug).with_featured_image()[_page_slice(page)])
+        ),
+        slug, page
+    )
+    context = _page_context(products, page)
+    context['category'] = category
+    return render(request, 'products/product_list.html', context)
+
+
+def _api_list_etag(request, *args, **kwargs):
+    entry_etag = get_entry_etag('product_list_api', request.build_absolute_uri())
+    return make_etag(entry_etag) if entry_etag else None
+
+
+@query_budget(4)
+@method_decorator(conditional_get(_api_list_etag), name='list')
 class ProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.all()
+    # stock_quantity comes from the inventory relation
+    queryset = Product.objects.select_related('inventory').with_featured_image()
+    serializer_class = ProductSerializer
+
+    def list(self, request, *args, **kwargs):
+        # cache the serialized page; the absolute URI covers the page number and
+        # the host used to build the next/previous links
+        data = get_or_build(
+            'product_list_api',
+            lambda: super(ProductListAPIView, self).list(request, *args, **kwargs).data,
+            request.build_absolute_uri()
+        )
+        return Response(data)
+
+
+async def _aapi_list_etag(request):
+    entry_etag = await aget_entry_etag('product_list_api', request.build_absolute_uri())
+    return make_etag(entry_etag) if entry_etag else None
+
+
+@query_budget(4)
+@async_api_view
+@conditional_get(_aapi_list_etag)
+async def product_list_api_async(request):
+    async def build():
+        queryset = Product.objects.select_related('inventory').with_featured_image()
+        return await apaginate(CreatedAtCursorPagination(), queryset, request, ProductSerializer)
+
+    return JsonResponse(await aget_or_build('product_list_api', build, request.build_absolute_uri()))
+
+
+@query_budget(4)
+class ProductSearchAPIView(generics.GenericAPIView):
+    """
+    Full-text search over active products: ``?q=`` (required), optionally
+    narrowed by ``category`` (slug), ``min_price`` and ``max_price``. Returns
+    the ``limit`` best matches (20 by default, at most 100), best first.
+    """
+    serializer_class = ProductSerializer
+    pagination_class = None
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'The q parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            min_price, max_price = (
+                Decimal(request.query_params[name]) if request.query_params.get(name) else None
+                for name in ('min_price', 'max_price')
+            )
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+        except (InvalidOperation, ValueError):
+            return Response({'error': 'min_price, max_price and limit must be numbers.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive.'}, status=status.HTTP_400_BAD_REQUEST)
+        category = request.query_params.get('category') or None
+
+        def build():
+            products = get_search_backend().search(query, category, min_price, max_price, limit)
+            return self.get_serializer(products, many=True).data
+
+        data = get_or_build('product_search', build, query.lower(), category, min_price, max_price, limit)
+        return Response({'query': query, 'results': data})
+
+
+class CategoryListAPIView(generics.ListAPIView):
+    queryset = Category.objects.filter(is_active=True).select_related('stats')
+    serializer_class = CategorySerializer
+    # a handful of rows, and no created_at to page on
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        data = get_or_build('category_list_api', lambda: super(CategoryListAPIView, self).list(request).data)
+        return Response(data)
+
+
+class CategoryProductListAPIView(generics.ListAPIView):
     serializer_class = ProductSerializer
+
+    def get_queryset(self):
+        category = get_object_or_404(Category, is_active=True, slug=self.kwargs['slug'])
+        return (Product.objects.filter(is_active=True, category=category)
+                .select_related('inventory').with_featured_image())
+
+    def list(self, request, *args, **kwargs):
+        data = get_or_build(
+            'category_product_list_api',
+            lambda: super(CategoryProductListAPIView, self).list(request, *args, **kwargs).data,
+            request.build_absolute_uri()
+        )
+        return Response(data)
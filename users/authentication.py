@@ -0,0 +1,172 @@
+"""
+JWT authentication without a user query per request.
+
+simplejwt's ``JWTAuthentication`` loads the user row on every API call.
+``CachedJWTAuthentication`` (the default, see ``AUTH_USER_CACHE`` in
+settings) resolves the token's user from
+
+1. a small in-process LRU, entries live ``AUTH_USER_LOCAL_CACHE_TIMEOUT``
+   seconds;
+2. the shared cache (Redis), entries live ``AUTH_USER_CACHE_TIMEOUT``
+   seconds;
+3. the database, filling both.
+
+Only what authentication needs is cached: the id, the username and the
+``is_active``/``is_staff``/``is_superuser`` flags, plus an MD5 of the
+password hash for simplejwt's ``CHECK_REVOKE_TOKEN`` (the same value the
+token carries). The view gets a user built from them with every other field
+deferred: reading one (``email``, ``password``, ...) loads it from the
+database, and ``save()`` leaves the fields that were never loaded alone.
+
+Saving or deleting a user (deactivation, password change, ...) drops both
+entries once the transaction commits (``users.signals``). The LRUs of other
+processes can't be reached, so they may hand out the old user for up to
+``AUTH_USER_LOCAL_CACHE_TIMEOUT`` seconds; keep it short. ``update()`` on the
+user table sends no signals and isn't seen before the entries expire.
+
+``ClaimsOnlyJWTAuthentication`` doesn't look the user up at all: the view
+gets a ``ClaimsUser`` with the id from the token, and a user deactivated
+after the token was issued keeps access until it expires. Use it only for
+read endpoints that need nothing but ``request.user.pk`` to find the
+user's own data.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import router
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# on top of the primary key, in the user model's field order
+CACHED_USER_FIELDS = ('username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def user_cache_key(user_id):
+    return f'auth:user-fields:{user_id}'
+
+
+class _LocalUserCache:
+    """Thread-safe LRU of ``user id -> (expires at, cached fields)``."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, fields):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + settings.AUTH_USER_LOCAL_CACHE_TIMEOUT, fields)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.AUTH_USER_LOCAL_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = _LocalUserCache()
+
+
+@receiver(setting_changed)
+def _clear_local_users(setting, **kwargs):
+    if setting in ('AUTH_USER_CACHE', 'AUTH_USER_LOCAL_CACHE_TIMEOUT', 'AUTH_USER_LOCAL_CACHE_SIZE', 'CACHES'):
+        local_users.clear()
+
+
+def invalidate_user(user_id):
+    user_id = str(user_id)
+    local_users.discard(user_id)
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    @cached_property
+    def cached_fields(self):
+        wanted = {self.user_model._meta.pk.attname, *CACHED_USER_FIELDS}
+        return [field.attname for field in self.user_model._meta.concrete_fields if field.attname in wanted]
+
+    def _load_user(self, user_id):
+        """Return ``(field values, password MD5)`` of the user, from the caches or the database."""
+        user_id = str(user_id)  # the claim is a string, the pk in the signals isn't
+        entry = local_users.get(user_id)
+        if entry is None:
+            entry = cache.get(user_cache_key(user_id))
+            if entry is None:
+                try:
+                    user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+                except self.user_model.DoesNotExist as e:
+                    raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+                entry = (tuple(getattr(user, name) for name in self.cached_fields),
+                         get_md5_hash_password(user.password))
+                cache.set(user_cache_key(user_id), entry, settings.AUTH_USER_CACHE_TIMEOUT)
+            local_users.set(user_id, entry)
+        return entry
+
+    def get_user(self, validated_token):
+        # the checks of JWTAuthentication.get_user, on the cached fields
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        values, password_md5 = self._load_user(user_id)
+        # a new instance per request, as if loaded with .only(); views may set attributes on it
+        user = self.user_model.from_db(router.db_for_read(self.user_model), self.cached_fields, values)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_md5:
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+
+class ClaimsUser(TokenUser):
+    """``TokenUser`` whose ``pk`` has the type of the user model's, not the claim's string."""
+
+    @cached_property
+    def id(self):
+        return get_user_model()._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+
+class ClaimsOnlyJWTAuthentication(JWTStatelessUserAuthentication):
+    """JWT authentication that trusts the token's claims, for read endpoints that only need the user id."""
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        return ClaimsUser(validated_token)
+
+
+# for @authentication_classes on such endpoints; browser sessions keep working
+CLAIMS_ONLY_AUTHENTICATION_CLASSES = (ClaimsOnlyJWTAuthentication, SessionAuthentication)
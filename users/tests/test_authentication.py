@@ -0,0 +1,95 @@
+import pickle
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import CachedJWTAuthentication, local_users, user_cache_key
+
+# served with CachedJWTAuthentication
+URL = '/api/'
+
+
+def _user_queries(client):
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(URL)
+    return response, [query['sql'] for query in captured.captured_queries if 'auth_user' in query['sql']]
+
+
+def test_the_user_is_loaded_once(api_client):
+    response, queries = _user_queries(api_client)
+    assert response.status_code == 200
+    assert len(queries) == 1
+
+    local_users.clear()  # another process: only the shared cache has it
+    response, queries = _user_queries(api_client)
+    assert response.status_code == 200
+    assert queries == []
+
+
+def test_only_the_fields_authentication_needs_are_cached(api_client, user):
+    api_client.get(URL)
+
+    entry = pickle.dumps(cache.get(user_cache_key(user.pk)))
+    assert user.username.encode() in entry
+    for secret in (user.password, user.email):
+        assert secret.encode() not in entry
+
+
+def test_the_other_fields_are_loaded_when_read(user):
+    CachedJWTAuthentication().get_user(AccessToken.for_user(user))  # fills the caches
+
+    authenticated = CachedJWTAuthentication().get_user(AccessToken.for_user(user))
+
+    assert (authenticated.pk, authenticated.username, authenticated.is_active) == (user.pk, 'alice', True)
+    assert {'password', 'email', 'last_login'} <= authenticated.get_deferred_fields()
+    assert authenticated.email == 'alice@example.com'
+
+
+def test_saving_the_user_keeps_the_other_fields(user):
+    CachedJWTAuthentication().get_user(AccessToken.for_user(user))
+    authenticated = CachedJWTAuthentication().get_user(AccessToken.for_user(user))
+
+    authenticated.first_name = 'Alice'
+    authenticated.save()
+
+    user.refresh_from_db()
+    assert user.first_name == 'Alice'
+    assert user.check_password('pass-word-1')
+
+
+def test_a_deactivated_user_is_rejected(api_client, user):
+    assert api_client.get(URL).status_code == 200
+
+    user.is_active = False
+    user.save()
+
+    response = api_client.get(URL)
+    assert response.status_code == 401
+    assert response.data['code'] == 'user_inactive'
+
+
+@pytest.fixture
+def check_revoke_token(monkeypatch):
+    # simplejwt's settings object is shared by its modules and ours, and not
+    # replaced by a SIMPLE_JWT override
+    monkeypatch.setattr(api_settings, 'CHECK_REVOKE_TOKEN', True)
+
+
+def test_a_password_change_revokes_the_token(check_revoke_token, user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    assert client.get(URL).status_code == 200
+    # served from the cached password hash digest
+    assert client.get(URL).status_code == 200
+
+    user.set_password('pass-word-2')
+    user.save()
+
+    response = client.get(URL)
+    assert response.status_code == 401
+    assert response.data['code'] == 'password_changed'
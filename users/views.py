@@ -1,13 +1,16 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 
+from config.throttling import bucket_throttle
+
 from .serializers import UserSerializer
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([bucket_throttle('register', key_by='ip')])
 def register_user(request):
     if request.method == 'POST':
         serializer = UserSerializer(data=request.data)